@@ -0,0 +1,84 @@
+from datetime import date
+
+from models import db, User, Order, AttendanceRollup
+
+# Посещаемость (выданные заказы) по дням, классам и приёмам пищи.
+# Читается из сводной таблицы AttendanceRollup, которую mark_order_received
+# обновляет при каждой выдаче, — история заказов не пересматривается.
+NO_CLASS = 'Без класса'
+
+
+def _parse_date(value):
+    if not value:
+        return None
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(value)
+
+
+def _empty():
+    return {'breakfast': 0, 'lunch': 0, 'total': 0}
+
+
+def _add(target, meal_type, count):
+    target[meal_type] = target.get(meal_type, 0) + count
+    target['total'] += count
+
+
+def _range_filter(query, start, end):
+    if start:
+        query = query.filter(AttendanceRollup.date >= start)
+    if end:
+        query = query.filter(AttendanceRollup.date <= end)
+    return query
+
+
+# Сводка за период [start, end] (границы включительно, None — без ограничения)
+def get_attendance_stats(start=None, end=None):
+    start, end = _parse_date(start), _parse_date(end)
+    by_date, by_class, by_meal = {}, {}, _empty()
+
+    rows = _range_filter(db.session.query(AttendanceRollup.date, AttendanceRollup.meal_type,
+                                          db.func.sum(AttendanceRollup.received)), start, end) \
+        .group_by(AttendanceRollup.date, AttendanceRollup.meal_type) \
+        .order_by(AttendanceRollup.date).all()
+    for day, meal_type, count in rows:
+        _add(by_date.setdefault(day.isoformat(), _empty()), meal_type, count)
+        _add(by_meal, meal_type, count)
+
+    rows = _range_filter(db.session.query(AttendanceRollup.class_name, AttendanceRollup.meal_type,
+                                          db.func.sum(AttendanceRollup.received)), start, end) \
+        .group_by(AttendanceRollup.class_name, AttendanceRollup.meal_type) \
+        .order_by(AttendanceRollup.class_name).all()
+    for class_name, meal_type, count in rows:
+        _add(by_class.setdefault(class_name or NO_CLASS, _empty()), meal_type, count)
+
+    return {
+        'from': start.isoformat() if start else None,
+        'to': end.isoformat() if end else None,
+        'by_date': by_date,
+        'by_class': by_class,
+        'by_meal': {'breakfast': by_meal['breakfast'], 'lunch': by_meal['lunch']},
+        'total': by_meal['total'],
+    }
+
+
+def get_class_attendance(day=None):
+    day = day or date.today()
+    return get_attendance_stats(day, day)['by_class']
+
+
+# Пересчёт сводной таблицы с нуля по выданным заказам
+def rebuild_attendance():
+    rows = db.session.query(Order.date, db.func.coalesce(User.class_name, ''), Order.meal_type,
+                            db.func.count(Order.id)) \
+        .join(User, User.id == Order.user_id) \
+        .filter(Order.is_received == True) \
+        .group_by(Order.date, db.func.coalesce(User.class_name, ''), Order.meal_type).all()
+    AttendanceRollup.query.delete()
+    if rows:
+        db.session.execute(db.insert(AttendanceRollup), [
+            {'date': date.fromisoformat(day) if isinstance(day, str) else day,
+             'class_name': class_name, 'meal_type': meal_type, 'received': count}
+            for day, class_name, meal_type, count in rows])
+    db.session.commit()
@@ -1,26 +1,24 @@
+import csv
+import io
 import os
 from datetime import date, datetime, timedelta
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_file, make_response
-from io import BytesIO
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_file, make_response, g, Response
 from models import db, User, MenuItem, Category, Order, OrderItem, Notification, PurchaseRequest, MenuItemIngredient, Product, Allergy, MenuItemAllergy, Subscription, Payment, Review, Favorite
 from db_functions import *
+from reports import build_report
+from analytics import get_attendance_stats, get_class_attendance
+from search import search as search_index, KINDS as SEARCH_KINDS
+from roster import read_roster, import_roster, format_result, credentials_csv
+from forecast import get_consumption_forecast, create_purchase_drafts, FORECAST_LEAD_DAYS, FORECAST_COVER_DAYS
+from migrations import upgrade
+from database import init_database
+from caching import init_caching
+from security import verify_password, needs_rehash, rehash_password, get_login_stats, LoginBusy, LOGIN_RETRY_AFTER
+import events
 
 app = Flask(__name__)
 app.secret_key = 'school_canteen_secret_key_2024'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///canteen.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-db.init_app(app)
-
-
-@app.after_request
-def add_no_cache_headers(response):
-    response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate, post-check=0, pre-check=0'
-    response.headers['Pragma'] = 'no-cache'
-    response.headers['Expires'] = '0'
-    return response
+init_database(app)
 
 
 ROLE_REQUIRED = {
@@ -35,21 +33,34 @@ ROLE_REQUIRED = {
     'reviews': None,
     'add_review_route': None,
     'toggle_favorite': None,
+    'search': None,
     'cook': 'cook',
     'cook_dishes': 'cook',
     'toggle_item': 'cook',
     'create_dish': 'cook',
     'delete_dish': 'cook',
     'cook_item': 'cook',
+    'cook_dish': 'cook',
     'prepare_order': 'cook',
     'add_request': 'cook',
     'cook_issued': 'cook',
+    'cook_stream': 'cook',
     'admin': 'admin',
     'approve': 'admin',
     'reject': 'admin',
     'approve_user': 'admin',
     'reject_user': 'admin',
     'download_report': 'admin',
+    'attendance_api': 'admin',
+    'login_stats_api': 'admin',
+    'import_roster_route': 'admin',
+    'forecast': 'admin',
+    'forecast_drafts': 'admin',
+}
+
+# Что подгрузить вместе с текущим пользователем для страницы
+USER_EAGER = {
+    'student': {'subscriptions': True},
 }
 
 ROLE_HOME = {
@@ -82,24 +93,38 @@ def check_session():
             home = ROLE_HOME.get(user_role, 'login')
             return redirect(url_for(home))
 
+    g.user = load_user(session['user_id'], **USER_EAGER.get(endpoint, {}))
+    if g.user is None:
+        session.clear()
+        return redirect(url_for('login'))
+
+# Счётчик непрочитанных считается одним COUNT и не чаще раза за запрос
+def get_unread_count():
+    if 'unread_count' not in g:
+        g.unread_count = count_unread_notifications(g.user) if 'user' in g else 0
+    return g.unread_count
+
+
 @app.context_processor
 def inject_unread_count():
-    if 'user_id' in session:
-        unread = get_unread_notifications(session['user_id'])
-        return {'unread_count': len(unread)}
-    return {'unread_count': 0}
+    return {'unread_count': get_unread_count()}
+
+
+# Страницы, на которые можно ответить 304: эндпоинт -> версия данных,
+# от которых зависит страница (см. caching.py)
+ETAG_VALIDATORS = {
+    'student': lambda: (get_menu_version(), get_unread_count(), get_student_watermark(g.user),
+                        get_reviews_watermark()),
+    'reviews': lambda: (get_menu_version(), get_unread_count(), get_reviews_watermark()),
+    'cook_dishes': lambda: (get_menu_version(), get_unread_count()),
+}
+
+init_caching(app, ETAG_VALIDATORS)
+
 @app.route('/')
 def index():
-    if 'user_id' in session:
-        user = get_user_by_id(session['user_id'])
-        if user:
-            if user.role == 'student':
-                return redirect(url_for('student'))
-            elif user.role == 'cook':
-                return redirect(url_for('cook'))
-            elif user.role == 'admin':
-                return redirect(url_for('admin'))
-    return redirect(url_for('login'))
+    home = ROLE_HOME.get(session.get('role')) if 'user_id' in session else None
+    return redirect(url_for(home or 'login'))
 
 
 @app.route('/login', methods=['GET', 'POST'])
@@ -108,7 +133,17 @@ def login():
         username = request.form.get('username')
         password = request.form.get('password')
         user = get_user(username)
-        if user and user.check_password(password):
+        try:
+            ok = user is not None and verify_password(user.password, password)
+            if ok and needs_rehash(user.password):
+                user.password = rehash_password(password)
+                db.session.commit()
+        except LoginBusy:
+            flash(f'Сервер перегружен, попробуйте войти через {LOGIN_RETRY_AFTER} секунд')
+            response = make_response(render_template('login.html'), 503)
+            response.headers['Retry-After'] = str(LOGIN_RETRY_AFTER)
+            return response
+        if ok:
             if not user.is_approved:
                 flash('Ваш аккаунт ещё не подтверждён администратором')
                 return render_template('login.html')
@@ -132,9 +167,7 @@ def register():
             return render_template('register.html')
         else:
             add_user(username, password, 'student', full_name, class_name)
-            admins = User.query.filter_by(role='admin').all()
-            for adm in admins:
-                add_notification(adm.id, f'Новая заявка на регистрацию: {full_name} ({username})')
+            broadcast_notification('admin', f'Новая заявка на регистрацию: {full_name} ({username})')
             flash('Заявка отправлена. Ожидайте подтверждения.')
             return redirect(url_for('login'))
     return render_template('register.html')
@@ -148,25 +181,19 @@ def logout():
 
 @app.route('/student')
 def student():
-    user = get_user_by_id(session['user_id'])
-    breakfast_menu = get_all_unique_menu_items('breakfast')
-    lunch_menu = get_all_unique_menu_items('lunch')
-    user_allergies = get_user_allergy_ids(user.id)
-    breakfast_sub = get_subscription(user.id, 'breakfast')
-    lunch_sub = get_subscription(user.id, 'lunch')
-    orders = get_user_orders(user.id)
-    unread = get_unread_notifications(user.id)
-    unavailable_ids = get_unavailable_item_ids()
-
-    menu_allergies = {}
-    all_items = []
-    for items in breakfast_menu.values():
-        all_items.extend(items)
-    for items in lunch_menu.values():
-        all_items.extend(items)
-
-    for item in all_items:
-        menu_allergies[item.id] = get_menu_item_allergies(item.id)
+    user = g.user
+    catalog = get_menu_catalog()
+    breakfast_menu = catalog['breakfast']
+    lunch_menu = catalog['lunch']
+    breakfast_sub = user.subscription('breakfast')
+    lunch_sub = user.subscription('lunch')
+    orders = get_user_orders(user.id, request.args.get('before', type=int))
+    unavailable_ids = catalog['unavailable_ids']
+    menu_items = [item for menu in (breakfast_menu, lunch_menu) for items in menu.values() for item in items]
+    ratings = get_dish_ratings(item.id for item in menu_items)
+    user_mask = user.allergen_mask or 0
+    allergen_warnings = {item.id: allergen_names(item.allergen_mask & user_mask, catalog['allergen_names'])
+                         for item in menu_items if item.allergen_mask & user_mask}
 
     sub_prices = {'breakfast': 100, 'lunch': 150}
 
@@ -174,19 +201,19 @@ def student():
                            user=user,
                            breakfast_menu=breakfast_menu,
                            lunch_menu=lunch_menu,
-                           user_allergies=user_allergies,
-                           menu_allergies=menu_allergies,
+                           allergen_warnings=allergen_warnings,
                            breakfast_sub=breakfast_sub,
                            lunch_sub=lunch_sub,
-                           orders=orders,
-                           unread_count=len(unread),
+                           orders=orders.items,
+                           orders_cursor=orders.cursor,
                            sub_prices=sub_prices,
+                           ratings=ratings,
                            unavailable_ids=unavailable_ids)
 
 
 @app.route('/order', methods=['POST'])
 def order():
-    user = get_user_by_id(session['user_id'])
+    user = g.user
     meal_type = request.form.get('meal_type')
     use_sub = request.form.get('use_subscription') == '1'
 
@@ -201,53 +228,17 @@ def order():
         flash('Выберите блюда')
         return redirect(url_for('student'))
 
-    unavailable = get_unavailable_item_ids()
-    for item_id in item_ids:
-        if item_id in unavailable:
-            flash('Одно из выбранных блюд недоступно')
-            return redirect(url_for('student'))
-
-    prices = {'breakfast': 100, 'lunch': 150}
-    sub_price = prices.get(meal_type, 100)
-
-    if use_sub:
-        today = date.today()
-        already_sub_orders = get_subscription_orders_count_for_day(user.id, meal_type, today)
-        if already_sub_orders >= 1:
-            flash('Вы уже использовали абонемент на этот прием пищи сегодня')
-            return redirect(url_for('student'))
-
-        sub = get_subscription(user.id, meal_type)
-        if not sub or sub.meals_left < 1:
-            flash('Нет доступных посещений в абонементе')
-            return redirect(url_for('student'))
-
-        use_subscription(user.id, meal_type)
-        order_obj, total = create_order(user.id, meal_type, item_ids, is_subscription=True)
-        add_notification(user.id, f'Заказ по абонементу оформлен ({sub_price} руб).')
-    else:
-        items = [MenuItem.query.get(i) for i in item_ids]
-        total = sum(i.price for i in items if i)
-
-        if user.balance < total:
-            flash('Недостаточно средств')
-            return redirect(url_for('student'))
-
-        subtract_balance(user.id, total)
-        add_payment(user.id, total, 'purchase')
-        order_obj, total = create_order(user.id, meal_type, item_ids, is_subscription=False)
-        add_notification(user.id, f'Заказ на {total} руб. оформлен!')
-
-    cooks = User.query.filter_by(role='cook').all()
-    for c in cooks:
-        add_notification(c.id, f'Новый заказ #{order_obj.id}')
+    order_obj, total, error = place_order(user.id, meal_type, item_ids, use_sub)
+    if error:
+        flash(error)
+        return redirect(url_for('student'))
 
     flash('Заказ успешно создан!')
     return redirect(url_for('student'))
 
 @app.route('/buy_subscription', methods=['POST'])
 def buy_subscription():
-    user = get_user_by_id(session['user_id'])
+    user = g.user
     meal_type = request.form.get('meal_type')
     count = int(request.form.get('count', 5))
 
@@ -297,16 +288,18 @@ def receive_order(order_id):
 
 @app.route('/profile')
 def profile():
-    user = get_user_by_id(session['user_id'])
+    user = g.user
     allergies = get_all_allergies()
-    user_allergies = get_user_allergy_ids(user.id)
+    user_allergies = {a.id for a in allergies if (user.allergen_mask or 0) & allergen_bit(a.id)}
     return render_template('profile.html', user=user, allergies=allergies, user_allergies=user_allergies)
 
 
 @app.route('/toggle_allergy/<int:allergy_id>')
 def toggle_allergy(allergy_id):
-    user_allergies = get_user_allergy_ids(session['user_id'])
-    if allergy_id in user_allergies:
+    if not is_allergy_id(allergy_id):
+        flash('Такого аллергена нет')
+        return redirect(url_for('profile'))
+    if (g.user.allergen_mask or 0) & allergen_bit(allergy_id):
         remove_user_allergy(session['user_id'], allergy_id)
     else:
         add_user_allergy(session['user_id'], allergy_id)
@@ -315,18 +308,22 @@ def toggle_allergy(allergy_id):
 
 @app.route('/notifications')
 def notifications():
-    notifs = get_notifications(session['user_id'])
-    mark_all_notifications_read(session['user_id'])
-    user = get_user_by_id(session['user_id'])
-    return render_template('notifications.html', notifications=notifs, user=user)
+    user = g.user
+    page = get_notifications(user, request.args.get('before', type=int))
+    unread_ids = {n.id for n in page.items if is_unread(n, user)}
+    mark_all_notifications_read(user)
+    g.unread_count = 0
+    return render_template('notifications.html', notifications=page.items, cursor=page.cursor,
+                           unread_ids=unread_ids, user=user)
 
 
 @app.route('/reviews')
 def reviews():
-    user = get_user_by_id(session['user_id'])
-    all_reviews = get_all_reviews()
-    items = MenuItem.query.all()
-    return render_template('reviews.html', user=user, reviews=all_reviews, items=items)
+    user = g.user
+    page = get_all_reviews(request.args.get('before', type=int))
+    items = get_menu_item_choices()
+    return render_template('reviews.html', user=user, reviews=page.items, cursor=page.cursor, items=items,
+                           top_week=get_top_rated_week(), ratings=get_rating_summary())
 
 
 @app.route('/add_review', methods=['POST'])
@@ -338,22 +335,26 @@ def add_review_route():
     add_review(session['user_id'], menu_item_id, review_text, rating)
 
     item = MenuItem.query.get(menu_item_id)
-    user = get_user_by_id(session['user_id'])
+    user = g.user
     item_name = item.name if item else 'Неизвестное блюдо'
     user_name = user.full_name or user.username
     stars = '★' * rating + '☆' * (5 - rating)
 
-    cooks = User.query.filter_by(role='cook').all()
-    for c in cooks:
-        add_notification(
-            c.id,
-            f'Новый отзыв на "{item_name}" от {user_name}: {stars} — "{review_text}"'
-        )
+    broadcast_notification('cook', f'Новый отзыв на "{item_name}" от {user_name}: {stars} — "{review_text}"')
 
     flash('Отзыв добавлен!')
     return redirect(url_for('reviews'))
 
 
+@app.route('/search')
+def search():
+    query = request.args.get('q', '').strip()
+    kind = request.args.get('kind')
+    results = search_index(query, kind, request.args.get('page', 1, type=int))
+    return render_template('search.html', user=g.user, query=query, kind=kind if kind in SEARCH_KINDS else '',
+                           results=results)
+
+
 @app.route('/toggle_favorite/<int:item_id>')
 def toggle_favorite(item_id):
     fav = Favorite.query.filter_by(user_id=session['user_id'], menu_item_id=item_id).first()
@@ -370,43 +371,38 @@ def toggle_favorite(item_id):
 
 @app.route('/cook')
 def cook():
-    user = get_user_by_id(session['user_id'])
+    user = g.user
     orders = get_orders_to_prepare()
     products = get_all_products()
     my_requests = PurchaseRequest.query.filter_by(created_by=user.id).order_by(PurchaseRequest.date.desc()).all()
-    unread = get_unread_notifications(user.id)
-
-    order_item_can_cook = {}
-    for o in orders:
-        for oi in o.items:
-            if not oi.is_cooked:
-                order_item_can_cook[oi.id] = check_item_ingredients_available(oi.menu_item_id)
 
-    today = date.today()
-    today_orders = Order.query.filter_by(date=today).all()
-
-    b_count = len([o for o in today_orders if o.meal_type == 'breakfast'])
-    l_count = len([o for o in today_orders if o.meal_type == 'lunch'])
-    p_count = len([o for o in today_orders if o.is_prepared])
-    r_count = len([o for o in today_orders if o.is_received])
+    dish_portions = get_portions_available()
+    counts = get_today_order_counts()
 
     return render_template('cook.html',
                            user=user,
                            orders=orders,
                            products=products,
                            my_requests=my_requests,
-                           order_item_can_cook=order_item_can_cook,
-                           unread_count=len(unread),
-                           breakfast_count=b_count,
-                           lunch_count=l_count,
-                           prepared_count=p_count,
-                           received_count=r_count)
+                           dish_portions=dish_portions,
+                           plan=get_production_plan(),
+                           breakfast_count=counts['breakfast'],
+                           lunch_count=counts['lunch'],
+                           prepared_count=counts['prepared'],
+                           received_count=counts['received'])
+
+
+# Поток событий для кухонного монитора: новые заказы, приготовленные блюда,
+# собранные заказы. Соединение не держит контекст приложения и сессию БД.
+@app.route('/cook/stream')
+def cook_stream():
+    return Response(events.stream(events.KITCHEN_CHANNEL), mimetype='text/event-stream',
+                    headers={'X-Accel-Buffering': 'no'})
 
 
 @app.route('/cook/dishes')
 def cook_dishes():
-    user = get_user_by_id(session['user_id'])
-    unread = get_unread_notifications(user.id)
+    user = g.user
     breakfast_dishes = get_all_unique_menu_items('breakfast')
     lunch_dishes = get_all_unique_menu_items('lunch')
 
@@ -418,10 +414,11 @@ def cook_dishes():
     for items in lunch_dishes.values():
         all_dishes.extend(items)
 
+    all_ingredients = get_ingredients_by_item()
+    dish_portions = get_portions_available()
     for item in all_dishes:
-        ings = MenuItemIngredient.query.filter_by(menu_item_id=item.id).all()
-        dish_ingredients[item.id] = ings
-        dish_can_cook[item.id] = item.is_available and check_item_ingredients_available(item.id)
+        dish_ingredients[item.id] = all_ingredients.get(item.id, [])
+        dish_can_cook[item.id] = item.is_available and can_cook_portion(dish_portions, item.id)
 
     categories = Category.query.all()
     products = get_all_products()
@@ -433,10 +430,10 @@ def cook_dishes():
                            lunch_dishes=lunch_dishes,
                            dish_ingredients=dish_ingredients,
                            dish_can_cook=dish_can_cook,
+                           dish_portions=dish_portions,
                            categories=categories,
                            products=products,
-                           allergies=allergies,
-                           unread_count=len(unread))
+                           allergies=allergies)
 
 
 @app.route('/cook/toggle_item/<int:item_id>')
@@ -461,7 +458,11 @@ def create_dish():
 
     allergy_ids = [int(a) for a in request.form.getlist('dish_allergies') if a]
 
-    create_custom_dish(name, price, category_id, ingredients_data, allergy_ids)
+    try:
+        create_custom_dish(name, price, category_id, ingredients_data, allergy_ids)
+    except ValueError as e:
+        flash(str(e))
+        return redirect(url_for('cook_dishes'))
     flash('Блюдо создано')
     return redirect(url_for('cook_dishes'))
 
@@ -482,6 +483,17 @@ def cook_item(oi_id):
     return redirect(url_for('cook'))
 
 
+@app.route('/api/cook_dish/<int:menu_item_id>', methods=['POST'])
+def cook_dish(menu_item_id):
+    count = request.form.get('count', type=int)
+    cooked, error = cook_dish_batch(menu_item_id, meal_type=request.form.get('meal_type') or None, limit=count)
+    if cooked:
+        flash(f'Приготовлено порций: {cooked}')
+    else:
+        flash(error)
+    return redirect(url_for('cook'))
+
+
 @app.route('/api/prepare_order/<int:order_id>')
 def prepare_order(order_id):
     if mark_order_prepared(order_id):
@@ -501,29 +513,22 @@ def add_request():
 
     # Получаем данные для уведомления
     product = Product.query.get(product_id)
-    cook_user = get_user_by_id(session['user_id'])
+    cook_user = g.user
     product_name = product.name if product else 'Неизвестный продукт'
     cook_name = cook_user.full_name or cook_user.username
     unit = product.unit if product else 'ед.'
 
     # Отправляем уведомление всем админам
-    admins = User.query.filter_by(role='admin').all()
-    for adm in admins:
-        add_notification(
-            adm.id,
-            f'Новая заявка на закупку от {cook_name}: {product_name} — {quantity} {unit}'
-        )
+    broadcast_notification('admin', f'Новая заявка на закупку от {cook_name}: {product_name} — {quantity} {unit}')
 
     flash('Заявка создана')
     return redirect(url_for('cook'))
 
 @app.route('/cook/issued')
 def cook_issued():
-    user = get_user_by_id(session['user_id'])
-    unread = get_unread_notifications(user.id)
+    user = g.user
 
-    today = date.today()
-    issued_today = Order.query.filter_by(is_received=True, date=today).all()
+    issued_today = get_issued_orders(date.today())
 
     b_issued = [o for o in issued_today if o.meal_type == 'breakfast']
     l_issued = [o for o in issued_today if o.meal_type == 'lunch']
@@ -542,38 +547,20 @@ def cook_issued():
                            user=user,
                            breakfast_issued=b_issued,
                            lunch_issued=l_issued,
-                           dish_stats=dish_stats,
-                           unread_count=len(unread))
+                           dish_stats=dish_stats)
 
 
 @app.route('/admin')
 def admin():
-    user = get_user_by_id(session['user_id'])
+    user = g.user
     stats = get_payments_stats()
     order_stats = get_orders_stats()
     expenses = get_expenses()
     pending = get_pending_requests()
-    users = User.query.all()
+    users = get_users(request.args.get('after', type=int))
     pending_users = User.query.filter_by(is_approved=False).all()
-    unread = get_unread_notifications(user.id)
-
-    today = date.today()
-    all_today = Order.query.filter_by(date=today).all()
-
-    class_stats = {}
-    for o in all_today:
-        if o.is_received:
-            u_class = o.user.class_name or 'Без класса'
-            if u_class not in class_stats:
-                class_stats[u_class] = {'total': 0, 'breakfast': 0, 'lunch': 0}
-            class_stats[u_class]['total'] += 1
-            if o.meal_type == 'breakfast':
-                class_stats[u_class]['breakfast'] += 1
-            else:
-                class_stats[u_class]['lunch'] += 1
-
-    total_b = len([o for o in all_today if o.meal_type == 'breakfast'])
-    total_l = len([o for o in all_today if o.meal_type == 'lunch'])
+
+    class_stats = get_class_attendance()
 
     return render_template('admin.html',
                            user=user,
@@ -581,14 +568,67 @@ def admin():
                            order_stats=order_stats,
                            expenses=expenses,
                            pending=pending,
-                           users=users,
+                           users=users.items,
+                           users_cursor=users.cursor,
+                           users_total=count_users(),
                            pending_users=pending_users,
                            class_stats=class_stats,
-                           unread_count=len(unread),
-                           total_breakfasts=order_stats['total'],
-                           breakfast_today=total_b,
-                           total_lunches=order_stats['total'],
-                           lunch_today=total_l)
+                           total_breakfasts=order_stats['breakfast'],
+                           breakfast_today=order_stats['breakfast_today'],
+                           total_lunches=order_stats['lunch'],
+                           lunch_today=order_stats['lunch_today'])
+
+
+@app.route('/api/login_stats')
+def login_stats_api():
+    return jsonify(get_login_stats())
+
+
+# Посещаемость за период: /api/attendance?from=2025-09-01&to=2025-09-30
+@app.route('/api/attendance')
+def attendance_api():
+    try:
+        stats = get_attendance_stats(request.args.get('from'), request.args.get('to'))
+    except ValueError:
+        return jsonify({'error': 'Дата должна быть в формате ГГГГ-ММ-ДД'}), 400
+    return jsonify(stats)
+
+
+@app.route('/admin/roster', methods=['POST'])
+def import_roster_route():
+    file = request.files.get('roster')
+    if not file or not file.filename:
+        flash('Выберите файл со списком')
+        return redirect(url_for('admin'))
+    try:
+        records = read_roster(file.stream, file.filename)
+    except (ValueError, csv.Error) as e:
+        flash(f'Не удалось прочитать файл: {e}')
+        return redirect(url_for('admin'))
+    result = import_roster(records, approve=request.form.get('approve') == '1')
+    flash(format_result(result))
+    if result.generated:
+        return send_file(io.BytesIO(credentials_csv(result.generated)), mimetype='text/csv',
+                         download_name='passwords.csv', as_attachment=True)
+    return redirect(url_for('admin'))
+
+
+@app.route('/admin/forecast')
+def forecast():
+    rows = get_consumption_forecast()
+    return render_template('forecast.html',
+                           forecast=rows,
+                           to_order=len([r for r in rows if r.suggested > 0]),
+                           inf=float('inf'),
+                           lead_days=FORECAST_LEAD_DAYS,
+                           cover_days=FORECAST_COVER_DAYS)
+
+
+@app.route('/admin/forecast/drafts', methods=['POST'])
+def forecast_drafts():
+    created = create_purchase_drafts(session['user_id'])
+    flash(f'Создано черновиков заявок: {created}' if created else 'Закупка не требуется')
+    return redirect(url_for('admin'))
 
 
 @app.route('/approve/<int:req_id>')
@@ -628,225 +668,13 @@ def reject_user(user_id):
 
 @app.route('/download_report')
 def download_report():
-    stats = get_payments_stats()
-    order_stats = get_orders_stats()
-    expenses = get_expenses()
-    all_requests = get_all_requests()
-    users = User.query.order_by(User.id).all()
-    all_orders = Order.query.order_by(Order.created_at.desc()).all()
-    products = Product.query.order_by(Product.id).all()
-    all_order_items = OrderItem.query.all()
-    menu_items = MenuItem.query.order_by(MenuItem.name).all()
-
-    wb = Workbook()
-
-    header_font = Font(name='Calibri', size=11, bold=True, color='FFFFFF')
-    header_fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
-    thin_border = Side(style='thin')
-    border = Border(left=thin_border, right=thin_border, top=thin_border, bottom=thin_border)
-    center_align = Alignment(horizontal='center', vertical='center')
-    title_font = Font(name='Calibri', size=14, bold=True)
-    bold_font = Font(name='Calibri', bold=True)
-
-    def style_table_header(ws, row, col_count):
-        for c in range(1, col_count + 1):
-            cell = ws.cell(row=row, column=c)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.border = border
-            cell.alignment = center_align
-
-    ws1 = wb.active
-    ws1.title = "Сводка"
-    ws1['A1'] = "Отчёт по школьной столовой"
-    ws1['A1'].font = title_font
-    ws1['A2'] = "Дата формирования"
-    ws1['B2'] = datetime.now().strftime('%d.%m.%Y %H:%M')
-
-    ws1['A4'] = "Финансовые показатели"
-    ws1['A4'].font = bold_font
-
-    ws1.append(['Показатель', 'Сумма (руб.)'])
-    style_table_header(ws1, 5, 2)
-
-    data_fin = [
-        ['Доход от абонементов', stats['subscriptions']],
-        ['Доход от покупок', stats['purchases']],
-        ['Общий доход', stats['total_income']],
-        ['Расходы на закупки', expenses],
-        ['Чистая прибыль', stats['total_income'] - expenses]
-    ]
-    for row in data_fin:
-        ws1.append(row)
-
-    ws1['A12'] = "Статистика заказов"
-    ws1['A12'].font = bold_font
-
-    ws1.append(['Показатель', 'Значение'])
-    style_table_header(ws1, 13, 2)
-
-    b_total = len([o for o in all_orders if o.meal_type == 'breakfast'])
-    l_total = len([o for o in all_orders if o.meal_type == 'lunch'])
-
-    data_ord = [
-        ['Всего заказов', order_stats['total']],
-        ['Заказов за сегодня', order_stats['today']],
-        ['Получено', order_stats['received']],
-        ['Всего завтраков', b_total],
-        ['Всего обедов', l_total]
-    ]
-    for row in data_ord:
-        ws1.append(row)
-
-    ws1.column_dimensions['A'].width = 30
-    ws1.column_dimensions['B'].width = 20
-
-    ws2 = wb.create_sheet("Учёт завтраков")
-    ws2['A1'] = "Учёт завтраков"
-    ws2['A1'].font = title_font
-    ws2['A2'] = f"Всего завтраков:"
-    ws2['B2'] = b_total
-
-    headers_meals = ['№', 'Дата', 'Ученик', 'Класс', 'Блюда', 'Оплата', 'Статус']
-    ws2.append([])
-    ws2.append(headers_meals)
-    style_table_header(ws2, 4, 7)
-
-    for o in all_orders:
-        if o.meal_type == 'breakfast':
-            items_str = ", ".join([i.menu_item.name for i in o.items])
-            pay_type = 'Абонемент' if o.is_subscription else 'Разовая'
-            status = 'Получен' if o.is_received else ('Готов' if o.is_prepared else 'Готовится')
-            ws2.append([o.id, o.date.strftime('%d.%m.%Y'), o.user.full_name or o.user.username,
-                        o.user.class_name, items_str, pay_type, status])
-
-    ws2.column_dimensions['C'].width = 25
-    ws2.column_dimensions['E'].width = 40
-
-    ws3 = wb.create_sheet("Учёт обедов")
-    ws3['A1'] = "Учёт обедов"
-    ws3['A1'].font = title_font
-    ws3['A2'] = f"Всего обедов:"
-    ws3['B2'] = l_total
-
-    ws3.append([])
-    ws3.append(headers_meals)
-    style_table_header(ws3, 4, 7)
-
-    for o in all_orders:
-        if o.meal_type == 'lunch':
-            items_str = ", ".join([i.menu_item.name for i in o.items])
-            pay_type = 'Абонемент' if o.is_subscription else 'Разовая'
-            status = 'Получен' if o.is_received else ('Готов' if o.is_prepared else 'Готовится')
-            ws3.append([o.id, o.date.strftime('%d.%m.%Y'), o.user.full_name or o.user.username,
-                        o.user.class_name, items_str, pay_type, status])
-
-    ws3.column_dimensions['C'].width = 25
-    ws3.column_dimensions['E'].width = 40
-
-    ws4 = wb.create_sheet("Все заказы")
-    ws4['A1'] = "Все заказы"
-    ws4['A1'].font = title_font
-
-    headers_all = ['№', 'Дата', 'Ученик', 'Класс', 'Приём пищи', 'Блюда', 'Оплата', 'Статус']
-    ws4.append([])
-    ws4.append(headers_all)
-    style_table_header(ws4, 3, 8)
-
-    for o in all_orders:
-        meal = 'Завтрак' if o.meal_type == 'breakfast' else 'Обед'
-        items_str = ", ".join([i.menu_item.name for i in o.items])
-        pay_type = 'Абонемент' if o.is_subscription else 'Разовая'
-        status = 'Получен' if o.is_received else ('Готов' if o.is_prepared else 'Готовится')
-        ws4.append([o.id, o.date.strftime('%d.%m.%Y'), o.user.full_name or o.user.username,
-                    o.user.class_name, meal, items_str, pay_type, status])
-
-    ws4.column_dimensions['C'].width = 25
-    ws4.column_dimensions['F'].width = 40
-
-    ws5 = wb.create_sheet("Заявки на закупку")
-    ws5['A1'] = "Заявки на закупку"
-    ws5['A1'].font = title_font
-
-    headers_req = ['Дата', 'Продукт', 'Количество', 'Ед.', 'Сумма (руб.)']
-    ws5.append([])
-    ws5.append(headers_req)
-    style_table_header(ws5, 3, 5)
-
-    for r in all_requests:
-        summ = round(r.quantity * r.product.price, 2)
-        ws5.append([r.date.strftime('%d.%m.%Y'), r.product.name, r.quantity, r.product.unit, summ])
-
-    ws5.column_dimensions['B'].width = 25
-
-    ws6 = wb.create_sheet("Пользователи")
-    ws6['A1'] = "Пользователи"
-    ws6['A1'].font = title_font
-
-    headers_users = ['ID', 'Логин', 'ФИО', 'Класс', 'Роль']
-    ws6.append([])
-    ws6.append(headers_users)
-    style_table_header(ws6, 3, 5)
-
-    for u in users:
-        role_map = {'student': 'Ученик', 'cook': 'Повар', 'admin': 'Администратор'}
-        ws6.append([u.id, u.username, u.full_name, u.class_name, role_map.get(u.role, u.role)])
-
-    ws6.column_dimensions['C'].width = 30
-
-    ws7 = wb.create_sheet("Продукты")
-    ws7['A1'] = "Продукты"
-    ws7['A1'].font = title_font
-
-    headers_prod = ['ID продукта', 'Название', 'Остаток', 'Ед. измерения']
-    ws7.append([])
-    ws7.append(headers_prod)
-    style_table_header(ws7, 3, 4)
-
-    for p in products:
-        ws7.append([p.id, p.name, p.quantity, p.unit])
-
-    ws7.column_dimensions['B'].width = 25
-
-    ws8 = wb.create_sheet("Приготовленные блюда")
-    ws8['A1'] = "Приготовленные блюда"
-    ws8['A1'].font = title_font
-
-    headers_cooked = ['ID позиции', 'ID заказа', 'ID блюда', 'Блюдо']
-    ws8.append([])
-    ws8.append(headers_cooked)
-    style_table_header(ws8, 3, 4)
-
-    for oi in all_order_items:
-        ws8.append([oi.id, oi.order_id, oi.menu_item_id, oi.menu_item.name])
-
-    ws8.column_dimensions['D'].width = 30
-
-    ws9 = wb.create_sheet("Связь блюд и продуктов")
-    ws9['A1'] = "Связь блюд и продуктов"
-    ws9['A1'].font = title_font
-
-    headers_link = ['ID блюда', 'Блюдо', 'ID продукта', 'Продукт']
-    ws9.append([])
-    ws9.append(headers_link)
-    style_table_header(ws9, 3, 4)
-
-    for item in menu_items:
-        ings = MenuItemIngredient.query.filter_by(menu_item_id=item.id).all()
-        for ing in ings:
-            ws9.append([item.id, item.name, ing.product_id, ing.product.name])
-
-    ws9.column_dimensions['B'].width = 25
-    ws9.column_dimensions['D'].width = 25
-
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-
+    output = build_report()
     return send_file(output, download_name='school_canteen_report.xlsx', as_attachment=True)
 
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        upgrade()
+        ensure_daily_stats()
+        ensure_daily_stock_snapshot()
     app.run(debug=True, host='0.0.0.0')
\ No newline at end of file
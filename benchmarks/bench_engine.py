@@ -0,0 +1,94 @@
+import argparse
+import threading
+import time
+
+from werkzeug.security import generate_password_hash
+
+from common import make_app, percentile
+from models import db, User, Notification
+from db_functions import add_notification, count_unread_notifications, get_notifications
+
+
+def seed(app, users):
+    with app.app_context():
+        password = generate_password_hash('bench')
+        db.session.add_all([User(username=f'bench_user{i}', password=password, role='student', is_approved=True)
+                            for i in range(users)])
+        db.session.commit()
+        user_ids = [u.id for u in User.query.all()]
+        db.session.add_all([Notification(user_id=uid, text=f'Уведомление {n}') for uid in user_ids for n in range(20)])
+        db.session.commit()
+        return user_ids
+
+
+# Читатели имитируют открытие страниц (счётчик и список уведомлений),
+# писатели — оформление действий с отдельным commit на каждое.
+def run(name, tuned, readers, writers, seconds, users):
+    app = make_app(tuned=tuned)
+    user_ids = seed(app, users)
+    stop = threading.Event()
+    stats = {'read': [], 'write': [], 'errors': 0}
+    lock = threading.Lock()
+
+    def reader(n):
+        with app.app_context():
+            i = n
+            while not stop.is_set():
+                uid = user_ids[i % len(user_ids)]
+                started = time.perf_counter()
+                try:
+                    count_unread_notifications(uid)
+                    get_notifications(uid)
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        stats['read'].append(elapsed)
+                except Exception:
+                    db.session.rollback()
+                    with lock:
+                        stats['errors'] += 1
+                db.session.remove()
+                i += readers
+
+    def writer(n):
+        with app.app_context():
+            i = n
+            while not stop.is_set():
+                uid = user_ids[i % len(user_ids)]
+                started = time.perf_counter()
+                try:
+                    add_notification(uid, 'Новый заказ')
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        stats['write'].append(elapsed)
+                except Exception:
+                    db.session.rollback()
+                    with lock:
+                        stats['errors'] += 1
+                i += writers
+
+    threads = [threading.Thread(target=reader, args=(n,)) for n in range(readers)]
+    threads += [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    for kind in ('read', 'write'):
+        values = stats[kind]
+        print(f'{name:8} {kind:5} {len(values) / seconds:8.1f} оп/с  '
+              f'p50={percentile(values, 50) * 1000:7.1f}мс  p95={percentile(values, 95) * 1000:7.1f}мс  '
+              f'p99={percentile(values, 99) * 1000:7.1f}мс')
+    print(f'{name:8} ошибок (в т.ч. database is locked): {stats["errors"]}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Параллельное чтение и запись: настройки SQLite по умолчанию и WAL')
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--users', type=int, default=200)
+    args = parser.parse_args()
+    run('default', False, args.readers, args.writers, args.seconds, args.users)
+    run('tuned', True, args.readers, args.writers, args.seconds, args.users)
@@ -0,0 +1,84 @@
+import argparse
+import threading
+import time
+
+from werkzeug.security import generate_password_hash
+
+from common import make_app
+from models import db, User, Category, MenuItem
+from db_functions import place_order, subtract_balance, add_payment, create_order, add_notification
+
+
+def seed(app, students, cooks):
+    with app.app_context():
+        cat_main = Category(name='Основное блюдо', meal_type='lunch')
+        cat_drink = Category(name='Напиток', meal_type='lunch')
+        db.session.add_all([cat_main, cat_drink])
+        db.session.flush()
+        items = [MenuItem(name='Плов', price=120, category_id=cat_main.id, day_of_week=0),
+                 MenuItem(name='Компот', price=25, category_id=cat_drink.id, day_of_week=0)]
+        db.session.add_all(items)
+        password = generate_password_hash('bench')
+        for i in range(students):
+            db.session.add(User(username=f'bench_student{i}', password=password, role='student',
+                                balance=1000000, is_approved=True))
+        for i in range(cooks):
+            db.session.add(User(username=f'bench_cook{i}', password=password, role='cook', is_approved=True))
+        db.session.commit()
+        student_ids = [u.id for u in User.query.filter_by(role='student').all()]
+        return student_ids, [i.id for i in items]
+
+
+# Старый путь из маршрута /order: несколько отдельных commit на заказ
+def legacy_order(user_id, item_ids):
+    items = [MenuItem.query.get(i) for i in item_ids]
+    total = sum(i.price for i in items if i)
+    subtract_balance(user_id, total)
+    add_payment(user_id, total, 'purchase')
+    order_obj, total = create_order(user_id, 'lunch', item_ids, is_subscription=False)
+    add_notification(user_id, f'Заказ на {total} руб. оформлен!')
+    for c in User.query.filter_by(role='cook').all():
+        add_notification(c.id, f'Новый заказ #{order_obj.id}')
+
+
+def service_order(user_id, item_ids):
+    order_obj, total, error = place_order(user_id, 'lunch', item_ids)
+    if error:
+        raise RuntimeError(error)
+
+
+def run(mode, threads, per_thread, cooks):
+    app = make_app()
+    student_ids, item_ids = seed(app, threads, cooks)
+    submit = legacy_order if mode == 'legacy' else service_order
+    errors = []
+
+    def worker(user_id):
+        with app.app_context():
+            for _ in range(per_thread):
+                try:
+                    submit(user_id, item_ids)
+                except Exception as e:
+                    errors.append(e)
+                    db.session.rollback()
+
+    workers = [threading.Thread(target=worker, args=(uid,)) for uid in student_ids]
+    started = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - started
+    done = threads * per_thread - len(errors)
+    print(f'{mode:8} потоков={threads:3} заказов={done:5} ошибок={len(errors):3} '
+          f'время={elapsed:6.2f}с  {done / elapsed:8.1f} заказов/с')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Пропускная способность оформления заказов')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--orders', type=int, default=25, help='заказов на поток')
+    parser.add_argument('--cooks', type=int, default=3)
+    args = parser.parse_args()
+    for mode in ('legacy', 'service'):
+        run(mode, args.threads, args.orders, args.cooks)
@@ -0,0 +1,30 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from flask import Flask
+from database import init_database
+from migrations import upgrade
+
+
+# Отдельное приложение с временной базой, чтобы замеры не трогали canteen.db
+def make_app(db_path=None, tuned=None):
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='canteen_bench_'), 'bench.db')
+    app = Flask(__name__)
+    init_database(app, 'sqlite:///' + db_path, tuned=tuned)
+    with app.app_context():
+        upgrade()
+    return app
+
+
+def percentile(values, p):
+    if not values:
+        return 0
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(p / 100 * (len(values) - 1)))))
+    return values[k]
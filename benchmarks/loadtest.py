@@ -0,0 +1,249 @@
+import argparse
+import html
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import namedtuple
+from http.cookiejar import CookieJar
+
+from common import ROOT, percentile
+from init_db import STUDENT_USERNAME, STUDENT_PASSWORD
+
+# Нагрузочный тест «перемена в столовой»: синтетическая школа (тысячи
+# учеников, история заказов за несколько месяцев, создаётся init_db.py)
+# и смесь запросов к основным страницам от множества параллельных клиентов.
+
+# Доля маршрута в общей нагрузке
+TRAFFIC_MIX = [
+    ('/student', 55),
+    ('/order', 25),
+    ('/cook', 10),
+    ('/admin', 8),
+    ('/download_report', 2),
+]
+
+
+# Ответ сервера: статус, куда перенаправляет, Retry-After и тело
+Reply = namedtuple('Reply', 'status location retry_after body')
+
+STAFF = {'cook': ('cook', 'cook123'), 'admin': ('admin', 'admin123')}
+LOGIN_ATTEMPTS = 20
+
+
+def _reply(status, headers, body):
+    retry_after = headers.get('Retry-After')
+    return Reply(status, headers.get('Location') or '', int(retry_after) if retry_after else None, body)
+
+
+class LocalClient:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        reply = _reply(response.status_code, response.headers, response.get_data().decode('utf-8', 'replace'))
+        response.close()
+        return reply
+
+
+class HttpClient:
+    class _NoRedirect(urllib.request.HTTPRedirectHandler):
+        def redirect_request(self, *args, **kwargs):
+            return None
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()), self._NoRedirect())
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                return _reply(response.status, response.headers, response.read().decode('utf-8', 'replace'))
+        except urllib.error.HTTPError as e:
+            return _reply(e.code, e.headers, e.read().decode('utf-8', 'replace'))
+
+
+# Ошибка — любой статус 4xx/5xx и перенаправление на вход (сессия потеряна)
+def is_error(reply):
+    return reply.status >= 400 or (300 <= reply.status < 400 and '/login' in reply.location)
+
+
+# Вход с повтором после 503 (очередь проверки паролей переполнена); сессия
+# считается рабочей, только если открывается домашняя страница роли
+def login(client, username, password, home):
+    for _ in range(LOGIN_ATTEMPTS):
+        reply = client.request('POST', '/login', {'username': username, 'password': password})
+        if reply.status != 503:
+            break
+        time.sleep(reply.retry_after or 1)
+    reply = client.request('GET', home)
+    if reply.status != 200:
+        raise RuntimeError(f'{username}: вход не удался ({home} → {reply.status} {reply.location})')
+
+
+def pick_order_form(app):
+    from db_functions import get_menu_catalog
+    with app.app_context():
+        catalog = get_menu_catalog()
+        form = {'meal_type': 'lunch'}
+        for category, items in catalog['lunch'].items():
+            available = [i for i in items if i.id not in catalog['unavailable_ids']]
+            if available:
+                form[f'cat_{category.id}'] = available[0].id
+        return form
+
+
+# Форма заказа обеда со страницы ученика: первое доступное блюдо в каждой категории
+def parse_order_form(student_page):
+    sections = [section for section in re.findall(r'<form[^>]*action="/order"[^>]*>(.*?)</form>', student_page, re.S)
+                if 'name="meal_type" value="lunch"' in section]
+    if not sections:
+        return None
+    form = {'meal_type': 'lunch'}
+    for tag in re.findall(r'<input type="radio"[^>]*>', sections[0]):
+        name, value = re.search(r'name="(cat_\d+)"', tag), re.search(r'value="(\d+)"', tag)
+        if name and value and 'disabled' not in tag:
+            form.setdefault(name.group(1), value.group(1))
+    return form if len(form) > 1 else None
+
+
+# Для --url: ученики нагрузочной школы (логины по шаблону init_db) из списка
+# пользователей на панели администратора и форма заказа со страницы ученика
+def discover_target(make_client, count):
+    admin = make_client()
+    login(admin, *STAFF['admin'], '/admin')
+    pattern = re.compile('^' + re.escape(STUDENT_USERNAME).replace(re.escape('{}'), r'\d+') + '$')
+    students, path = [], '/admin'
+    while path and len(students) < count:
+        page = admin.request('GET', path).body
+        students += [name for name in re.findall(r'<td><strong>([^<]+)</strong></td>', html.unescape(page))
+                     if pattern.match(name)]
+        after = re.search(r'[?&]after=(\d+)', html.unescape(page))
+        path = f'/admin?after={after.group(1)}' if after else None
+    if not students:
+        raise RuntimeError(f'На сервере нет учеников вида {STUDENT_USERNAME.format("N")} '
+                           f'(создайте базу: init_db.py --bulk --students N)')
+    student = make_client()
+    login(student, students[0], STUDENT_PASSWORD, '/student')
+    order_form = parse_order_form(student.request('GET', '/student').body)
+    if order_form is None:
+        raise RuntimeError('На странице ученика нет доступных блюд на обед')
+    return students[:count], order_form
+
+
+def run_load(make_client, clients, duration, students, order_form, seed=1):
+    routes = [path for path, _ in TRAFFIC_MIX]
+    weights = [weight for _, weight in TRAFFIC_MIX]
+    results = {path: [] for path in routes}
+    errors = {path: 0 for path in routes}
+    login_failures = []
+    lock = threading.Lock()
+    stop = threading.Event()
+    ready = threading.Barrier(clients + 1)
+
+    def worker(n):
+        rnd = random.Random(seed + n)
+        sessions = {}
+        try:
+            for role, username, password, home in (
+                    ('student', students[n % len(students)], STUDENT_PASSWORD, '/student'),
+                    ('cook', *STAFF['cook'], '/cook'), ('admin', *STAFF['admin'], '/admin')):
+                sessions[role] = make_client()
+                login(sessions[role], username, password, home)
+        except Exception as e:
+            with lock:
+                login_failures.append(str(e))
+            sessions = None
+        # Замер начинается, когда все клиенты вошли
+        ready.wait()
+        if sessions is None:
+            return
+        while not stop.is_set():
+            path = rnd.choices(routes, weights)[0]
+            if path in ('/student', '/order'):
+                client = sessions['student']
+            elif path == '/cook':
+                client = sessions['cook']
+            else:
+                client = sessions['admin']
+            started = time.perf_counter()
+            try:
+                if path == '/order':
+                    ok = not is_error(client.request('POST', path, order_form))
+                else:
+                    ok = not is_error(client.request('GET', path))
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                if ok:
+                    results[path].append(elapsed)
+                else:
+                    errors[path] += 1
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(clients)]
+    for t in threads:
+        t.start()
+    ready.wait()
+    started = time.perf_counter()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    if login_failures:
+        print(f'\nКлиентов без входа: {len(login_failures)} из {clients}, например: {login_failures[0]}')
+    print(f'\n{"Маршрут":18} {"запросов":>9} {"ошибок":>7} {"зап/с":>8} {"p50, мс":>9} {"p95, мс":>9} {"p99, мс":>9}')
+    total = 0
+    for path in routes:
+        values = results[path]
+        total += len(values)
+        print(f'{path:18} {len(values):9} {errors[path]:7} {len(values) / elapsed:8.1f} '
+              f'{percentile(values, 50) * 1000:9.1f} {percentile(values, 95) * 1000:9.1f} '
+              f'{percentile(values, 99) * 1000:9.1f}')
+    print(f'{"Итого":18} {total:9} {sum(errors.values()):7} {total / elapsed:8.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест большой перемены')
+    parser.add_argument('--db', help='путь к файлу базы (по умолчанию временный)')
+    parser.add_argument('--skip-generate', action='store_true', help='использовать уже созданную базу')
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=60, help='учебных дней истории заказов')
+    parser.add_argument('--reviews', type=int, default=3000)
+    parser.add_argument('--clients', type=int, default=32, help='параллельных клиентов')
+    parser.add_argument('--duration', type=float, default=30, help='длительность, секунд')
+    parser.add_argument('--url', help='адрес запущенного сервера вместо запуска приложения в процессе')
+    args = parser.parse_args()
+
+    if args.url:
+        # Нагрузка на запущенный сервер: локальные приложение и база не нужны
+        make_client = lambda: HttpClient(args.url)
+        students, order_form = discover_target(make_client, args.clients)
+    else:
+        db_path = os.path.abspath(args.db or os.path.join(tempfile.mkdtemp(prefix='canteen_load_'), 'load.db'))
+        os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+
+        from app import app
+        if not args.skip_generate:
+            subprocess.run([sys.executable, 'init_db.py', '--bulk', '--students', str(args.students),
+                            '--days', str(args.days), '--reviews', str(args.reviews)], cwd=ROOT, check=True)
+            print(f'База: {db_path}')
+        make_client = lambda: LocalClient(app)
+        students = [STUDENT_USERNAME.format(n) for n in range(args.students)]
+        order_form = pick_order_form(app)
+    run_load(make_client, args.clients, args.duration, students, order_form)
+
+if __name__ == '__main__':
+    main()
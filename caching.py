@@ -0,0 +1,71 @@
+import hashlib
+import os
+from datetime import date
+
+from flask import g, request, session
+
+# Политика HTTP-кэширования по эндпоинтам.
+#   Статика: раздаётся с ?v=<mtime> и кэшируется браузером надолго.
+#   Страницы из ETAG_VALIDATORS: браузер хранит копию, но каждый раз
+#   переспрашивает сервер; если версия данных не изменилась, ответ — 304
+#   без запросов на рендер и без тела.
+#   Всё остальное, как и раньше, не кэшируется.
+NO_STORE = 'no-cache, no-store, must-revalidate'
+REVALIDATE = 'private, no-cache'
+STATIC_VERSIONED = 'public, max-age=31536000, immutable'
+STATIC_DEFAULT = 'public, max-age=3600'
+
+# Меняется при каждом запуске: версии данных (например, версия меню)
+# живут в памяти процесса и после перезапуска начинаются заново.
+PROCESS_TOKEN = os.urandom(4).hex()
+
+
+def _static_version(app, filename):
+    try:
+        return int(os.path.getmtime(os.path.join(app.static_folder, filename)))
+    except OSError:
+        return None
+
+
+def compute_etag(endpoint, parts):
+    raw = repr((PROCESS_TOKEN, endpoint, request.query_string, session.get('user_id'), session.get('role'),
+                date.today(), parts))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:24]
+
+
+def init_caching(app, validators):
+    @app.url_defaults
+    def add_static_version(endpoint, values):
+        if endpoint == 'static' and 'filename' in values and 'v' not in values:
+            version = _static_version(app, values['filename'])
+            if version is not None:
+                values['v'] = version
+
+    # Должен быть зарегистрирован после проверки сессии и прав
+    @app.before_request
+    def conditional_get():
+        validator = validators.get(request.endpoint)
+        if validator is None or request.method != 'GET' or 'user_id' not in session:
+            return None
+        # Страницу с flash-сообщением нужно отрисовать, иначе оно потеряется
+        if session.get('_flashes'):
+            return None
+        g.etag = compute_etag(request.endpoint, validator())
+        if g.etag in request.if_none_match:
+            response = app.response_class(status=304)
+            response.set_etag(g.etag)
+            return response
+        return None
+
+    @app.after_request
+    def apply_cache_policy(response):
+        if request.endpoint == 'static':
+            response.headers['Cache-Control'] = STATIC_VERSIONED if 'v' in request.args else STATIC_DEFAULT
+        elif 'etag' in g and response.status_code in (200, 304):
+            response.set_etag(g.etag)
+            response.headers['Cache-Control'] = REVALIDATE
+        else:
+            response.headers['Cache-Control'] = NO_STORE
+            response.headers['Pragma'] = 'no-cache'
+            response.headers['Expires'] = '0'
+        return response
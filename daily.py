@@ -0,0 +1,17 @@
+import sys
+
+from db_functions import ensure_daily_stock_snapshot
+
+# Ежедневное обслуживание (для cron): снимок склада и пересчёт резервов.
+
+
+def main(argv):
+    from app import app
+    with app.app_context():
+        done = ensure_daily_stock_snapshot()
+    print('Снимок склада за сегодня сделан' if done else 'Снимок склада за сегодня уже есть')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
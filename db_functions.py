@@ -1,7 +1,12 @@
 from models import db, User, Allergy, UserAllergy, Category, MenuItem, MenuItemAllergy
 from models import Product, MenuItemIngredient, Subscription, Order, OrderItem
-from models import Payment, Review, PurchaseRequest, Notification
-from datetime import datetime, date
+from models import Payment, Review, PurchaseRequest, Notification, DailyStats
+from models import StockMovement, StockSnapshot, DishDailyOrders, AttendanceRollup, DishRating, DishRatingWeek
+from datetime import datetime, date, timedelta
+from sqlalchemy.exc import IntegrityError
+from collections import namedtuple, Counter
+import threading
+from events import publish, has_subscribers, KITCHEN_CHANNEL
 
 
 def add_user(username, password, role, full_name='', class_name=''):
@@ -11,6 +16,7 @@ def add_user(username, password, role, full_name='', class_name=''):
         user.is_approved = True
     else:
         user.is_approved = False
+    user.notif_cursor = get_latest_broadcast_id(role)
     db.session.add(user)
     db.session.commit()
     return user
@@ -24,10 +30,85 @@ def get_user_by_id(user_id):
     return User.query.get(user_id)
 
 
+# Текущий пользователь запроса: аллергии и абонементы подгружаются сразу,
+# если они нужны странице
+def load_user(user_id, allergies=False, subscriptions=False):
+    options = []
+    if allergies:
+        options.append(db.selectinload(User.allergy_links))
+    if subscriptions:
+        options.append(db.selectinload(User.subscriptions))
+    return User.query.options(*options).filter(User.id == user_id).first()
+
+
+# Функции ниже принимают и id, и уже загруженного пользователя
+def _as_user(user):
+    return user if isinstance(user, User) else db.session.get(User, user)
+
+
+# Аллергены хранятся и как связи (UserAllergy, MenuItemAllergy), и как битовая
+# маска в User.allergen_mask / MenuItem.allergen_mask: аллергия с id n — бит n-1.
+# Маски обновляются вместе со связями; блюдо безопасно для ученика, если
+# item.allergen_mask & user.allergen_mask == 0.
+MAX_ALLERGENS = 63
+
+
+def allergen_bit(allergy_id):
+    return 1 << (allergy_id - 1)
+
+
+# Аллерген, у которого есть бит в маске
+def is_allergy_id(allergy_id):
+    return 1 <= allergy_id <= MAX_ALLERGENS and db.session.get(Allergy, allergy_id) is not None
+
+
+def _check_allergy_id(allergy_id):
+    if not is_allergy_id(allergy_id):
+        raise ValueError(f'Нет аллергена с номером {allergy_id}')
+
+
+def allergen_mask(allergy_ids):
+    mask = 0
+    for allergy_id in allergy_ids:
+        mask |= allergen_bit(allergy_id)
+    return mask
+
+
+def refresh_user_allergen_mask(user_id):
+    ids = [a for (a,) in db.session.query(UserAllergy.allergy_id).filter(UserAllergy.user_id == user_id)]
+    User.query.filter(User.id == user_id).update({User.allergen_mask: allergen_mask(ids)})
+
+
+def refresh_item_allergen_mask(menu_item_id):
+    ids = [a for (a,) in db.session.query(MenuItemAllergy.allergy_id).filter(MenuItemAllergy.menu_item_id == menu_item_id)]
+    MenuItem.query.filter(MenuItem.id == menu_item_id).update({MenuItem.allergen_mask: allergen_mask(ids)})
+
+
+# Пересчёт всех масок по таблицам связей
+def rebuild_allergen_masks():
+    for model, link, owner in ((User, UserAllergy, UserAllergy.user_id),
+                               (MenuItem, MenuItemAllergy, MenuItemAllergy.menu_item_id)):
+        masks = {}
+        for owner_id, allergy_id in db.session.query(owner, link.allergy_id):
+            if owner_id is not None and allergy_id is not None:
+                masks[owner_id] = masks.get(owner_id, 0) | allergen_bit(allergy_id)
+        db.session.execute(db.update(model).values(allergen_mask=0))
+        if masks:
+            db.session.execute(db.update(model), [{'id': owner_id, 'allergen_mask': mask}
+                                                  for owner_id, mask in masks.items()])
+    db.session.commit()
+    bump_menu_version()
+
+
 def add_allergy(name):
     allergy = Allergy(name=name)
     db.session.add(allergy)
+    db.session.flush()
+    if allergy.id > MAX_ALLERGENS:
+        db.session.rollback()
+        raise ValueError(f'Можно завести не больше {MAX_ALLERGENS} аллергенов')
     db.session.commit()
+    bump_menu_version()
     return allergy
 
 
@@ -36,10 +117,13 @@ def get_all_allergies():
 
 
 def add_user_allergy(user_id, allergy_id):
+    _check_allergy_id(allergy_id)
     exists = UserAllergy.query.filter_by(user_id=user_id, allergy_id=allergy_id).first()
     if not exists:
         ua = UserAllergy(user_id=user_id, allergy_id=allergy_id)
         db.session.add(ua)
+        db.session.flush()
+        refresh_user_allergen_mask(user_id)
         db.session.commit()
 
 
@@ -47,6 +131,8 @@ def remove_user_allergy(user_id, allergy_id):
     ua = UserAllergy.query.filter_by(user_id=user_id, allergy_id=allergy_id).first()
     if ua:
         db.session.delete(ua)
+        db.session.flush()
+        refresh_user_allergen_mask(user_id)
         db.session.commit()
 
 
@@ -64,6 +150,7 @@ def add_category(name, meal_type):
     cat = Category(name=name, meal_type=meal_type)
     db.session.add(cat)
     db.session.commit()
+    bump_menu_version()
     return cat
 
 
@@ -75,13 +162,18 @@ def add_menu_item(name, price, category_id, day_of_week):
     item = MenuItem(name=name, price=price, category_id=category_id, day_of_week=day_of_week)
     db.session.add(item)
     db.session.commit()
+    bump_menu_version()
     return item
 
 
 def add_menu_item_allergy(menu_item_id, allergy_id):
+    _check_allergy_id(allergy_id)
     mia = MenuItemAllergy(menu_item_id=menu_item_id, allergy_id=allergy_id)
     db.session.add(mia)
+    db.session.flush()
+    refresh_item_allergen_mask(menu_item_id)
     db.session.commit()
+    bump_menu_version()
 
 
 def get_menu_item_allergies(menu_item_id):
@@ -115,30 +207,122 @@ def get_all_unique_menu_items(meal_type):
     return result
 
 
+# Снимок меню для страницы ученика. Пересобирается только после изменения
+# версии: её увеличивают все операции, меняющие блюда, аллергены или склад.
+CatalogCategory = namedtuple('CatalogCategory', 'id name meal_type')
+CatalogItem = namedtuple('CatalogItem', 'id name price category_id is_available allergen_mask')
+
+_menu_cache = {'version': 0, 'built_version': None, 'catalog': None}
+_menu_version_lock = threading.Lock()
+_menu_build_lock = threading.Lock()
+
+
+def bump_menu_version():
+    with _menu_version_lock:
+        _menu_cache['version'] += 1
+
+
+def get_menu_version():
+    return _menu_cache['version']
+
+
+def _build_menu_catalog():
+    categories = Category.query.order_by(Category.id).all()
+    items = MenuItem.query.order_by(MenuItem.id).all()
+
+    items_by_category = {}
+    for item in items:
+        items_by_category.setdefault(item.category_id, []).append(item)
+
+    menus = {'breakfast': {}, 'lunch': {}}
+    for cat in categories:
+        seen_names = set()
+        unique_items = []
+        for item in items_by_category.get(cat.id, []):
+            if item.name not in seen_names:
+                seen_names.add(item.name)
+                unique_items.append(CatalogItem(item.id, item.name, item.price, item.category_id, item.is_available,
+                                                item.allergen_mask or 0))
+        if unique_items:
+            key = CatalogCategory(cat.id, cat.name, cat.meal_type)
+            menus.setdefault(cat.meal_type, {})[key] = unique_items
+
+    return {
+        'breakfast': menus['breakfast'],
+        'lunch': menus['lunch'],
+        'allergen_names': dict(db.session.query(Allergy.id, Allergy.name).order_by(Allergy.id).all()),
+        'unavailable_ids': frozenset(get_unavailable_item_ids()),
+    }
+
+
+def get_menu_catalog():
+    if _menu_cache['catalog'] is not None and _menu_cache['built_version'] == _menu_cache['version']:
+        return _menu_cache['catalog']
+    with _menu_build_lock:
+        version = _menu_cache['version']
+        if _menu_cache['catalog'] is None or _menu_cache['built_version'] != version:
+            _menu_cache['catalog'] = _build_menu_catalog()
+            _menu_cache['built_version'] = version
+        return _menu_cache['catalog']
+
+
+# Названия аллергенов из маски; names — catalog['allergen_names']
+def allergen_names(mask, names):
+    return [name for allergy_id, name in names.items() if mask & allergen_bit(allergy_id)]
+
+
+# free=True — считать от свободного остатка (на складе минус резерв заказов)
+def _load_recipe_matrix(item_ids=None, free=False):
+    stock = Product.quantity - db.func.coalesce(Product.reserved, 0) if free else Product.quantity
+    query = db.session.query(MenuItemIngredient.menu_item_id, MenuItemIngredient.quantity, stock) \
+        .outerjoin(Product, Product.id == MenuItemIngredient.product_id)
+    if item_ids is not None:
+        query = query.filter(MenuItemIngredient.menu_item_id.in_(list(item_ids)))
+    return query.all()
+
+
+# Сколько порций каждого блюда можно приготовить из текущих остатков.
+# Рецепты всех блюд читаются одним запросом; блюда без ингредиентов
+# в результат не попадают (ограничений нет).
+def get_portions_available(item_ids=None, free=False):
+    portions = {}
+    for menu_item_id, need, stock in _load_recipe_matrix(item_ids, free):
+        if stock is None:
+            can_make = 0
+        elif need <= 0:
+            portions.setdefault(menu_item_id, None)
+            continue
+        else:
+            can_make = max(0, int(stock / need + 1e-9))
+        current = portions.get(menu_item_id)
+        portions[menu_item_id] = can_make if current is None else min(current, can_make)
+    return {item_id: p for item_id, p in portions.items() if p is not None}
+
+
+def can_cook_portion(portions, item_id):
+    left = portions.get(item_id)
+    return left is None or left >= 1
+
+
 def check_item_ingredients_available(item_id):
-    ingredients = MenuItemIngredient.query.filter_by(menu_item_id=item_id).all()
-    if not ingredients:
-        return True
-    for ing in ingredients:
-        prod = Product.query.get(ing.product_id)
-        if not prod or prod.quantity < ing.quantity:
-            return False
-    return True
+    return can_cook_portion(get_portions_available([item_id]), item_id)
 
 
+# Блюдо можно заказать, пока свободного остатка хватает хотя бы на порцию
 def get_unavailable_item_ids():
-    items = MenuItem.query.all()
+    items = db.session.query(MenuItem.id, MenuItem.name, MenuItem.is_available).order_by(MenuItem.id).all()
+    portions = get_portions_available(free=True)
     unavailable = set()
     checked_names = {}
-    for item in items:
-        if item.name in checked_names:
-            if not checked_names[item.name]:
-                unavailable.add(item.id)
+    for item_id, name, is_available in items:
+        if name in checked_names:
+            if not checked_names[name]:
+                unavailable.add(item_id)
             continue
-        available = item.is_available and check_item_ingredients_available(item.id)
-        checked_names[item.name] = available
+        available = is_available and can_cook_portion(portions, item_id)
+        checked_names[name] = available
         if not available:
-            unavailable.add(item.id)
+            unavailable.add(item_id)
     return unavailable
 
 
@@ -150,28 +334,87 @@ def toggle_menu_item_availability(item_id):
         for i in same_items:
             i.is_available = new_status
         db.session.commit()
+        bump_menu_version()
         return new_status
     return None
 
 
+# Списывает продукты на порции одного блюда и отмечает позиции готовыми
+# в текущей транзакции (без commit). Остатки проверяются условием в самом
+# UPDATE, поэтому параллельная готовка не уведёт склад в минус.
+# Возвращает False, если продуктов не хватает или позиции уже приготовлены.
+def _cook_order_items(menu_item_id, order_item_ids):
+    count = len(order_item_ids)
+    needs = {}
+    recipe = db.session.query(MenuItemIngredient.product_id, MenuItemIngredient.quantity, Product.id) \
+        .outerjoin(Product, Product.id == MenuItemIngredient.product_id) \
+        .filter(MenuItemIngredient.menu_item_id == menu_item_id).all()
+    for product_id, need, found in recipe:
+        if found is None:
+            return False
+        needs[product_id] = needs.get(product_id, 0) + need
+    for product_id, need in needs.items():
+        total = need * count
+        result = db.session.execute(
+            db.update(Product)
+            .where(Product.id == product_id, Product.quantity >= total - 1e-9)
+            .values(quantity=db.case((Product.quantity > total, Product.quantity - total), else_=0),
+                    reserved=db.case((Product.reserved > total, Product.reserved - total), else_=0))
+            .execution_options(synchronize_session=False))
+        if result.rowcount != 1:
+            return False
+        record_stock_movement(product_id, -total, 'consumption', f'Блюдо #{menu_item_id}, порций: {count}')
+    result = db.session.execute(
+        db.update(OrderItem)
+        .where(OrderItem.id.in_(order_item_ids), OrderItem.is_cooked == False)
+        .values(is_cooked=True)
+        .execution_options(synchronize_session=False))
+    return result.rowcount == count
+
+
 def mark_order_item_cooked(order_item_id):
     oi = OrderItem.query.get(order_item_id)
     if oi and not oi.is_cooked:
-        ingredients = MenuItemIngredient.query.filter_by(menu_item_id=oi.menu_item_id).all()
-        for ing in ingredients:
-            prod = Product.query.get(ing.product_id)
-            if not prod or prod.quantity < ing.quantity:
-                return False
-        for ing in ingredients:
-            prod = Product.query.get(ing.product_id)
-            if prod:
-                prod.quantity = round(max(0, prod.quantity - ing.quantity), 2)
-        oi.is_cooked = True
+        if not _cook_order_items(oi.menu_item_id, [oi.id]):
+            db.session.rollback()
+            return False
         db.session.commit()
+        bump_menu_version()
+        publish_items_cooked([oi.id])
         return True
     return False
 
 
+# Готовит партию: все неготовые сегодняшние позиции блюда (или только
+# выбранные order_item_ids), начиная с самых ранних заказов. Если продуктов
+# хватает не на всех, готовится столько порций, сколько позволяет склад.
+# Одна транзакция и один commit на партию. Возвращает (сколько, ошибка).
+def cook_dish_batch(menu_item_id, meal_type=None, order_item_ids=None, limit=None):
+    query = db.session.query(OrderItem.id) \
+        .join(Order, Order.id == OrderItem.order_id) \
+        .filter(Order.date == date.today(), Order.is_prepared == False,
+                OrderItem.menu_item_id == menu_item_id, OrderItem.is_cooked == False)
+    if meal_type:
+        query = query.filter(Order.meal_type == meal_type)
+    if order_item_ids is not None:
+        query = query.filter(OrderItem.id.in_(list(order_item_ids)))
+    ids = [oi_id for (oi_id,) in query.order_by(Order.id, OrderItem.id).all()]
+    portions = get_portions_available([menu_item_id]).get(menu_item_id)
+    if limit is not None:
+        ids = ids[:max(0, limit)]
+    if portions is not None:
+        ids = ids[:portions]
+    if not ids:
+        return 0, 'Нет позиций для приготовления' if portions != 0 else 'Не хватает продуктов'
+    if not _cook_order_items(menu_item_id, ids):
+        db.session.rollback()
+        return 0, 'Не хватает продуктов'
+    db.session.commit()
+    bump_menu_version()
+    publish_items_cooked(ids)
+    return len(ids), None
+
+
 def is_order_fully_cooked(order_id):
     items = OrderItem.query.filter_by(order_id=order_id).all()
     if not items:
@@ -180,7 +423,10 @@ def is_order_fully_cooked(order_id):
 
 
 def create_custom_dish(name, price, category_id, ingredients_data, allergy_ids=None):
-    item = MenuItem(name=name, price=price, category_id=category_id, day_of_week=0, is_available=True)
+    for a_id in allergy_ids or []:
+        _check_allergy_id(a_id)
+    item = MenuItem(name=name, price=price, category_id=category_id, day_of_week=0, is_available=True,
+                    allergen_mask=allergen_mask(allergy_ids or []))
     db.session.add(item)
     db.session.commit()
     for prod_id, qty in ingredients_data:
@@ -191,6 +437,7 @@ def create_custom_dish(name, price, category_id, ingredients_data, allergy_ids=N
             mia = MenuItemAllergy(menu_item_id=item.id, allergy_id=a_id)
             db.session.add(mia)
     db.session.commit()
+    bump_menu_version()
     return item
 
 
@@ -198,18 +445,30 @@ def delete_menu_item(item_id):
     item = MenuItem.query.get(item_id)
     if not item:
         return False
+    # Резерв под неприготовленные порции удаляемых заказов (как в rebuild_reservations)
+    pending = db.session.query(db.func.count(OrderItem.id)) \
+        .join(Order, Order.id == OrderItem.order_id) \
+        .filter(OrderItem.menu_item_id == item_id, Order.date >= date.today(),
+                Order.is_prepared == False, OrderItem.is_cooked == False).scalar()
+    if pending:
+        release_stock([item_id] * pending)
     MenuItemIngredient.query.filter_by(menu_item_id=item_id).delete()
     MenuItemAllergy.query.filter_by(menu_item_id=item_id).delete()
     OrderItem.query.filter_by(menu_item_id=item_id).delete()
+    _forget_dish_ratings(item)
     db.session.delete(item)
     db.session.commit()
+    bump_menu_version()
     return True
 
 
 def add_product(name, quantity, unit, price=0):
     prod = Product(name=name, quantity=quantity, unit=unit, price=price)
     db.session.add(prod)
+    db.session.flush()
+    record_stock_movement(prod.id, quantity, 'receipt', 'Начальный остаток')
     db.session.commit()
+    bump_menu_version()
     return prod
 
 
@@ -220,14 +479,149 @@ def get_all_products():
 def update_product_quantity(product_id, quantity):
     prod = Product.query.get(product_id)
     if prod:
+        record_stock_movement(prod.id, quantity - (prod.quantity or 0), 'adjustment', 'Инвентаризация')
         prod.quantity = quantity
         db.session.commit()
+        bump_menu_version()
+
+
+# Запись в журнал движения продуктов (в текущей транзакции, без commit)
+def record_stock_movement(product_id, delta, kind, note=None):
+    if delta:
+        db.session.add(StockMovement(product_id=product_id, kind=kind, delta=delta, note=note))
+
+
+def get_stock_movements(product_id, limit=50):
+    return StockMovement.query.filter_by(product_id=product_id) \
+        .order_by(StockMovement.id.desc()).limit(limit).all()
+
+
+# Суммарная потребность в продуктах на порции блюд: {product_id: количество}
+def _recipe_totals(item_ids):
+    counts = Counter(item_ids)
+    totals = {}
+    rows = db.session.query(MenuItemIngredient.menu_item_id, MenuItemIngredient.product_id,
+                            MenuItemIngredient.quantity) \
+        .filter(MenuItemIngredient.menu_item_id.in_(list(counts))).all()
+    for menu_item_id, product_id, need in rows:
+        if product_id is not None:
+            totals[product_id] = totals.get(product_id, 0) + need * counts[menu_item_id]
+    return totals
+
+
+# Резервирует продукты под заказ в текущей транзакции. С guard=True резерв
+# не может превысить остаток: при нехватке возвращается None.
+# Возвращает id затронутых продуктов.
+def reserve_stock(item_ids, guard=True):
+    totals = _recipe_totals(item_ids)
+    for product_id, total in totals.items():
+        query = db.update(Product).where(Product.id == product_id)
+        if guard:
+            query = query.where(Product.quantity - db.func.coalesce(Product.reserved, 0) >= total - 1e-9)
+        result = db.session.execute(
+            query.values(reserved=db.func.coalesce(Product.reserved, 0) + total)
+            .execution_options(synchronize_session=False))
+        if guard and result.rowcount != 1:
+            return None
+    return list(totals)
+
+
+# Снимает резерв под порции блюд (в текущей транзакции, без commit)
+def release_stock(item_ids):
+    for product_id, total in _recipe_totals(item_ids).items():
+        db.session.execute(
+            db.update(Product).where(Product.id == product_id)
+            .values(reserved=db.case((Product.reserved > total, Product.reserved - total), else_=0))
+            .execution_options(synchronize_session=False))
+
+
+# После резерва пересобираем меню, только если какое-то блюдо на этих
+# продуктах перестало помещаться в свободный остаток.
+def _refresh_menu_after_reserve(product_ids):
+    catalog = _menu_cache['catalog']
+    if catalog is None or not product_ids:
+        return
+    item_ids = [item_id for (item_id,) in db.session.query(MenuItemIngredient.menu_item_id)
+                .filter(MenuItemIngredient.product_id.in_(product_ids)).distinct()]
+    portions = get_portions_available(item_ids, free=True)
+    if any(left < 1 and item_id not in catalog['unavailable_ids'] for item_id, left in portions.items()):
+        bump_menu_version()
+
+
+# Пересчёт резерва с нуля по неготовым позициям сегодняшних и будущих
+# заказов; снимает резерв с заказов прошлых дней, которые так и не выдали.
+# Сначала обнуляем резерв: эта запись блокирует продукты, поэтому заказ,
+# оформляемый параллельно, либо уже виден в подсчёте, либо добавит свой
+# резерв поверх нового значения после commit.
+def rebuild_reservations():
+    db.session.execute(db.update(Product).values(reserved=0))
+    rows = db.session.query(MenuItemIngredient.product_id, db.func.sum(MenuItemIngredient.quantity)) \
+        .join(OrderItem, OrderItem.menu_item_id == MenuItemIngredient.menu_item_id) \
+        .join(Order, Order.id == OrderItem.order_id) \
+        .filter(Order.date >= date.today(), Order.is_prepared == False, OrderItem.is_cooked == False) \
+        .group_by(MenuItemIngredient.product_id).all()
+    reserved = {product_id: total for product_id, total in rows}
+    if reserved:
+        db.session.execute(db.update(Product), [{'id': product_id, 'reserved': total}
+                                                for product_id, total in reserved.items()])
+    db.session.commit()
+    bump_menu_version()
+
+
+# Снимок остатков всех продуктов на текущий конец журнала
+def take_stock_snapshot(day=None):
+    last_id = db.session.query(db.func.max(StockMovement.id)).scalar() or 0
+    rows = [{'product_id': product_id, 'movement_id': last_id, 'quantity': quantity or 0,
+             'date': day or date.today()}
+            for product_id, quantity in db.session.query(Product.id, Product.quantity).all()]
+    if rows:
+        db.session.execute(db.insert(StockSnapshot), rows)
+    db.session.commit()
+
+
+# Раз в день: снимок склада и пересчёт резервов. Запускается при старте
+# приложения и из daily.py (cron); повторный вызов за тот же день ничего
+# не делает. Возвращает True, если снимок сделан сейчас.
+def ensure_daily_stock_snapshot():
+    today = date.today()
+    if db.session.query(StockSnapshot.id).filter(StockSnapshot.date == today).first() is not None:
+        return False
+    rebuild_reservations()
+    try:
+        take_stock_snapshot(today)
+    except IntegrityError:
+        # Снимок за сегодня успел сделать другой процесс
+        db.session.rollback()
+        return False
+    return True
+
+
+# Остаток продукта на момент moment: последний снимок до этого дня плюс
+# движения после него.
+def get_stock_at(product_id, moment):
+    snapshot = StockSnapshot.query \
+        .filter(StockSnapshot.product_id == product_id, StockSnapshot.date < moment.date()) \
+        .order_by(StockSnapshot.movement_id.desc()).first()
+    base, after_id = (snapshot.quantity, snapshot.movement_id) if snapshot else (0, 0)
+    delta = db.session.query(db.func.coalesce(db.func.sum(StockMovement.delta), 0)) \
+        .filter(StockMovement.product_id == product_id, StockMovement.id > after_id,
+                StockMovement.date <= moment).scalar()
+    return base + delta
+
+
+def get_ingredients_by_item():
+    ingredients = MenuItemIngredient.query.options(db.joinedload(MenuItemIngredient.product)).all()
+    result = {}
+    for ing in ingredients:
+        result.setdefault(ing.menu_item_id, []).append(ing)
+    return result
 
 
 def add_ingredient(menu_item_id, product_id, quantity):
     ing = MenuItemIngredient(menu_item_id=menu_item_id, product_id=product_id, quantity=quantity)
     db.session.add(ing)
     db.session.commit()
+    bump_menu_version()
 
 
 def get_subscription(user_id, meal_type):
@@ -260,18 +654,164 @@ def create_order(user_id, meal_type, item_ids, is_subscription=False):
     db.session.add(order)
     db.session.commit()
     total = 0
+    ordered = []
     for item_id in item_ids:
         item = MenuItem.query.get(item_id)
         if item:
             oi = OrderItem(order_id=order.id, menu_item_id=item_id, price=item.price)
             db.session.add(oi)
+            ordered.append(item_id)
             total += item.price
+    reserved = reserve_stock(ordered, guard=False)
+    record_daily_stats(today, **{MEAL_ORDER_COLUMNS.get(meal_type, 'lunch_orders'): 1})
+    record_dish_orders(today, ordered)
     db.session.commit()
+    _refresh_menu_after_reserve(reserved)
+    publish_order_created(order)
     return order, total
 
 
-def get_user_orders(user_id):
-    return Order.query.filter_by(user_id=user_id).order_by(Order.created_at.desc()).all()
+MEAL_PRICES = {'breakfast': 100, 'lunch': 150}
+
+
+# Оформление заказа одной транзакцией: проверка блюд, списание баланса или
+# абонемента, заказ с позициями, платёж и уведомления — один commit.
+# Возвращает (order, total, error); при ошибке ничего не записывается.
+def place_order(user_id, meal_type, item_ids, use_sub=False):
+    unavailable = get_menu_catalog()['unavailable_ids']
+    if any(item_id in unavailable for item_id in item_ids):
+        return None, 0, 'Одно из выбранных блюд недоступно'
+
+    menu_items = {i.id: i for i in MenuItem.query.filter(MenuItem.id.in_(item_ids)).all()}
+    items = [menu_items[item_id] for item_id in item_ids if item_id in menu_items]
+    total = sum(i.price for i in items)
+
+    user_mask = _as_user(user_id).allergen_mask or 0
+    conflict = next((i for i in items if (i.allergen_mask or 0) & user_mask), None)
+    if conflict:
+        return None, 0, f'В блюде «{conflict.name}» есть ваш аллерген'
+
+    if use_sub:
+        if get_subscription_orders_count_for_day(user_id, meal_type, date.today()) >= 1:
+            return None, 0, 'Вы уже использовали абонемент на этот прием пищи сегодня'
+        charged = Subscription.query \
+            .filter(Subscription.user_id == user_id, Subscription.meal_type == meal_type,
+                    Subscription.meals_left >= 1) \
+            .update({Subscription.meals_left: Subscription.meals_left - 1}, synchronize_session=False)
+        if not charged:
+            db.session.rollback()
+            return None, 0, 'Нет доступных посещений в абонементе'
+        text = f'Заказ по абонементу оформлен ({MEAL_PRICES.get(meal_type, 100)} руб).'
+    else:
+        charged = User.query \
+            .filter(User.id == user_id, User.balance >= total) \
+            .update({User.balance: User.balance - total}, synchronize_session=False)
+        if not charged:
+            db.session.rollback()
+            return None, 0, 'Недостаточно средств'
+        db.session.add(Payment(user_id=user_id, amount=total, payment_type='purchase'))
+        record_daily_stats(date.today(), purchases=total)
+        text = f'Заказ на {total} руб. оформлен!'
+
+    reserved = reserve_stock([i.id for i in items])
+    if reserved is None:
+        db.session.rollback()
+        bump_menu_version()
+        return None, 0, 'Одно из выбранных блюд закончилось'
+
+    order = Order(user_id=user_id, date=date.today(), meal_type=meal_type, is_subscription=use_sub)
+    order.items = [OrderItem(menu_item_id=i.id, price=i.price) for i in items]
+    db.session.add(order)
+    db.session.flush()
+    record_daily_stats(order.date, **{MEAL_ORDER_COLUMNS.get(meal_type, 'lunch_orders'): 1})
+    record_dish_orders(order.date, [i.id for i in items])
+
+    db.session.add(Notification(user_id=user_id, text=text))
+    broadcast_notification('cook', f'Новый заказ #{order.id}', commit=False)
+    db.session.commit()
+    _refresh_menu_after_reserve(reserved)
+    publish_order_created(order)
+    return order, total, None
+
+
+# События для экрана кухни (/cook/stream). Данные собираются только если
+# кто-то подписан, и только после commit.
+def publish_order_created(order):
+    if not has_subscribers(KITCHEN_CHANNEL):
+        return
+    portions = get_portions_available({oi.menu_item_id for oi in order.items})
+    publish(KITCHEN_CHANNEL, 'order_created', {
+        'id': order.id,
+        'time': order.created_at.strftime('%H:%M'),
+        'user': order.user.full_name or order.user.username,
+        'meal_type': order.meal_type,
+        'items': [{
+            'id': oi.id,
+            'menu_item_id': oi.menu_item_id,
+            'name': oi.menu_item.name,
+            'portions': portions.get(oi.menu_item_id),
+        } for oi in order.items],
+    })
+
+
+def publish_items_cooked(order_item_ids):
+    if not has_subscribers(KITCHEN_CHANNEL):
+        return
+    order_ids = db.session.query(OrderItem.order_id).filter(OrderItem.id.in_(list(order_item_ids))).distinct()
+    not_ready = db.session.query(OrderItem.order_id) \
+        .filter(OrderItem.order_id.in_(order_ids), OrderItem.is_cooked == False)
+    ready = db.session.query(Order.id).filter(Order.id.in_(order_ids), Order.id.not_in(not_ready)).all()
+    publish(KITCHEN_CHANNEL, 'items_cooked', {
+        'items': list(order_item_ids),
+        'ready_orders': [order_id for (order_id,) in ready],
+        'portions': get_portions_available(),
+    })
+
+
+# Версия данных страницы ученика: баланс, абонементы, аллергии и статусы
+# заказов. Меняется при любом изменении, видимом на странице (для ETag).
+def get_student_watermark(user):
+    user = _as_user(user)
+    orders = db.session.query(db.func.count(Order.id), db.func.max(Order.id),
+                              db.func.count(db.case((Order.is_prepared == True, 1))),
+                              db.func.count(db.case((Order.is_received == True, 1)))) \
+        .filter(Order.user_id == user.id).one()
+    subs = sorted((s.id, s.meals_left) for s in user.subscriptions)
+    return (user.balance, user.full_name, user.class_name), tuple(orders), tuple(subs), user.allergen_mask
+
+
+# Постраничный вывод по ключу (keyset): следующая страница — строки,
+# которые в порядке сортировки идут после последней показанной, без OFFSET.
+# Курсор — id последней строки страницы; columns — ключ сортировки,
+# последним идёт id. Стоимость страницы зависит от её размера, а не от
+# длины истории.
+PAGE_SIZE = 20
+
+Page = namedtuple('Page', 'items cursor')
+
+
+def _page(rows, limit):
+    return Page(rows[:limit], rows[limit - 1].id if len(rows) > limit else None)
+
+
+def keyset_page(query, columns, cursor=None, limit=PAGE_SIZE, descending=True):
+    if cursor is not None:
+        if len(columns) == 1:
+            key = (cursor,)
+        else:
+            key = db.session.query(*columns).filter(columns[-1] == cursor).first()
+        if key is not None:
+            bound = db.tuple_(*columns) if len(columns) > 1 else columns[0]
+            value = db.tuple_(*key) if len(columns) > 1 else key[0]
+            query = query.filter(bound < value if descending else bound > value)
+    order = [c.desc() if descending else c.asc() for c in columns]
+    return _page(query.order_by(*order).limit(limit + 1).all(), limit)
+
+
+def get_user_orders(user_id, cursor=None, limit=PAGE_SIZE):
+    query = Order.query.filter_by(user_id=user_id) \
+        .options(db.selectinload(Order.items).joinedload(OrderItem.menu_item))
+    return keyset_page(query, (Order.created_at, Order.id), cursor, limit)
 
 
 def get_order_items(order_id):
@@ -285,7 +825,62 @@ def get_today_orders():
 
 def get_orders_to_prepare():
     today = date.today()
-    return Order.query.filter_by(date=today, is_prepared=False).all()
+    return Order.query.filter_by(date=today, is_prepared=False) \
+        .options(db.joinedload(Order.user),
+                 db.selectinload(Order.items).joinedload(OrderItem.menu_item)) \
+        .order_by(Order.id).all()
+
+
+# Заказы за день по типам питания и статусам одним запросом
+def get_today_order_counts(day=None):
+    day = day or date.today()
+    row = db.session.query(
+        db.func.count(db.case((Order.meal_type == 'breakfast', 1))),
+        db.func.count(db.case((Order.meal_type == 'lunch', 1))),
+        db.func.count(db.case((Order.is_prepared == True, 1))),
+        db.func.count(db.case((Order.is_received == True, 1))),
+    ).filter(Order.date == day).one()
+    return dict(zip(('breakfast', 'lunch', 'prepared', 'received'), row))
+
+
+PlanDish = namedtuple('PlanDish', 'menu_item_id name meal_type portions can_make')
+PlanIngredient = namedtuple('PlanIngredient', 'product_id name unit required stock shortage')
+
+
+# План производства: сколько порций каждого блюда ещё нужно приготовить
+# сегодня (GROUP BY по неготовым позициям) и сколько продуктов на это уйдёт
+# в сравнении с остатками на складе.
+def get_production_plan(day=None):
+    day = day or date.today()
+    pending = db.session.query(OrderItem.menu_item_id, MenuItem.name, Order.meal_type,
+                               db.func.count(OrderItem.id)) \
+        .join(Order, Order.id == OrderItem.order_id) \
+        .join(MenuItem, MenuItem.id == OrderItem.menu_item_id) \
+        .filter(Order.date == day, Order.is_prepared == False, OrderItem.is_cooked == False) \
+        .group_by(OrderItem.menu_item_id, MenuItem.name, Order.meal_type) \
+        .order_by(Order.meal_type, db.func.count(OrderItem.id).desc(), MenuItem.name).all()
+
+    totals = {}
+    for menu_item_id, _, _, count in pending:
+        totals[menu_item_id] = totals.get(menu_item_id, 0) + count
+    portions = get_portions_available(totals.keys())
+    dishes = [PlanDish(menu_item_id, name, meal_type, count, portions.get(menu_item_id))
+              for menu_item_id, name, meal_type, count in pending]
+
+    required = {}
+    if totals:
+        recipe = db.session.query(MenuItemIngredient.menu_item_id, MenuItemIngredient.quantity,
+                                  Product.id, Product.name, Product.unit, Product.quantity) \
+            .join(Product, Product.id == MenuItemIngredient.product_id) \
+            .filter(MenuItemIngredient.menu_item_id.in_(list(totals))).all()
+        for menu_item_id, need, product_id, name, unit, stock in recipe:
+            entry = required.setdefault(product_id, [name, unit, 0.0, stock])
+            entry[2] += need * totals[menu_item_id]
+    ingredients = sorted(
+        (PlanIngredient(product_id, name, unit, round(need, 2), stock, round(max(0, need - stock), 2))
+         for product_id, (name, unit, need, stock) in required.items()),
+        key=lambda ing: (-ing.shortage, ing.name))
+    return {'dishes': dishes, 'ingredients': ingredients}
 
 
 def mark_order_prepared(order_id):
@@ -296,6 +891,7 @@ def mark_order_prepared(order_id):
             return False
         order.is_prepared = True
         db.session.commit()
+        publish(KITCHEN_CHANNEL, 'order_prepared', {'id': order_id})
         return True
     return False
 
@@ -304,7 +900,13 @@ def mark_order_received(order_id, user_id):
     order = Order.query.get(order_id)
     if order and order.user_id == user_id and order.is_prepared and not order.is_received:
         order.is_received = True
+        record_daily_stats(order.date, received_orders=1)
+        class_name = db.session.query(User.class_name).filter(User.id == order.user_id).scalar()
+        increment_rollup(AttendanceRollup,
+                         {'date': order.date, 'class_name': class_name or '', 'meal_type': order.meal_type},
+                         {'received': 1})
         db.session.commit()
+        publish(KITCHEN_CHANNEL, 'order_received', {'id': order_id})
         return True
     return False
 
@@ -312,6 +914,8 @@ def mark_order_received(order_id, user_id):
 def add_payment(user_id, amount, payment_type):
     payment = Payment(user_id=user_id, amount=amount, payment_type=payment_type)
     db.session.add(payment)
+    if payment_type in PAYMENT_COLUMNS:
+        record_daily_stats(date.today(), **{PAYMENT_COLUMNS[payment_type]: amount})
     db.session.commit()
     return payment
 
@@ -336,18 +940,148 @@ def subtract_balance(user_id, amount):
 
 
 def add_review(user_id, menu_item_id, text, rating):
+    rating = min(5, max(1, int(rating)))
     review = Review(user_id=user_id, menu_item_id=menu_item_id, text=text, rating=rating)
     db.session.add(review)
+    record_dish_rating(menu_item_id, rating)
     db.session.commit()
     return review
 
 
+RATING_STARS = (1, 2, 3, 4, 5)
+TOP_RATED_MIN_REVIEWS = 2
+
+DishRatingSummary = namedtuple('DishRatingSummary', 'menu_item_id name reviews average histogram')
+
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+# Одно блюдо заведено строкой MenuItem на каждый день недели. Сводки оценок
+# ведутся по каноническому id — наименьшему id среди строк с тем же названием.
+# Возвращает {menu_item_id: канонический id}; без item_ids — для всех блюд.
+def canonical_dish_ids(item_ids=None):
+    canonical = db.session.query(MenuItem.name, db.func.min(MenuItem.id).label('dish_id')) \
+        .group_by(MenuItem.name).subquery()
+    query = db.session.query(MenuItem.id, canonical.c.dish_id).join(canonical, canonical.c.name == MenuItem.name)
+    if item_ids is not None:
+        query = query.filter(MenuItem.id.in_(list(item_ids)))
+    return dict(query.all())
+
+
+# Обновляет сводки оценок в текущей транзакции
+def record_dish_rating(menu_item_id, rating, day=None, count=1):
+    dish_id = canonical_dish_ids([menu_item_id]).get(menu_item_id, menu_item_id)
+    increment_rollup(DishRating, {'menu_item_id': dish_id},
+                     {'reviews': count, 'rating_sum': rating * count, f'stars_{rating}': count})
+    increment_rollup(DishRatingWeek, {'week': week_start(day or date.today()), 'menu_item_id': dish_id},
+                     {'reviews': count, 'rating_sum': rating * count})
+
+
+# Средняя оценка и число отзывов по всем строкам блюда: {menu_item_id: (среднее, отзывов)}
+def get_dish_ratings(item_ids):
+    dish_ids = canonical_dish_ids(item_ids)
+    rows = db.session.query(DishRating.menu_item_id, DishRating.rating_sum, DishRating.reviews) \
+        .filter(DishRating.menu_item_id.in_(set(dish_ids.values())), DishRating.reviews > 0).all()
+    ratings = {dish_id: (round(total / count, 1), count) for dish_id, total, count in rows}
+    return {item_id: ratings[dish_id] for item_id, dish_id in dish_ids.items() if dish_id in ratings}
+
+
+# Перед удалением строки блюда (в текущей транзакции): её отзывы уходят из
+# сводок, как при пересчёте, а если строка была канонической — сводки
+# переезжают на следующую строку с тем же названием.
+def _forget_dish_ratings(item):
+    for day, rating, count in db.session.query(db.func.date(Review.date), Review.rating, db.func.count(Review.id)) \
+            .filter(Review.menu_item_id == item.id, Review.rating.between(1, 5)) \
+            .group_by(db.func.date(Review.date), Review.rating):
+        record_dish_rating(item.id, rating, _as_date(day), count=-count)
+    next_id = db.session.query(db.func.min(MenuItem.id)) \
+        .filter(MenuItem.name == item.name, MenuItem.id != item.id).scalar()
+    if next_id is None:
+        DishRating.query.filter_by(menu_item_id=item.id).delete()
+        DishRatingWeek.query.filter_by(menu_item_id=item.id).delete()
+    elif next_id > item.id:
+        DishRating.query.filter_by(menu_item_id=item.id).update({DishRating.menu_item_id: next_id})
+        DishRatingWeek.query.filter_by(menu_item_id=item.id).update({DishRatingWeek.menu_item_id: next_id})
+
+
+def get_rating_summary():
+    stars = [getattr(DishRating, f'stars_{n}') for n in RATING_STARS]
+    rows = db.session.query(DishRating.menu_item_id, MenuItem.name, DishRating.reviews, DishRating.rating_sum, *stars) \
+        .join(MenuItem, MenuItem.id == DishRating.menu_item_id) \
+        .filter(DishRating.reviews > 0).all()
+    result = [DishRatingSummary(item_id, name, count, round(total / count, 1), dict(zip(RATING_STARS, histogram)))
+              for item_id, name, count, total, *histogram in rows]
+    result.sort(key=lambda r: (-r.average, -r.reviews, r.name))
+    return result
+
+
+def get_top_rated_week(limit=5, day=None):
+    average = DishRatingWeek.rating_sum * 1.0 / DishRatingWeek.reviews
+    rows = db.session.query(DishRatingWeek.menu_item_id, MenuItem.name, DishRatingWeek.reviews, average) \
+        .join(MenuItem, MenuItem.id == DishRatingWeek.menu_item_id) \
+        .filter(DishRatingWeek.week == week_start(day or date.today()),
+                DishRatingWeek.reviews >= TOP_RATED_MIN_REVIEWS) \
+        .order_by(average.desc(), DishRatingWeek.reviews.desc(), MenuItem.name).limit(limit).all()
+    return [DishRatingSummary(item_id, name, count, round(avg, 1), None) for item_id, name, count, avg in rows]
+
+
+# Пересчёт сводок оценок с нуля по всем отзывам (отзывы на удалённые
+# строки блюд не учитываются)
+def rebuild_dish_ratings():
+    dish_ids = canonical_dish_ids()
+    stars = [db.func.sum(db.case((Review.rating == n, 1), else_=0)) for n in RATING_STARS]
+    totals = {}
+    for item_id, count, total, *histogram in db.session.query(
+            Review.menu_item_id, db.func.count(Review.id), db.func.sum(Review.rating), *stars) \
+            .filter(Review.menu_item_id.isnot(None), Review.rating.between(1, 5)) \
+            .group_by(Review.menu_item_id):
+        if item_id in dish_ids:
+            row = totals.setdefault(dish_ids[item_id], [0] * (2 + len(RATING_STARS)))
+            for i, value in enumerate([count, total, *histogram]):
+                row[i] += value
+    weeks = {}
+    for day, item_id, count, total in db.session.query(
+            db.func.date(Review.date), Review.menu_item_id, db.func.count(Review.id), db.func.sum(Review.rating)) \
+            .filter(Review.menu_item_id.isnot(None), Review.rating.between(1, 5)) \
+            .group_by(db.func.date(Review.date), Review.menu_item_id):
+        if item_id in dish_ids:
+            row = weeks.setdefault((week_start(_as_date(day)), dish_ids[item_id]), [0, 0])
+            row[0] += count
+            row[1] += total
+    DishRating.query.delete()
+    DishRatingWeek.query.delete()
+    if totals:
+        db.session.execute(db.insert(DishRating), [
+            dict({'menu_item_id': dish_id, 'reviews': count, 'rating_sum': total},
+                 **{f'stars_{n}': value for n, value in zip(RATING_STARS, histogram)})
+            for dish_id, (count, total, *histogram) in totals.items()])
+    if weeks:
+        db.session.execute(db.insert(DishRatingWeek), [
+            {'week': week, 'menu_item_id': item_id, 'reviews': count, 'rating_sum': total}
+            for (week, item_id), (count, total) in weeks.items()])
+    db.session.commit()
+
+
 def get_reviews(menu_item_id):
     return Review.query.filter_by(menu_item_id=menu_item_id).order_by(Review.date.desc()).all()
 
 
-def get_all_reviews():
-    return Review.query.order_by(Review.date.desc()).all()
+def get_all_reviews(cursor=None, limit=PAGE_SIZE):
+    query = Review.query.options(db.joinedload(Review.user), db.joinedload(Review.menu_item))
+    return keyset_page(query, (Review.id,), cursor, limit)
+
+
+# Блюда для формы отзыва: канонический id и название, по одному на блюдо
+def get_menu_item_choices():
+    return db.session.query(db.func.min(MenuItem.id), MenuItem.name) \
+        .group_by(MenuItem.name).order_by(MenuItem.name).all()
+
+
+def get_reviews_watermark():
+    last_id = db.select(db.func.max(Review.id)).scalar_subquery()
+    return tuple(db.session.query(db.func.sum(DishRating.reviews), last_id).one())
 
 
 def add_purchase_request(product_id, quantity, user_id):
@@ -357,8 +1091,10 @@ def add_purchase_request(product_id, quantity, user_id):
     return req
 
 
+# Заявки на рассмотрении, включая черновики из прогноза (status='draft')
 def get_pending_requests():
-    return PurchaseRequest.query.filter_by(status='pending').all()
+    return PurchaseRequest.query.filter(PurchaseRequest.status.in_(('pending', 'draft'))) \
+        .order_by(PurchaseRequest.date).all()
 
 
 def get_all_requests():
@@ -368,11 +1104,16 @@ def get_all_requests():
 def approve_request(request_id):
     req = PurchaseRequest.query.get(request_id)
     if req:
+        was_approved = req.status == 'approved'
         req.status = 'approved'
         prod = Product.query.get(req.product_id)
-        if prod:
+        if prod and not was_approved:
+            req.approved_at = datetime.now()
             prod.quantity += req.quantity
+            record_stock_movement(prod.id, req.quantity, 'receipt', f'Заявка #{req.id}')
+            record_daily_stats(req.approved_at.date(), expenses=req.quantity * prod.price)
         db.session.commit()
+        bump_menu_version()
         return True
     return False
 
@@ -393,59 +1134,223 @@ def add_notification(user_id, text):
     return notif
 
 
-def get_notifications(user_id):
-    return Notification.query.filter_by(user_id=user_id).order_by(Notification.date.desc()).all()
+# Несколько персональных уведомлений одной вставкой: items — пары (user_id, text)
+def add_notifications(items, commit=True):
+    rows = [{'user_id': user_id, 'text': text} for user_id, text in items]
+    if rows:
+        db.session.execute(db.insert(Notification), rows)
+    if commit:
+        db.session.commit()
+    return len(rows)
+
+
+# Одна строка на всю роль вместо копии для каждого сотрудника
+def broadcast_notification(role, text, commit=True):
+    notif = Notification(role=role, text=text)
+    db.session.add(notif)
+    if commit:
+        db.session.commit()
+    return notif
+
+
+def get_latest_broadcast_id(role):
+    return db.session.query(db.func.max(Notification.id)).filter(Notification.role == role).scalar() or 0
+
+
+def _unread_filter(user):
+    return db.or_(
+        db.and_(Notification.user_id == user.id, Notification.is_read == False),
+        db.and_(Notification.role == user.role, Notification.id > (user.notif_cursor or 0)),
+    )
+
+
+# Личные уведомления и рассылки роли читаются двумя проходами по индексам
+# (user_id, id) и (role, id) и сливаются — без сортировки всей истории
+def get_notifications(user_id, cursor=None, limit=PAGE_SIZE):
+    user = _as_user(user_id)
+    rows = []
+    for condition in (Notification.user_id == user.id, Notification.role == user.role):
+        rows += keyset_page(Notification.query.filter(condition), (Notification.id,), cursor, limit + 1).items
+    rows.sort(key=lambda n: n.id, reverse=True)
+    return _page(rows, limit)
+
+
+def is_unread(notification, user):
+    if notification.role is not None:
+        return notification.id > (user.notif_cursor or 0)
+    return not notification.is_read
+
+
+def get_users(cursor=None, limit=PAGE_SIZE):
+    return keyset_page(User.query, (User.id,), cursor, limit, descending=False)
+
+
+def count_users():
+    return db.session.query(db.func.count(User.id)).scalar()
 
 
 def get_unread_notifications(user_id):
-    return Notification.query.filter_by(user_id=user_id, is_read=False).all()
+    user = _as_user(user_id)
+    return Notification.query.filter(_unread_filter(user)).all()
+
 
+def count_unread_notifications(user_id):
+    user = _as_user(user_id)
+    if not user:
+        return 0
+    return db.session.query(db.func.count(Notification.id)).filter(_unread_filter(user)).scalar()
 
-def mark_notification_read(notif_id):
+
+def mark_notification_read(notif_id, user_id=None):
     notif = Notification.query.get(notif_id)
-    if notif:
+    if not notif:
+        return
+    if notif.role is not None and user_id is not None:
+        user = User.query.get(user_id)
+        if user and user.role == notif.role:
+            user.notif_cursor = max(user.notif_cursor or 0, notif.id)
+    else:
         notif.is_read = True
-        db.session.commit()
+    db.session.commit()
 
 
 def mark_all_notifications_read(user_id):
-    notifs = Notification.query.filter_by(user_id=user_id, is_read=False).all()
-    for n in notifs:
-        n.is_read = True
+    user = _as_user(user_id)
+    Notification.query.filter_by(user_id=user.id, is_read=False) \
+        .update({Notification.is_read: True}, synchronize_session=False)
+    user.notif_cursor = max(user.notif_cursor or 0, get_latest_broadcast_id(user.role))
     db.session.commit()
 
 
+PAYMENT_COLUMNS = {'deposit': 'deposits', 'subscription': 'subscriptions', 'purchase': 'purchases'}
+MEAL_ORDER_COLUMNS = {'breakfast': 'breakfast_orders', 'lunch': 'lunch_orders'}
+
+
+# Атомарно прибавляет значения к строке сводной таблицы (создаёт её при
+# необходимости) в текущей транзакции, без чтения и без отдельного commit.
+def increment_rollup(model, keys, deltas):
+    table = model.__table__
+    values = dict(keys)
+    values.update(deltas)
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        row = db.session.get(model, tuple(keys.values()) if len(keys) > 1 else next(iter(keys.values())))
+        if row is None:
+            db.session.add(model(**values))
+        else:
+            for col, delta in deltas.items():
+                setattr(row, col, (getattr(row, col) or 0) + delta)
+        return
+    stmt = insert(table).values(**values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={col: table.c[col] + stmt.excluded[col] for col in deltas},
+    )
+    db.session.execute(stmt)
+
+
+def record_daily_stats(day, **deltas):
+    increment_rollup(DailyStats, {'date': day}, deltas)
+
+
+def record_dish_orders(day, item_ids):
+    for menu_item_id, count in Counter(item_ids).items():
+        increment_rollup(DishDailyOrders, {'date': day, 'menu_item_id': menu_item_id}, {'orders': count})
+
+
+def _as_date(value):
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+# Пересчёт дневных итогов с нуля по исходным таблицам (GROUP BY по дням)
+def rebuild_daily_stats():
+    days = {}
+
+    def row(day):
+        return days.setdefault(_as_date(day), {})
+
+    payments = db.session.query(db.func.date(Payment.date), Payment.payment_type, db.func.sum(Payment.amount)) \
+        .group_by(db.func.date(Payment.date), Payment.payment_type).all()
+    for day, payment_type, amount in payments:
+        if payment_type in PAYMENT_COLUMNS:
+            row(day)[PAYMENT_COLUMNS[payment_type]] = amount or 0
+
+    orders = db.session.query(Order.date, Order.meal_type, db.func.count(Order.id),
+                              db.func.sum(db.case((Order.is_received == True, 1), else_=0))) \
+        .group_by(Order.date, Order.meal_type).all()
+    for day, meal_type, count, received in orders:
+        r = row(day)
+        column = MEAL_ORDER_COLUMNS.get(meal_type, 'lunch_orders')
+        r[column] = r.get(column, 0) + count
+        r['received_orders'] = r.get('received_orders', 0) + (received or 0)
+
+    # Заявки, одобренные до появления approved_at, относятся к дню создания
+    approved_day = db.func.date(db.func.coalesce(PurchaseRequest.approved_at, PurchaseRequest.date))
+    expenses = db.session.query(approved_day, db.func.sum(PurchaseRequest.quantity * Product.price)) \
+        .join(Product, Product.id == PurchaseRequest.product_id) \
+        .filter(PurchaseRequest.status == 'approved') \
+        .group_by(approved_day).all()
+    for day, amount in expenses:
+        row(day)['expenses'] = amount or 0
+
+    DailyStats.query.delete()
+    db.session.add_all([DailyStats(date=day, **values) for day, values in days.items()])
+
+    dish_orders = db.session.query(Order.date, OrderItem.menu_item_id, db.func.count(OrderItem.id)) \
+        .join(Order, Order.id == OrderItem.order_id) \
+        .group_by(Order.date, OrderItem.menu_item_id).all()
+    DishDailyOrders.query.delete()
+    if dish_orders:
+        db.session.execute(db.insert(DishDailyOrders), [
+            {'date': _as_date(day), 'menu_item_id': menu_item_id, 'orders': count}
+            for day, menu_item_id, count in dish_orders])
+    db.session.commit()
+
+
+# Дневные итоги для базы, где их ещё не считали (вызывается при запуске)
+def ensure_daily_stats():
+    if db.session.query(DailyStats.date).first() is None:
+        rebuild_daily_stats()
+
+
 def get_payments_stats():
-    deposits = Payment.query.filter_by(payment_type='deposit').all()
-    subscriptions = Payment.query.filter_by(payment_type='subscription').all()
-    purchases = Payment.query.filter_by(payment_type='purchase').all()
+    deposits, subscriptions, purchases = db.session.query(
+        db.func.coalesce(db.func.sum(DailyStats.deposits), 0),
+        db.func.coalesce(db.func.sum(DailyStats.subscriptions), 0),
+        db.func.coalesce(db.func.sum(DailyStats.purchases), 0),
+    ).one()
     return {
-        'deposits': sum(p.amount for p in deposits),
-        'subscriptions': sum(p.amount for p in subscriptions),
-        'purchases': sum(p.amount for p in purchases),
-        'total_income': sum(p.amount for p in subscriptions) + sum(p.amount for p in purchases)
+        'deposits': deposits,
+        'subscriptions': subscriptions,
+        'purchases': purchases,
+        'total_income': subscriptions + purchases
     }
 
 
 def get_orders_stats():
-    today = date.today()
-    all_orders = Order.query.all()
-    today_orders = Order.query.filter_by(date=today).all()
+    today = db.session.get(DailyStats, date.today())
+    breakfast, lunch, received = db.session.query(
+        db.func.coalesce(db.func.sum(DailyStats.breakfast_orders), 0),
+        db.func.coalesce(db.func.sum(DailyStats.lunch_orders), 0),
+        db.func.coalesce(db.func.sum(DailyStats.received_orders), 0),
+    ).one()
     return {
-        'total': len(all_orders),
-        'today': len(today_orders),
-        'received': len([o for o in all_orders if o.is_received])
+        'total': breakfast + lunch,
+        'today': (today.breakfast_orders + today.lunch_orders) if today else 0,
+        'received': received,
+        'breakfast': breakfast,
+        'lunch': lunch,
+        'breakfast_today': today.breakfast_orders if today else 0,
+        'lunch_today': today.lunch_orders if today else 0,
     }
 
 
 def get_expenses():
-    approved = PurchaseRequest.query.filter_by(status='approved').all()
-    total = 0
-    for req in approved:
-        prod = Product.query.get(req.product_id)
-        if prod:
-            total += req.quantity * prod.price
-    return total
+    return db.session.query(db.func.coalesce(db.func.sum(DailyStats.expenses), 0)).scalar()
 
 
 def get_subscription_orders_count_for_day(user_id, meal_type, day=None):
@@ -459,26 +1364,10 @@ def get_subscription_orders_count_for_day(user_id, meal_type, day=None):
     ).count()
 
 
-def get_attendance_stats():
-    orders = Order.query.filter_by(is_received=True).all()
-    by_date = {}
-    by_class = {}
-    by_meal = {'breakfast': 0, 'lunch': 0}
-    for o in orders:
-        date_str = o.date.strftime('%d.%m.%Y')
-        if date_str not in by_date:
-            by_date[date_str] = {'breakfast': 0, 'lunch': 0, 'total': 0}
-        by_date[date_str][o.meal_type] += 1
-        by_date[date_str]['total'] += 1
-        by_meal[o.meal_type] += 1
-        user = User.query.get(o.user_id)
-        if user and user.class_name:
-            if user.class_name not in by_class:
-                by_class[user.class_name] = {'breakfast': 0, 'lunch': 0, 'total': 0}
-            by_class[user.class_name][o.meal_type] += 1
-            by_class[user.class_name]['total'] += 1
-    return {'by_date': by_date, 'by_class': by_class, 'by_meal': by_meal, 'total': len(orders)}
-
-
-def get_issued_orders():
-    return Order.query.filter_by(is_received=True).order_by(Order.created_at.desc()).all()
+def get_issued_orders(day=None):
+    query = Order.query.filter_by(is_received=True)
+    if day is not None:
+        query = query.filter_by(date=day)
+    return query.options(db.joinedload(Order.user),
+                         db.selectinload(Order.items).joinedload(OrderItem.menu_item)) \
+        .order_by(Order.created_at.desc()).all()
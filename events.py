@@ -0,0 +1,58 @@
+import json
+import queue
+import threading
+
+# Простая шина событий внутри процесса для Server-Sent Events.
+# Каждый подписчик (открытая вкладка) получает свою очередь; медленным
+# клиентам события не копятся бесконечно — лишние отбрасываются.
+KITCHEN_CHANNEL = 'kitchen'
+SUBSCRIBER_QUEUE_SIZE = 200
+KEEPALIVE_SECONDS = 15
+
+_subscribers = {}
+_lock = threading.Lock()
+
+
+def subscribe(channel):
+    q = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+    with _lock:
+        _subscribers.setdefault(channel, set()).add(q)
+    return q
+
+
+def unsubscribe(channel, q):
+    with _lock:
+        _subscribers.get(channel, set()).discard(q)
+
+
+def has_subscribers(channel):
+    return bool(_subscribers.get(channel))
+
+
+def publish(channel, event, data):
+    with _lock:
+        targets = list(_subscribers.get(channel, ()))
+    for q in targets:
+        try:
+            q.put_nowait((event, data))
+        except queue.Full:
+            pass
+
+
+def format_sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+
+
+def stream(channel):
+    q = subscribe(channel)
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            try:
+                event, data = q.get(timeout=KEEPALIVE_SECONDS)
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+            yield format_sse(event, data)
+    finally:
+        unsubscribe(channel, q)
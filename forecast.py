@@ -0,0 +1,95 @@
+import math
+from collections import namedtuple
+from datetime import date, timedelta
+
+import numpy as np
+
+from models import db, DishDailyOrders, MenuItemIngredient, Product, PurchaseRequest
+
+# Прогноз расхода продуктов: история заказов по блюдам за учебный день
+# (матрица D: дни × блюда, из сводной таблицы DishDailyOrders) умножается
+# на матрицу рецептов (R: блюда × продукты).
+# Свежие дни весят больше (экспоненциальное затухание с периодом полураспада).
+FORECAST_HISTORY_DAYS = 365
+FORECAST_HALF_LIFE_DAYS = 14
+FORECAST_LEAD_DAYS = 3      # сколько учебных дней идёт поставка
+FORECAST_COVER_DAYS = 7     # на сколько учебных дней закупать
+
+ForecastRow = namedtuple('ForecastRow', 'product_id name unit stock incoming daily days_left suggested')
+
+
+def _dish_counts_matrix(since):
+    rows = db.session.query(DishDailyOrders.date, DishDailyOrders.menu_item_id, DishDailyOrders.orders) \
+        .filter(DishDailyOrders.date >= since, DishDailyOrders.orders > 0).all()
+    days = sorted({day for day, _, _ in rows})
+    dishes = sorted({item_id for _, item_id, _ in rows})
+    day_index = {day: i for i, day in enumerate(days)}
+    dish_index = {item_id: i for i, item_id in enumerate(dishes)}
+    counts = np.zeros((len(days), len(dishes)))
+    if rows:
+        r = np.array([day_index[day] for day, _, _ in rows])
+        c = np.array([dish_index[item_id] for _, item_id, _ in rows])
+        counts[r, c] = [count for _, _, count in rows]
+    return days, dish_index, counts
+
+
+def _recipe_matrix(dish_index, product_index):
+    recipe = np.zeros((len(dish_index), len(product_index)))
+    rows = [(dish_index[item_id], product_index[product_id], need)
+            for item_id, product_id, need in db.session.query(
+                MenuItemIngredient.menu_item_id, MenuItemIngredient.product_id, MenuItemIngredient.quantity)
+            if item_id in dish_index and product_id in product_index]
+    if rows:
+        r, c, need = (np.array(col) for col in zip(*rows))
+        np.add.at(recipe, (r, c), need)
+    return recipe
+
+
+def _round_up(value, unit):
+    step = 1 if unit == 'шт' else 0.1
+    return round(math.ceil(value / step - 1e-9) * step, 2)
+
+
+def get_consumption_forecast(today=None):
+    today = today or date.today()
+    products = db.session.query(Product.id, Product.name, Product.unit, Product.quantity, Product.reserved) \
+        .order_by(Product.id).all()
+    product_index = {p.id: i for i, p in enumerate(products)}
+
+    days, dish_index, counts = _dish_counts_matrix(today - timedelta(days=FORECAST_HISTORY_DAYS))
+    consumption = counts @ _recipe_matrix(dish_index, product_index)   # дни × продукты
+    if days:
+        age = np.array([(today - day).days for day in days], dtype=float)
+        weights = 0.5 ** (age / FORECAST_HALF_LIFE_DAYS)
+        daily = weights @ consumption / weights.sum()
+    else:
+        daily = np.zeros(len(products))
+
+    incoming = np.zeros(len(products))
+    for product_id, quantity in db.session.query(PurchaseRequest.product_id, db.func.sum(PurchaseRequest.quantity)) \
+            .filter(PurchaseRequest.status.in_(('pending', 'draft'))).group_by(PurchaseRequest.product_id):
+        if product_id in product_index:
+            incoming[product_index[product_id]] = quantity
+
+    stock = np.array([(p.quantity or 0) - (p.reserved or 0) for p in products])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_left = np.where(daily > 0, stock / daily, np.inf)
+    shortfall = daily * (FORECAST_LEAD_DAYS + FORECAST_COVER_DAYS) - stock - incoming
+
+    result = [ForecastRow(p.id, p.name, p.unit, round(float(stock[i]), 2), float(incoming[i]),
+                          round(float(daily[i]), 3), float(days_left[i]),
+                          _round_up(float(shortfall[i]), p.unit) if daily[i] > 0 and shortfall[i] > 0 else 0)
+              for i, p in enumerate(products)]
+    result.sort(key=lambda row: (row.days_left, row.name))
+    return result
+
+
+# Черновики заявок на всё, что закончится раньше, чем придёт поставка
+# с запасом на FORECAST_COVER_DAYS. Администратор одобряет их как обычные заявки.
+def create_purchase_drafts(user_id, forecast=None):
+    drafts = [{'product_id': row.product_id, 'quantity': row.suggested, 'status': 'draft', 'created_by': user_id}
+              for row in forecast or get_consumption_forecast() if row.suggested > 0]
+    if drafts:
+        db.session.execute(db.insert(PurchaseRequest), drafts)
+        db.session.commit()
+    return len(drafts)
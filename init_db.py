@@ -1,282 +1,456 @@
+import argparse
 import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
 from flask import Flask
 from models import db, User, Allergy, Category, MenuItem, MenuItemAllergy, Product, MenuItemIngredient
+from models import Order, OrderItem, Payment, Review, Notification, StockMovement
 from db_functions import add_user, add_allergy, add_category, add_menu_item, add_product, add_menu_item_allergy, add_ingredient
+from db_functions import bump_menu_version, rebuild_daily_stats, rebuild_dish_ratings, allergen_mask
+from analytics import rebuild_attendance
+from migrations import upgrade
+from database import init_database, get_database_uri, DEFAULT_DATABASE_URI
+from security import hash_password
 
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///canteen.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db.init_app(app)
+# Создание базы с демо-данными: аккаунты, меню на неделю, склад и рецепты.
+#   python init_db.py                      — по одной записи через db_functions
+#   python init_db.py --bulk               — пакетами, одной транзакцией
+#   python init_db.py --bulk --students 2000 --days 60 --reviews 3000
+#                                          — плюс синтетическая школа с историей
+#                                            заказов (для нагрузочных тестов)
 
-if os.path.exists('instance/canteen.db'):
-    os.remove('instance/canteen.db')
+USERS = [
+    ('admin', 'admin123', 'admin', 'Администратор', ''),
+    ('cook', 'cook123', 'cook', 'Повар Иванов', ''),
+    ('student1', 'student123', 'student', 'Петров Иван', '9А'),
+]
 
-with app.app_context():
-    db.create_all()
+ALLERGIES = [
+    'Молоко',
+    'Глютен',
+    'Яйца',
+    'Орехи',
+    'Рыба',
+    'Цитрусовые',
+    'Соя',
+    'Мёд',
+    'Шоколад/Какао',
+    'Сельдерей',
+    'Горчица',
+    'Кунжут',
+    'Арахис',
+    'Моллюски',
+    'Кукуруза',
+    'Томаты',
+    'Клубника',
+    'Бананы',
+    'Киви',
+    'Творог',
+]
 
-    admin = add_user('admin', 'admin123', 'admin', 'Администратор', '')
-    cook = add_user('cook', 'cook123', 'cook', 'Повар Иванов', '')
-    student = add_user('student1', 'student123', 'student', 'Петров Иван', '9А')
-    student.is_approved = True
-    db.session.commit()
+CATEGORIES = {
+    'b_main': ('Основное блюдо', 'breakfast'),
+    'b_fruit': ('Фрукты', 'breakfast'),
+    'b_drink': ('Напиток', 'breakfast'),
+    'l_soup': ('Суп', 'lunch'),
+    'l_main': ('Горячее', 'lunch'),
+    'l_salad': ('Салат', 'lunch'),
+    'l_drink': ('Напиток', 'lunch'),
+}
 
-    milk = add_allergy('Молоко')
-    gluten = add_allergy('Глютен')
-    eggs = add_allergy('Яйца')
-    nuts = add_allergy('Орехи')
-    fish = add_allergy('Рыба')
-    citrus = add_allergy('Цитрусовые')
-    soy = add_allergy('Соя')
-    honey = add_allergy('Мёд')
-    chocolate = add_allergy('Шоколад/Какао')
-    celery = add_allergy('Сельдерей')
-    mustard = add_allergy('Горчица')
-    sesame = add_allergy('Кунжут')
-    peanut = add_allergy('Арахис')
-    shellfish = add_allergy('Моллюски')
-    corn = add_allergy('Кукуруза')
-    tomato_allergy = add_allergy('Томаты')
-    strawberry = add_allergy('Клубника')
-    banana_allergy = add_allergy('Бананы')
-    kiwi_allergy = add_allergy('Киви')
-    cottage_allergy = add_allergy('Творог')
-
-    b_main = add_category('Основное блюдо', 'breakfast')
-    b_fruit = add_category('Фрукты', 'breakfast')
-    b_drink = add_category('Напиток', 'breakfast')
-
-    l_soup = add_category('Суп', 'lunch')
-    l_main = add_category('Горячее', 'lunch')
-    l_salad = add_category('Салат', 'lunch')
-    l_drink = add_category('Напиток', 'lunch')
-
-    breakfast_menu = {
-        0: {
-            b_main.id: [('Каша овсяная', 60), ('Омлет', 80)],
-            b_fruit.id: [('Яблоко', 30), ('Банан', 35)],
-            b_drink.id: [('Чай', 20), ('Какао', 35)]
-        },
-        1: {
-            b_main.id: [('Каша рисовая', 55), ('Сырники', 90)],
-            b_fruit.id: [('Груша', 35), ('Апельсин', 40)],
-            b_drink.id: [('Компот', 25), ('Молоко', 30)]
-        },
-        2: {
-            b_main.id: [('Каша гречневая', 50), ('Блины', 85)],
-            b_fruit.id: [('Яблоко', 30), ('Мандарин', 35)],
-            b_drink.id: [('Чай', 20), ('Сок яблочный', 40)]
-        },
-        3: {
-            b_main.id: [('Каша пшенная', 55), ('Оладьи', 75)],
-            b_fruit.id: [('Банан', 35), ('Киви', 45)],
-            b_drink.id: [('Какао', 35), ('Компот', 25)]
-        },
-        4: {
-            b_main.id: [('Каша манная', 50), ('Творожная запеканка', 95)],
-            b_fruit.id: [('Груша', 35), ('Яблоко', 30)],
-            b_drink.id: [('Чай', 20), ('Молоко', 30)]
-        }
+BREAKFAST_MENU = {
+    0: {
+        'b_main': [('Каша овсяная', 60), ('Омлет', 80)],
+        'b_fruit': [('Яблоко', 30), ('Банан', 35)],
+        'b_drink': [('Чай', 20), ('Какао', 35)]
+    },
+    1: {
+        'b_main': [('Каша рисовая', 55), ('Сырники', 90)],
+        'b_fruit': [('Груша', 35), ('Апельсин', 40)],
+        'b_drink': [('Компот', 25), ('Молоко', 30)]
+    },
+    2: {
+        'b_main': [('Каша гречневая', 50), ('Блины', 85)],
+        'b_fruit': [('Яблоко', 30), ('Мандарин', 35)],
+        'b_drink': [('Чай', 20), ('Сок яблочный', 40)]
+    },
+    3: {
+        'b_main': [('Каша пшенная', 55), ('Оладьи', 75)],
+        'b_fruit': [('Банан', 35), ('Киви', 45)],
+        'b_drink': [('Какао', 35), ('Компот', 25)]
+    },
+    4: {
+        'b_main': [('Каша манная', 50), ('Творожная запеканка', 95)],
+        'b_fruit': [('Груша', 35), ('Яблоко', 30)],
+        'b_drink': [('Чай', 20), ('Молоко', 30)]
     }
+}
 
-    lunch_menu = {
-        0: {
-            l_soup.id: [('Борщ', 70), ('Куриный суп', 65)],
-            l_main.id: [('Котлета с пюре', 120), ('Гуляш с гречкой', 130)],
-            l_salad.id: [('Салат витаминный', 45), ('Салат из капусты', 40)],
-            l_drink.id: [('Компот', 25), ('Чай', 20)]
-        },
-        1: {
-            l_soup.id: [('Щи', 65), ('Рассольник', 70)],
-            l_main.id: [('Рыба с рисом', 140), ('Тефтели с макаронами', 115)],
-            l_salad.id: [('Салат огурцы-помидоры', 50), ('Винегрет', 45)],
-            l_drink.id: [('Сок', 40), ('Компот', 25)]
-        },
-        2: {
-            l_soup.id: [('Гороховый суп', 60), ('Суп-лапша', 65)],
-            l_main.id: [('Курица с картофелем', 135), ('Печень с гречкой', 125)],
-            l_salad.id: [('Салат морковный', 35), ('Салат свекольный', 40)],
-            l_drink.id: [('Чай', 20), ('Кисель', 30)]
-        },
-        3: {
-            l_soup.id: [('Суп фасолевый', 65), ('Борщ', 70)],
-            l_main.id: [('Биточки с пюре', 110), ('Плов', 120)],
-            l_salad.id: [('Салат из редиса', 40), ('Салат греческий', 55)],
-            l_drink.id: [('Компот', 25), ('Морс', 30)]
-        },
-        4: {
-            l_soup.id: [('Уха', 75), ('Суп овощной', 55)],
-            l_main.id: [('Жаркое', 140), ('Запеканка мясная', 125)],
-            l_salad.id: [('Салат оливье', 60), ('Салат витаминный', 45)],
-            l_drink.id: [('Чай', 20), ('Сок', 40)]
-        }
+LUNCH_MENU = {
+    0: {
+        'l_soup': [('Борщ', 70), ('Куриный суп', 65)],
+        'l_main': [('Котлета с пюре', 120), ('Гуляш с гречкой', 130)],
+        'l_salad': [('Салат витаминный', 45), ('Салат из капусты', 40)],
+        'l_drink': [('Компот', 25), ('Чай', 20)]
+    },
+    1: {
+        'l_soup': [('Щи', 65), ('Рассольник', 70)],
+        'l_main': [('Рыба с рисом', 140), ('Тефтели с макаронами', 115)],
+        'l_salad': [('Салат огурцы-помидоры', 50), ('Винегрет', 45)],
+        'l_drink': [('Сок', 40), ('Компот', 25)]
+    },
+    2: {
+        'l_soup': [('Гороховый суп', 60), ('Суп-лапша', 65)],
+        'l_main': [('Курица с картофелем', 135), ('Печень с гречкой', 125)],
+        'l_salad': [('Салат морковный', 35), ('Салат свекольный', 40)],
+        'l_drink': [('Чай', 20), ('Кисель', 30)]
+    },
+    3: {
+        'l_soup': [('Суп фасолевый', 65), ('Борщ', 70)],
+        'l_main': [('Биточки с пюре', 110), ('Плов', 120)],
+        'l_salad': [('Салат из редиса', 40), ('Салат греческий', 55)],
+        'l_drink': [('Компот', 25), ('Морс', 30)]
+    },
+    4: {
+        'l_soup': [('Уха', 75), ('Суп овощной', 55)],
+        'l_main': [('Жаркое', 140), ('Запеканка мясная', 125)],
+        'l_salad': [('Салат оливье', 60), ('Салат витаминный', 45)],
+        'l_drink': [('Чай', 20), ('Сок', 40)]
     }
+}
 
-    item_allergies = {
-        'Каша овсяная': [milk.id, gluten.id],
-        'Каша рисовая': [milk.id],
-        'Каша гречневая': [milk.id],
-        'Каша пшенная': [milk.id],
-        'Каша манная': [milk.id, gluten.id],
-        'Омлет': [eggs.id, milk.id],
-        'Сырники': [eggs.id, milk.id, gluten.id, cottage_allergy.id],
-        'Блины': [eggs.id, milk.id, gluten.id],
-        'Оладьи': [eggs.id, milk.id, gluten.id],
-        'Творожная запеканка': [eggs.id, milk.id, cottage_allergy.id],
-        'Какао': [milk.id, chocolate.id],
-        'Молоко': [milk.id],
-        'Апельсин': [citrus.id],
-        'Мандарин': [citrus.id],
-        'Банан': [banana_allergy.id],
-        'Киви': [kiwi_allergy.id],
-        'Рыба с рисом': [fish.id],
-        'Уха': [fish.id],
-        'Котлета с пюре': [gluten.id, eggs.id, milk.id],
-        'Тефтели с макаронами': [gluten.id, eggs.id, tomato_allergy.id],
-        'Биточки с пюре': [gluten.id, eggs.id, milk.id],
-        'Салат оливье': [eggs.id],
-        'Борщ': [tomato_allergy.id],
-        'Салат огурцы-помидоры': [tomato_allergy.id],
-        'Салат греческий': [tomato_allergy.id, milk.id],
-        'Гуляш с гречкой': [gluten.id, tomato_allergy.id],
-        'Запеканка мясная': [eggs.id, milk.id],
-        'Рассольник': [],
-        'Винегрет': [],
-        'Кисель': [],
-        'Морс': [],
-    }
+ITEM_ALLERGIES = {
+    'Каша овсяная': ['Молоко', 'Глютен'],
+    'Каша рисовая': ['Молоко'],
+    'Каша гречневая': ['Молоко'],
+    'Каша пшенная': ['Молоко'],
+    'Каша манная': ['Молоко', 'Глютен'],
+    'Омлет': ['Яйца', 'Молоко'],
+    'Сырники': ['Яйца', 'Молоко', 'Глютен', 'Творог'],
+    'Блины': ['Яйца', 'Молоко', 'Глютен'],
+    'Оладьи': ['Яйца', 'Молоко', 'Глютен'],
+    'Творожная запеканка': ['Яйца', 'Молоко', 'Творог'],
+    'Какао': ['Молоко', 'Шоколад/Какао'],
+    'Молоко': ['Молоко'],
+    'Апельсин': ['Цитрусовые'],
+    'Мандарин': ['Цитрусовые'],
+    'Банан': ['Бананы'],
+    'Киви': ['Киви'],
+    'Рыба с рисом': ['Рыба'],
+    'Уха': ['Рыба'],
+    'Котлета с пюре': ['Глютен', 'Яйца', 'Молоко'],
+    'Тефтели с макаронами': ['Глютен', 'Яйца', 'Томаты'],
+    'Биточки с пюре': ['Глютен', 'Яйца', 'Молоко'],
+    'Салат оливье': ['Яйца'],
+    'Борщ': ['Томаты'],
+    'Салат огурцы-помидоры': ['Томаты'],
+    'Салат греческий': ['Томаты', 'Молоко'],
+    'Гуляш с гречкой': ['Глютен', 'Томаты'],
+    'Запеканка мясная': ['Яйца', 'Молоко'],
+    'Рассольник': [],
+    'Винегрет': [],
+    'Кисель': [],
+    'Морс': [],
+}
 
-    all_created_items = {}
-
-    for day, categories in breakfast_menu.items():
-        for cat_id, items in categories.items():
-            for name, price in items:
-                item = add_menu_item(name, price, cat_id, day)
-                all_created_items[item.id] = name
-                if name in item_allergies:
-                    for allergy_id in item_allergies[name]:
-                        add_menu_item_allergy(item.id, allergy_id)
-
-    for day, categories in lunch_menu.items():
-        for cat_id, items in categories.items():
-            for name, price in items:
-                item = add_menu_item(name, price, cat_id, day)
-                all_created_items[item.id] = name
-                if name in item_allergies:
-                    for allergy_id in item_allergies[name]:
-                        add_menu_item_allergy(item.id, allergy_id)
-
-    p_milk = add_product('Молоко', 50, 'л', 80)
-    p_flour = add_product('Мука', 30, 'кг', 60)
-    p_eggs = add_product('Яйца', 100, 'шт', 10)
-    p_butter = add_product('Масло сливочное', 20, 'кг', 600)
-    p_sugar = add_product('Сахар', 25, 'кг', 70)
-    p_salt = add_product('Соль', 10, 'кг', 30)
-    p_oat = add_product('Крупа овсяная', 15, 'кг', 90)
-    p_buckwheat = add_product('Крупа гречневая', 20, 'кг', 120)
-    p_rice = add_product('Крупа рисовая', 20, 'кг', 100)
-    p_beef = add_product('Мясо говядина', 30, 'кг', 450)
-    p_chicken = add_product('Мясо курица', 40, 'кг', 280)
-    p_fish = add_product('Рыба', 25, 'кг', 350)
-    p_potato = add_product('Картофель', 100, 'кг', 40)
-    p_cabbage = add_product('Капуста', 50, 'кг', 35)
-    p_carrot = add_product('Морковь', 40, 'кг', 45)
-    p_onion = add_product('Лук', 30, 'кг', 40)
-    p_beet = add_product('Свекла', 30, 'кг', 35)
-    p_cucumber = add_product('Огурцы', 20, 'кг', 120)
-    p_tomato = add_product('Помидоры', 20, 'кг', 150)
-    p_apple = add_product('Яблоки', 50, 'кг', 100)
-    p_banana = add_product('Бананы', 30, 'кг', 90)
-    p_tea = add_product('Чай', 5, 'кг', 800)
-    p_cocoa = add_product('Какао', 3, 'кг', 600)
-    p_pasta = add_product('Макароны', 25, 'кг', 80)
-    p_pear = add_product('Груши', 30, 'кг', 110)
-    p_orange = add_product('Апельсины', 20, 'кг', 130)
-    p_mandarin = add_product('Мандарины', 20, 'кг', 140)
-    p_kiwi = add_product('Киви', 15, 'кг', 200)
-    p_cottage = add_product('Творог', 20, 'кг', 300)
-    p_sour_cream = add_product('Сметана', 15, 'кг', 250)
-    p_millet = add_product('Крупа пшенная', 15, 'кг', 85)
-    p_semolina = add_product('Крупа манная', 15, 'кг', 75)
-    p_juice_apple = add_product('Сок яблочный', 20, 'л', 120)
-    p_juice = add_product('Сок', 20, 'л', 120)
-    p_dried_fruit = add_product('Сухофрукты', 10, 'кг', 400)
-    p_starch = add_product('Крахмал', 5, 'кг', 150)
-    p_peas = add_product('Горох', 10, 'кг', 90)
-    p_beans = add_product('Фасоль', 10, 'кг', 150)
-    p_noodles = add_product('Лапша', 15, 'кг', 100)
-    p_liver = add_product('Печень', 15, 'кг', 320)
-    p_radish = add_product('Редис', 10, 'кг', 130)
-    p_cheese = add_product('Сыр', 10, 'кг', 500)
-    p_olives = add_product('Оливки', 5, 'кг', 600)
-    p_berry = add_product('Ягоды', 10, 'кг', 350)
-    p_pepper = add_product('Перец', 5, 'кг', 200)
-    p_mayo = add_product('Майонез', 5, 'кг', 180)
-    p_peas_green = add_product('Горошек зелёный', 10, 'кг', 160)
-    p_sausage = add_product('Колбаса', 10, 'кг', 400)
-    p_pickle = add_product('Огурцы солёные', 10, 'кг', 150)
-
-    ingredient_map = {
-        'Каша овсяная': [(p_oat.id, 0.08), (p_milk.id, 0.2), (p_butter.id, 0.01), (p_salt.id, 0.002), (p_sugar.id, 0.01)],
-        'Каша рисовая': [(p_rice.id, 0.08), (p_milk.id, 0.2), (p_butter.id, 0.01), (p_salt.id, 0.002), (p_sugar.id, 0.01)],
-        'Каша гречневая': [(p_buckwheat.id, 0.08), (p_milk.id, 0.15), (p_butter.id, 0.01), (p_salt.id, 0.002)],
-        'Каша пшенная': [(p_millet.id, 0.08), (p_milk.id, 0.2), (p_butter.id, 0.01), (p_salt.id, 0.002), (p_sugar.id, 0.01)],
-        'Каша манная': [(p_semolina.id, 0.06), (p_milk.id, 0.25), (p_butter.id, 0.01), (p_salt.id, 0.002), (p_sugar.id, 0.015)],
-        'Омлет': [(p_eggs.id, 3), (p_milk.id, 0.05), (p_butter.id, 0.01), (p_salt.id, 0.002)],
-        'Сырники': [(p_cottage.id, 0.15), (p_eggs.id, 1), (p_flour.id, 0.03), (p_sugar.id, 0.02), (p_butter.id, 0.02), (p_sour_cream.id, 0.03)],
-        'Блины': [(p_flour.id, 0.1), (p_milk.id, 0.2), (p_eggs.id, 1), (p_sugar.id, 0.02), (p_butter.id, 0.02), (p_salt.id, 0.002)],
-        'Оладьи': [(p_flour.id, 0.08), (p_milk.id, 0.15), (p_eggs.id, 1), (p_sugar.id, 0.02), (p_butter.id, 0.02), (p_salt.id, 0.002)],
-        'Творожная запеканка': [(p_cottage.id, 0.2), (p_eggs.id, 1), (p_sugar.id, 0.03), (p_butter.id, 0.01), (p_semolina.id, 0.02), (p_sour_cream.id, 0.03)],
-        'Яблоко': [(p_apple.id, 0.15)],
-        'Банан': [(p_banana.id, 0.15)],
-        'Груша': [(p_pear.id, 0.15)],
-        'Апельсин': [(p_orange.id, 0.2)],
-        'Мандарин': [(p_mandarin.id, 0.15)],
-        'Киви': [(p_kiwi.id, 0.1)],
-        'Чай': [(p_tea.id, 0.003), (p_sugar.id, 0.015)],
-        'Какао': [(p_cocoa.id, 0.02), (p_milk.id, 0.2), (p_sugar.id, 0.02)],
-        'Компот': [(p_dried_fruit.id, 0.03), (p_sugar.id, 0.02)],
-        'Молоко': [(p_milk.id, 0.25)],
-        'Сок яблочный': [(p_juice_apple.id, 0.25)],
-        'Сок': [(p_juice.id, 0.25)],
-        'Кисель': [(p_starch.id, 0.015), (p_sugar.id, 0.03), (p_berry.id, 0.03)],
-        'Морс': [(p_berry.id, 0.04), (p_sugar.id, 0.02)],
-        'Борщ': [(p_beet.id, 0.06), (p_cabbage.id, 0.06), (p_potato.id, 0.08), (p_carrot.id, 0.03), (p_onion.id, 0.03), (p_tomato.id, 0.03), (p_beef.id, 0.08), (p_salt.id, 0.003)],
-        'Куриный суп': [(p_chicken.id, 0.08), (p_potato.id, 0.08), (p_carrot.id, 0.03), (p_onion.id, 0.02), (p_noodles.id, 0.03), (p_salt.id, 0.003)],
-        'Щи': [(p_cabbage.id, 0.1), (p_potato.id, 0.06), (p_carrot.id, 0.03), (p_onion.id, 0.02), (p_beef.id, 0.07), (p_salt.id, 0.003)],
-        'Рассольник': [(p_pickle.id, 0.05), (p_potato.id, 0.08), (p_carrot.id, 0.03), (p_onion.id, 0.02), (p_rice.id, 0.02), (p_beef.id, 0.06), (p_salt.id, 0.002)],
-        'Гороховый суп': [(p_peas.id, 0.06), (p_potato.id, 0.06), (p_carrot.id, 0.03), (p_onion.id, 0.02), (p_beef.id, 0.06), (p_salt.id, 0.003)],
-        'Суп-лапша': [(p_chicken.id, 0.07), (p_noodles.id, 0.05), (p_carrot.id, 0.03), (p_onion.id, 0.02), (p_salt.id, 0.003)],
-        'Суп фасолевый': [(p_beans.id, 0.05), (p_potato.id, 0.06), (p_carrot.id, 0.03), (p_onion.id, 0.02), (p_tomato.id, 0.03), (p_salt.id, 0.003)],
-        'Уха': [(p_fish.id, 0.12), (p_potato.id, 0.08), (p_carrot.id, 0.03), (p_onion.id, 0.02), (p_salt.id, 0.003)],
-        'Суп овощной': [(p_potato.id, 0.08), (p_carrot.id, 0.04), (p_onion.id, 0.03), (p_cabbage.id, 0.05), (p_tomato.id, 0.03), (p_salt.id, 0.003)],
-        'Котлета с пюре': [(p_beef.id, 0.1), (p_flour.id, 0.02), (p_eggs.id, 1), (p_onion.id, 0.02), (p_potato.id, 0.2), (p_milk.id, 0.05), (p_butter.id, 0.015), (p_salt.id, 0.003)],
-        'Гуляш с гречкой': [(p_beef.id, 0.12), (p_onion.id, 0.03), (p_carrot.id, 0.02), (p_tomato.id, 0.03), (p_flour.id, 0.01), (p_buckwheat.id, 0.08), (p_salt.id, 0.003)],
-        'Рыба с рисом': [(p_fish.id, 0.15), (p_rice.id, 0.08), (p_butter.id, 0.01), (p_salt.id, 0.003)],
-        'Тефтели с макаронами': [(p_beef.id, 0.1), (p_rice.id, 0.02), (p_eggs.id, 1), (p_onion.id, 0.02), (p_tomato.id, 0.03), (p_pasta.id, 0.08), (p_salt.id, 0.003)],
-        'Курица с картофелем': [(p_chicken.id, 0.15), (p_potato.id, 0.2), (p_onion.id, 0.02), (p_butter.id, 0.01), (p_salt.id, 0.003)],
-        'Печень с гречкой': [(p_liver.id, 0.12), (p_buckwheat.id, 0.08), (p_onion.id, 0.03), (p_sour_cream.id, 0.03), (p_salt.id, 0.003)],
-        'Биточки с пюре': [(p_beef.id, 0.1), (p_flour.id, 0.02), (p_eggs.id, 1), (p_potato.id, 0.2), (p_milk.id, 0.05), (p_butter.id, 0.015), (p_salt.id, 0.003)],
-        'Плов': [(p_rice.id, 0.1), (p_beef.id, 0.1), (p_carrot.id, 0.05), (p_onion.id, 0.03), (p_butter.id, 0.02), (p_salt.id, 0.003)],
-        'Жаркое': [(p_beef.id, 0.12), (p_potato.id, 0.15), (p_carrot.id, 0.04), (p_onion.id, 0.03), (p_tomato.id, 0.03), (p_salt.id, 0.003)],
-        'Запеканка мясная': [(p_beef.id, 0.1), (p_potato.id, 0.15), (p_eggs.id, 1), (p_onion.id, 0.03), (p_cheese.id, 0.03), (p_salt.id, 0.003)],
-        'Салат витаминный': [(p_cabbage.id, 0.08), (p_carrot.id, 0.04), (p_apple.id, 0.03), (p_sugar.id, 0.005)],
-        'Салат из капусты': [(p_cabbage.id, 0.1), (p_carrot.id, 0.03), (p_onion.id, 0.01), (p_salt.id, 0.002)],
-        'Салат огурцы-помидоры': [(p_cucumber.id, 0.08), (p_tomato.id, 0.08), (p_onion.id, 0.02), (p_salt.id, 0.002)],
-        'Винегрет': [(p_beet.id, 0.06), (p_potato.id, 0.05), (p_carrot.id, 0.03), (p_pickle.id, 0.03), (p_onion.id, 0.02), (p_peas_green.id, 0.02)],
-        'Салат морковный': [(p_carrot.id, 0.1), (p_sugar.id, 0.01), (p_sour_cream.id, 0.02)],
-        'Салат свекольный': [(p_beet.id, 0.1), (p_onion.id, 0.02), (p_salt.id, 0.002)],
-        'Салат из редиса': [(p_radish.id, 0.08), (p_cucumber.id, 0.05), (p_sour_cream.id, 0.02), (p_salt.id, 0.002)],
-        'Салат греческий': [(p_cucumber.id, 0.06), (p_tomato.id, 0.06), (p_pepper.id, 0.03), (p_cheese.id, 0.04), (p_olives.id, 0.02), (p_salt.id, 0.002)],
-        'Салат оливье': [(p_potato.id, 0.06), (p_carrot.id, 0.03), (p_eggs.id, 1), (p_pickle.id, 0.03), (p_sausage.id, 0.04), (p_peas_green.id, 0.03), (p_mayo.id, 0.03)],
-    }
+PRODUCTS = [
+    ('Молоко', 50, 'л', 80),
+    ('Мука', 30, 'кг', 60),
+    ('Яйца', 100, 'шт', 10),
+    ('Масло сливочное', 20, 'кг', 600),
+    ('Сахар', 25, 'кг', 70),
+    ('Соль', 10, 'кг', 30),
+    ('Крупа овсяная', 15, 'кг', 90),
+    ('Крупа гречневая', 20, 'кг', 120),
+    ('Крупа рисовая', 20, 'кг', 100),
+    ('Мясо говядина', 30, 'кг', 450),
+    ('Мясо курица', 40, 'кг', 280),
+    ('Рыба', 25, 'кг', 350),
+    ('Картофель', 100, 'кг', 40),
+    ('Капуста', 50, 'кг', 35),
+    ('Морковь', 40, 'кг', 45),
+    ('Лук', 30, 'кг', 40),
+    ('Свекла', 30, 'кг', 35),
+    ('Огурцы', 20, 'кг', 120),
+    ('Помидоры', 20, 'кг', 150),
+    ('Яблоки', 50, 'кг', 100),
+    ('Бананы', 30, 'кг', 90),
+    ('Чай', 5, 'кг', 800),
+    ('Какао', 3, 'кг', 600),
+    ('Макароны', 25, 'кг', 80),
+    ('Груши', 30, 'кг', 110),
+    ('Апельсины', 20, 'кг', 130),
+    ('Мандарины', 20, 'кг', 140),
+    ('Киви', 15, 'кг', 200),
+    ('Творог', 20, 'кг', 300),
+    ('Сметана', 15, 'кг', 250),
+    ('Крупа пшенная', 15, 'кг', 85),
+    ('Крупа манная', 15, 'кг', 75),
+    ('Сок яблочный', 20, 'л', 120),
+    ('Сок', 20, 'л', 120),
+    ('Сухофрукты', 10, 'кг', 400),
+    ('Крахмал', 5, 'кг', 150),
+    ('Горох', 10, 'кг', 90),
+    ('Фасоль', 10, 'кг', 150),
+    ('Лапша', 15, 'кг', 100),
+    ('Печень', 15, 'кг', 320),
+    ('Редис', 10, 'кг', 130),
+    ('Сыр', 10, 'кг', 500),
+    ('Оливки', 5, 'кг', 600),
+    ('Ягоды', 10, 'кг', 350),
+    ('Перец', 5, 'кг', 200),
+    ('Майонез', 5, 'кг', 180),
+    ('Горошек зелёный', 10, 'кг', 160),
+    ('Колбаса', 10, 'кг', 400),
+    ('Огурцы солёные', 10, 'кг', 150),
+]
+
+INGREDIENTS = {
+    'Каша овсяная': [('Крупа овсяная', 0.08), ('Молоко', 0.2), ('Масло сливочное', 0.01), ('Соль', 0.002), ('Сахар', 0.01)],
+    'Каша рисовая': [('Крупа рисовая', 0.08), ('Молоко', 0.2), ('Масло сливочное', 0.01), ('Соль', 0.002), ('Сахар', 0.01)],
+    'Каша гречневая': [('Крупа гречневая', 0.08), ('Молоко', 0.15), ('Масло сливочное', 0.01), ('Соль', 0.002)],
+    'Каша пшенная': [('Крупа пшенная', 0.08), ('Молоко', 0.2), ('Масло сливочное', 0.01), ('Соль', 0.002), ('Сахар', 0.01)],
+    'Каша манная': [('Крупа манная', 0.06), ('Молоко', 0.25), ('Масло сливочное', 0.01), ('Соль', 0.002), ('Сахар', 0.015)],
+    'Омлет': [('Яйца', 3), ('Молоко', 0.05), ('Масло сливочное', 0.01), ('Соль', 0.002)],
+    'Сырники': [('Творог', 0.15), ('Яйца', 1), ('Мука', 0.03), ('Сахар', 0.02), ('Масло сливочное', 0.02), ('Сметана', 0.03)],
+    'Блины': [('Мука', 0.1), ('Молоко', 0.2), ('Яйца', 1), ('Сахар', 0.02), ('Масло сливочное', 0.02), ('Соль', 0.002)],
+    'Оладьи': [('Мука', 0.08), ('Молоко', 0.15), ('Яйца', 1), ('Сахар', 0.02), ('Масло сливочное', 0.02), ('Соль', 0.002)],
+    'Творожная запеканка': [('Творог', 0.2), ('Яйца', 1), ('Сахар', 0.03), ('Масло сливочное', 0.01), ('Крупа манная', 0.02), ('Сметана', 0.03)],
+    'Яблоко': [('Яблоки', 0.15)],
+    'Банан': [('Бананы', 0.15)],
+    'Груша': [('Груши', 0.15)],
+    'Апельсин': [('Апельсины', 0.2)],
+    'Мандарин': [('Мандарины', 0.15)],
+    'Киви': [('Киви', 0.1)],
+    'Чай': [('Чай', 0.003), ('Сахар', 0.015)],
+    'Какао': [('Какао', 0.02), ('Молоко', 0.2), ('Сахар', 0.02)],
+    'Компот': [('Сухофрукты', 0.03), ('Сахар', 0.02)],
+    'Молоко': [('Молоко', 0.25)],
+    'Сок яблочный': [('Сок яблочный', 0.25)],
+    'Сок': [('Сок', 0.25)],
+    'Кисель': [('Крахмал', 0.015), ('Сахар', 0.03), ('Ягоды', 0.03)],
+    'Морс': [('Ягоды', 0.04), ('Сахар', 0.02)],
+    'Борщ': [('Свекла', 0.06), ('Капуста', 0.06), ('Картофель', 0.08), ('Морковь', 0.03), ('Лук', 0.03), ('Помидоры', 0.03), ('Мясо говядина', 0.08), ('Соль', 0.003)],
+    'Куриный суп': [('Мясо курица', 0.08), ('Картофель', 0.08), ('Морковь', 0.03), ('Лук', 0.02), ('Лапша', 0.03), ('Соль', 0.003)],
+    'Щи': [('Капуста', 0.1), ('Картофель', 0.06), ('Морковь', 0.03), ('Лук', 0.02), ('Мясо говядина', 0.07), ('Соль', 0.003)],
+    'Рассольник': [('Огурцы солёные', 0.05), ('Картофель', 0.08), ('Морковь', 0.03), ('Лук', 0.02), ('Крупа рисовая', 0.02), ('Мясо говядина', 0.06), ('Соль', 0.002)],
+    'Гороховый суп': [('Горох', 0.06), ('Картофель', 0.06), ('Морковь', 0.03), ('Лук', 0.02), ('Мясо говядина', 0.06), ('Соль', 0.003)],
+    'Суп-лапша': [('Мясо курица', 0.07), ('Лапша', 0.05), ('Морковь', 0.03), ('Лук', 0.02), ('Соль', 0.003)],
+    'Суп фасолевый': [('Фасоль', 0.05), ('Картофель', 0.06), ('Морковь', 0.03), ('Лук', 0.02), ('Помидоры', 0.03), ('Соль', 0.003)],
+    'Уха': [('Рыба', 0.12), ('Картофель', 0.08), ('Морковь', 0.03), ('Лук', 0.02), ('Соль', 0.003)],
+    'Суп овощной': [('Картофель', 0.08), ('Морковь', 0.04), ('Лук', 0.03), ('Капуста', 0.05), ('Помидоры', 0.03), ('Соль', 0.003)],
+    'Котлета с пюре': [('Мясо говядина', 0.1), ('Мука', 0.02), ('Яйца', 1), ('Лук', 0.02), ('Картофель', 0.2), ('Молоко', 0.05), ('Масло сливочное', 0.015), ('Соль', 0.003)],
+    'Гуляш с гречкой': [('Мясо говядина', 0.12), ('Лук', 0.03), ('Морковь', 0.02), ('Помидоры', 0.03), ('Мука', 0.01), ('Крупа гречневая', 0.08), ('Соль', 0.003)],
+    'Рыба с рисом': [('Рыба', 0.15), ('Крупа рисовая', 0.08), ('Масло сливочное', 0.01), ('Соль', 0.003)],
+    'Тефтели с макаронами': [('Мясо говядина', 0.1), ('Крупа рисовая', 0.02), ('Яйца', 1), ('Лук', 0.02), ('Помидоры', 0.03), ('Макароны', 0.08), ('Соль', 0.003)],
+    'Курица с картофелем': [('Мясо курица', 0.15), ('Картофель', 0.2), ('Лук', 0.02), ('Масло сливочное', 0.01), ('Соль', 0.003)],
+    'Печень с гречкой': [('Печень', 0.12), ('Крупа гречневая', 0.08), ('Лук', 0.03), ('Сметана', 0.03), ('Соль', 0.003)],
+    'Биточки с пюре': [('Мясо говядина', 0.1), ('Мука', 0.02), ('Яйца', 1), ('Картофель', 0.2), ('Молоко', 0.05), ('Масло сливочное', 0.015), ('Соль', 0.003)],
+    'Плов': [('Крупа рисовая', 0.1), ('Мясо говядина', 0.1), ('Морковь', 0.05), ('Лук', 0.03), ('Масло сливочное', 0.02), ('Соль', 0.003)],
+    'Жаркое': [('Мясо говядина', 0.12), ('Картофель', 0.15), ('Морковь', 0.04), ('Лук', 0.03), ('Помидоры', 0.03), ('Соль', 0.003)],
+    'Запеканка мясная': [('Мясо говядина', 0.1), ('Картофель', 0.15), ('Яйца', 1), ('Лук', 0.03), ('Сыр', 0.03), ('Соль', 0.003)],
+    'Салат витаминный': [('Капуста', 0.08), ('Морковь', 0.04), ('Яблоки', 0.03), ('Сахар', 0.005)],
+    'Салат из капусты': [('Капуста', 0.1), ('Морковь', 0.03), ('Лук', 0.01), ('Соль', 0.002)],
+    'Салат огурцы-помидоры': [('Огурцы', 0.08), ('Помидоры', 0.08), ('Лук', 0.02), ('Соль', 0.002)],
+    'Винегрет': [('Свекла', 0.06), ('Картофель', 0.05), ('Морковь', 0.03), ('Огурцы солёные', 0.03), ('Лук', 0.02), ('Горошек зелёный', 0.02)],
+    'Салат морковный': [('Морковь', 0.1), ('Сахар', 0.01), ('Сметана', 0.02)],
+    'Салат свекольный': [('Свекла', 0.1), ('Лук', 0.02), ('Соль', 0.002)],
+    'Салат из редиса': [('Редис', 0.08), ('Огурцы', 0.05), ('Сметана', 0.02), ('Соль', 0.002)],
+    'Салат греческий': [('Огурцы', 0.06), ('Помидоры', 0.06), ('Перец', 0.03), ('Сыр', 0.04), ('Оливки', 0.02), ('Соль', 0.002)],
+    'Салат оливье': [('Картофель', 0.06), ('Морковь', 0.03), ('Яйца', 1), ('Огурцы солёные', 0.03), ('Колбаса', 0.04), ('Горошек зелёный', 0.03), ('Майонез', 0.03)],
+}
+
+CLASSES = [f'{grade}{letter}' for grade in range(1, 12) for letter in 'АБВГ']
+STUDENT_USERNAME = 'load_student{}'
+STUDENT_PASSWORD = 'student123'
+REVIEW_TEXTS = ['Очень вкусно', 'Нормально', 'Остыло', 'Маленькая порция', 'Спасибо поварам!']
+BATCH_SIZE = 5000
+
+# Хэш намеренно медленный: одинаковые пароли хэшируются один раз
+_hash_once = lru_cache(maxsize=None)(hash_password)
+
+
+def _menu_rows():
+    for menu in (BREAKFAST_MENU, LUNCH_MENU):
+        for day, categories in menu.items():
+            for category, items in categories.items():
+                for name, price in items:
+                    yield category, name, price, day
+
+
+def seed():
+    for username, password, role, full_name, class_name in USERS:
+        user = add_user(username, password, role, full_name, class_name)
+        user.is_approved = True
+    db.session.commit()
+
+    allergies = {name: add_allergy(name).id for name in ALLERGIES}
+    categories = {key: add_category(name, meal_type).id for key, (name, meal_type) in CATEGORIES.items()}
+
+    items = []
+    for category, name, price, day in _menu_rows():
+        item = add_menu_item(name, price, categories[category], day)
+        items.append(item)
+        for allergy in ITEM_ALLERGIES.get(name, []):
+            add_menu_item_allergy(item.id, allergies[allergy])
+
+    products = {name: add_product(name, quantity, unit, price).id for name, quantity, unit, price in PRODUCTS}
+    for item in items:
+        for product, quantity in INGREDIENTS.get(item.name, []):
+            add_ingredient(item.id, products[product], quantity)
+
+
+# То же, что seed(), но объекты вставляются пакетами и фиксируются одним commit
+def seed_bulk():
+    db.session.add_all([User(username=username, password=_hash_once(password), role=role, full_name=full_name,
+                             class_name=class_name, is_approved=True, notif_cursor=0, allergen_mask=0)
+                        for username, password, role, full_name, class_name in USERS])
+
+    allergies = {name: Allergy(name=name) for name in ALLERGIES}
+    categories = {key: Category(name=name, meal_type=meal_type) for key, (name, meal_type) in CATEGORIES.items()}
+    products = {name: Product(name=name, quantity=quantity, unit=unit, price=price, reserved=0)
+                for name, quantity, unit, price in PRODUCTS}
+    db.session.add_all(list(allergies.values()) + list(categories.values()) + list(products.values()))
+    db.session.flush()
 
-    for item_id, item_name in all_created_items.items():
-        if item_name in ingredient_map:
-            for product_id, qty in ingredient_map[item_name]:
-                add_ingredient(item_id, product_id, qty)
+    items = [MenuItem(name=name, price=price, category_id=categories[category].id, day_of_week=day,
+                      allergen_mask=allergen_mask(allergies[a].id for a in ITEM_ALLERGIES.get(name, [])))
+             for category, name, price, day in _menu_rows()]
+    db.session.add_all(items)
+    db.session.flush()
 
-    print('База данных создана!')
+    links = []
+    for item in items:
+        links += [MenuItemAllergy(menu_item_id=item.id, allergy_id=allergies[allergy].id)
+                  for allergy in ITEM_ALLERGIES.get(item.name, [])]
+        links += [MenuItemIngredient(menu_item_id=item.id, product_id=products[product].id, quantity=quantity)
+                  for product, quantity in INGREDIENTS.get(item.name, [])]
+    links += [StockMovement(product_id=product.id, kind='receipt', delta=product.quantity, note='Начальный остаток')
+              for product in products.values() if product.quantity]
+    db.session.add_all(links)
+    db.session.commit()
+    bump_menu_version()
+
+
+# Вставка через таблицу, а не ORM-модель: без учёта объектов в сессии,
+# сотни тысяч строк уходят в executemany пакетами
+def _insert(model, rows):
+    connection = db.session.connection()
+    for i in range(0, len(rows), BATCH_SIZE):
+        connection.execute(model.__table__.insert(), rows[i:i + BATCH_SIZE])
+
+
+def _school_days(days):
+    result = []
+    day = date.today() - timedelta(days=1)
+    while len(result) < days:
+        if day.weekday() < 5:
+            result.append(day)
+        day -= timedelta(days=1)
+    return sorted(result)
+
+
+# Синтетическая школа: students учеников по классам, заказы за days учебных
+# дней до вчерашнего, платежи, reviews отзывов и уведомления. Возвращает
+# число созданных заказов.
+def generate_school(students, days, reviews, seed=1):
+    rnd = random.Random(seed)
+    password = _hash_once(STUDENT_PASSWORD)
+    first_id = (db.session.query(db.func.max(User.id)).scalar() or 0) + 1
+    _insert(User, [{
+        'username': STUDENT_USERNAME.format(i), 'password': password, 'role': 'student',
+        'full_name': f'Ученик {i}', 'class_name': CLASSES[i % len(CLASSES)],
+        'balance': 1000000, 'is_approved': True, 'notif_cursor': 0,
+    } for i in range(students)])
+    student_ids = list(range(first_id, first_id + students))
+
+    menu = {}
+    for cat in Category.query.all():
+        items = [(i.id, i.price) for i in MenuItem.query.filter_by(category_id=cat.id).all()]
+        if items:
+            menu.setdefault(cat.meal_type, []).append(items)
+
+    order_rows, item_rows, payment_rows = [], [], []
+    order_id = (db.session.query(db.func.max(Order.id)).scalar() or 0) + 1
+    for day in _school_days(days):
+        for meal_type, chance, hour in (('breakfast', 0.6, 8), ('lunch', 0.5, 13)):
+            for uid in student_ids:
+                if rnd.random() > chance:
+                    continue
+                chosen = [rnd.choice(items) for items in menu.get(meal_type, [])]
+                is_sub = rnd.random() < 0.3
+                created = datetime.combine(day, datetime.min.time()) + timedelta(hours=hour, minutes=rnd.randint(0, 50))
+                order_rows.append({'id': order_id, 'user_id': uid, 'date': day, 'meal_type': meal_type,
+                                   'is_subscription': is_sub, 'is_prepared': True, 'is_received': True,
+                                   'created_at': created})
+                for item_id, price in chosen:
+                    item_rows.append({'order_id': order_id, 'menu_item_id': item_id, 'price': price, 'is_cooked': True})
+                if not is_sub:
+                    payment_rows.append({'user_id': uid, 'amount': sum(p for _, p in chosen),
+                                         'payment_type': 'purchase', 'date': created})
+                order_id += 1
+    _insert(Order, order_rows)
+    _insert(OrderItem, item_rows)
+    _insert(Payment, payment_rows)
+
+    all_items = [item for groups in menu.values() for items in groups for item in items]
+    if all_items and student_ids:
+        # Отзывы выводятся по id, поэтому даты идут в том же порядке
+        _insert(Review, sorted([{
+            'user_id': rnd.choice(student_ids), 'menu_item_id': rnd.choice(all_items)[0],
+            'text': rnd.choice(REVIEW_TEXTS), 'rating': rnd.randint(1, 5),
+            'date': datetime.now() - timedelta(days=rnd.randint(0, days)),
+        } for _ in range(reviews)], key=lambda row: row['date']))
+    _insert(Notification, [{
+        'user_id': uid, 'text': f'Заказ на {rnd.randint(50, 300)} руб. оформлен!', 'is_read': rnd.random() < 0.9,
+        'date': datetime.now() - timedelta(days=rnd.randint(0, days)),
+    } for uid in student_ids for _ in range(5)])
+    db.session.commit()
+    rebuild_daily_stats()
+    rebuild_attendance()
+    rebuild_dish_ratings()
+    return len(order_rows)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Создание базы столовой с демо-данными')
+    parser.add_argument('--bulk', action='store_true', help='вставлять пакетами одной транзакцией')
+    parser.add_argument('--students', type=int, default=0, help='синтетических учеников')
+    parser.add_argument('--days', type=int, default=60, help='учебных дней истории заказов')
+    parser.add_argument('--reviews', type=int, default=0, help='синтетических отзывов')
+    parser.add_argument('--seed', type=int, default=1, help='зерно генератора случайных чисел')
+    args = parser.parse_args(argv)
+
+    app = Flask(__name__)
+    if get_database_uri() == DEFAULT_DATABASE_URI:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists('instance/canteen.db' + suffix):
+                os.remove('instance/canteen.db' + suffix)
+    init_database(app)
+
+    started = time.perf_counter()
+    with app.app_context():
+        upgrade()
+        if args.bulk:
+            seed_bulk()
+        else:
+            seed()
+        orders = generate_school(args.students, args.days, args.reviews, args.seed) if args.students else 0
+
+    print(f'База данных создана за {time.perf_counter() - started:.1f} с!')
+    if args.students:
+        print(f'Синтетическая школа: {args.students} учеников ({STUDENT_USERNAME.format(0)} / {STUDENT_PASSWORD}), '
+              f'{orders} заказов, {args.reviews} отзывов')
     print('Пользователи:')
     print('  admin / admin123 - Администратор')
     print('  cook / cook123 - Повар')
     print('  student1 / student123 - Ученик')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,272 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+from importlib import import_module
+
+from sqlalchemy import inspect, text
+
+from models import db, SchemaMigration
+
+
+# Миграции применяются к существующей базе по порядку версий и записываются
+# в таблицу schema_migration. Каждая миграция идемпотентна: на свежей базе,
+# созданной через db.create_all(), она просто ничего не меняет.
+# Пересчёты сводных таблиц (функции rebuild_* и т. п.) написаны под текущую
+# схему, поэтому миграция не вызывает их сама, а ставит в очередь через
+# _rebuild(); upgrade() выполняет очередь один раз, когда применены все
+# миграции и в базе есть все столбцы.
+
+# Имя пересчёта -> (модуль, функция); выполняются в этом порядке
+REBUILDS = {
+    'daily_stats': ('db_functions', 'rebuild_daily_stats'),
+    'reservations': ('db_functions', 'rebuild_reservations'),
+    'stock_snapshot': ('db_functions', 'ensure_daily_stock_snapshot'),
+    'attendance': ('analytics', 'rebuild_attendance'),
+    'dish_ratings': ('db_functions', 'rebuild_dish_ratings'),
+    'search_index': ('search', 'install_search_index'),
+    'allergen_masks': ('db_functions', 'rebuild_allergen_masks'),
+}
+
+# Схема базы до первой миграции — для проверки обновления (--check)
+BASELINE_SCHEMA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema_baseline.sql')
+
+_pending_rebuilds = set()
+
+
+def _rebuild(*names):
+    _pending_rebuilds.update(names)
+
+
+def _run_rebuilds():
+    for name, (module, function) in REBUILDS.items():
+        if name in _pending_rebuilds:
+            getattr(import_module(module), function)()
+    _pending_rebuilds.clear()
+
+def _table_name(model_or_name):
+    return model_or_name if isinstance(model_or_name, str) else model_or_name.__tablename__
+
+
+def _add_column(table, column, ddl):
+    columns = {c['name'] for c in inspect(db.engine).get_columns(table)}
+    if column not in columns:
+        db.session.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl}'))
+
+
+def _create_indexes(*names):
+    wanted = set(names)
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name in wanted:
+                index.create(db.session.connection(), checkfirst=True)
+                wanted.discard(index.name)
+    if wanted:
+        raise RuntimeError(f'Индексы не описаны в models.py: {", ".join(sorted(wanted))}')
+
+
+def _m1_hot_path_indexes():
+    _create_indexes(
+        'ix_order_date_meal_type',
+        'ix_order_user_created',
+        'ix_order_item_order',
+        'ix_order_item_menu_item',
+        'ix_notification_user_read',
+        'ix_user_allergy_user',
+        'ix_menu_item_ingredient_item',
+        'ix_menu_item_allergy_item',
+        'ix_purchase_request_status',
+        'ix_purchase_request_created_by',
+    )
+
+
+def _m2_broadcasts_and_daily_stats():
+    _add_column('notification', 'role', 'VARCHAR(20)')
+    _add_column('user', 'notif_cursor', 'INTEGER DEFAULT 0')
+    _create_indexes('ix_notification_role')
+    _rebuild('daily_stats')
+
+
+def _m3_stock_ledger():
+    from models import Product, StockMovement
+    _add_column('product', 'reserved', 'FLOAT DEFAULT 0')
+    db.session.commit()
+    # Текущие остатки становятся первой записью журнала
+    has_movements = {product_id for (product_id,) in db.session.query(StockMovement.product_id).distinct()}
+    db.session.add_all([StockMovement(product_id=product_id, kind='receipt', delta=quantity, note='Начальный остаток')
+                        for product_id, quantity in db.session.query(Product.id, Product.quantity)
+                        if product_id not in has_movements and quantity])
+    db.session.commit()
+    _rebuild('reservations', 'stock_snapshot')
+
+
+def _m4_dish_daily_orders():
+    _rebuild('daily_stats')
+
+
+def _m5_attendance_rollup():
+    _rebuild('attendance')
+
+
+def _m6_keyset_indexes():
+    _create_indexes('ix_notification_user')
+
+
+def _m7_dish_ratings():
+    _rebuild('dish_ratings')
+
+
+def _m8_search_index():
+    _rebuild('search_index')
+
+
+def _m9_allergen_masks():
+    _add_column('user', 'allergen_mask', 'BIGINT DEFAULT 0')
+    _add_column('menu_item', 'allergen_mask', 'BIGINT DEFAULT 0')
+    _rebuild('allergen_masks')
+
+
+def _m10_unique_stock_snapshot():
+    from models import StockSnapshot
+    # Дубликаты снимков за один день (страница повара могла сделать два)
+    keep = db.session.query(db.func.min(StockSnapshot.id)) \
+        .group_by(StockSnapshot.date, StockSnapshot.product_id)
+    StockSnapshot.query.filter(StockSnapshot.id.not_in(keep.scalar_subquery())) \
+        .delete(synchronize_session=False)
+    _create_indexes('ux_stock_snapshot_day')
+
+
+def _m11_dish_ratings_by_name():
+    _rebuild('dish_ratings')
+
+
+def _m12_purchase_approved_at():
+    _add_column('purchase_request', 'approved_at', 'DATETIME')
+    _rebuild('daily_stats')
+
+
+MIGRATIONS = [
+    (1, 'Индексы для частых запросов', _m1_hot_path_indexes),
+    (2, 'Рассылки по ролям и дневные итоги', _m2_broadcasts_and_daily_stats),
+    (3, 'Журнал движения продуктов и резервы', _m3_stock_ledger),
+    (4, 'Заказы блюд по дням для прогноза', _m4_dish_daily_orders),
+    (5, 'Сводка посещаемости', _m5_attendance_rollup),
+    (6, 'Индексы для постраничного вывода', _m6_keyset_indexes),
+    (7, 'Сводка оценок блюд', _m7_dish_ratings),
+    (8, 'Полнотекстовый поиск по блюдам и отзывам', _m8_search_index),
+    (9, 'Битовые маски аллергенов', _m9_allergen_masks),
+    (10, 'Один снимок склада в день', _m10_unique_stock_snapshot),
+    (11, 'Оценки блюд по названию, а не по дню недели', _m11_dish_ratings_by_name),
+    (12, 'Расходы по дню одобрения заявки', _m12_purchase_approved_at),
+]
+
+
+def get_applied_versions():
+    return {version for (version,) in db.session.query(SchemaMigration.version).all()}
+
+
+def upgrade():
+    db.create_all()
+    applied = get_applied_versions()
+    done = []
+    try:
+        for version, name, migrate in MIGRATIONS:
+            if version in applied:
+                continue
+            migrate()
+            db.session.commit()
+            done.append((version, name))
+        _run_rebuilds()
+        # Версии записываются после пересчётов: если пересчёт не удался,
+        # миграции (они идемпотентны) выполнятся снова при следующем запуске
+        db.session.add_all([SchemaMigration(version=version, name=name) for version, name in done])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        _pending_rebuilds.clear()
+        raise
+    return [version for version, _ in done]
+
+
+# Обновление базы со схемой до первой миграции: временная SQLite-база из
+# schema_baseline.sql, upgrade() в отдельном процессе. Возвращает текст
+# ошибки или None.
+def check_upgrade_from_baseline():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'baseline.db')
+        conn = sqlite3.connect(path)
+        with open(BASELINE_SCHEMA, encoding='utf-8') as f:
+            conn.executescript(f.read())
+        conn.close()
+        env = dict(os.environ, DATABASE_URL='sqlite:///' + path)
+        result = subprocess.run([sys.executable, os.path.abspath(__file__)], env=env,
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            lines = (result.stderr or result.stdout).strip().splitlines()
+            errors = [line for line in lines if 'Error' in line]
+            return (errors or lines or [f'код возврата {result.returncode}'])[-1].strip()
+    return None
+
+
+# Запросы горячих путей и индексы, которые они обязаны использовать
+QUERY_PLAN_CHECKS = [
+    ('SELECT * FROM "order" WHERE date = :d AND meal_type = :m', 'ix_order_date_meal_type'),
+    ('SELECT * FROM "order" WHERE date = :d AND is_prepared = 0', 'ix_order_date_meal_type'),
+    ('SELECT * FROM "order" WHERE user_id = :u ORDER BY created_at DESC', 'ix_order_user_created'),
+    ('SELECT * FROM "order" WHERE user_id = :u AND (created_at, id) < (:t, :c) '
+     'ORDER BY created_at DESC, id DESC LIMIT 21', 'ix_order_user_created'),
+    ('SELECT * FROM order_item WHERE order_id = :o', 'ix_order_item_order'),
+    ('SELECT * FROM order_item WHERE menu_item_id = :i', 'ix_order_item_menu_item'),
+    ('SELECT count(*) FROM notification WHERE user_id = :u AND is_read = 0', 'ix_notification_user_read'),
+    ('SELECT * FROM notification WHERE role = :r AND id > :c', 'ix_notification_role'),
+    ('SELECT * FROM notification WHERE user_id = :u AND id < :c ORDER BY id DESC LIMIT 22', 'ix_notification_user'),
+    ('SELECT * FROM user_allergy WHERE user_id = :u', 'ix_user_allergy_user'),
+    ('SELECT * FROM menu_item_ingredient WHERE menu_item_id = :i', 'ix_menu_item_ingredient_item'),
+    ('SELECT * FROM menu_item_allergy WHERE menu_item_id = :i', 'ix_menu_item_allergy_item'),
+    ('SELECT * FROM purchase_request WHERE status = :s', 'ix_purchase_request_status'),
+    ('SELECT * FROM purchase_request WHERE created_by = :u ORDER BY date DESC', 'ix_purchase_request_created_by'),
+    ('SELECT sum(delta) FROM stock_movement WHERE product_id = :i AND id > :c', 'ix_stock_movement_product'),
+]
+
+_PLAN_PARAMS = {'d': '2024-01-01', 'm': 'lunch', 'u': 1, 'o': 1, 'i': 1, 'r': 'cook', 'c': 0, 's': 'pending',
+                't': '2024-01-01 00:00:00'}
+
+
+def check_query_plans():
+    if db.engine.dialect.name != 'sqlite':
+        return []
+    failures = []
+    for sql, index_name in QUERY_PLAN_CHECKS:
+        params = {k: v for k, v in _PLAN_PARAMS.items() if ':' + k in sql}
+        plan = db.session.execute(text('EXPLAIN QUERY PLAN ' + sql), params).all()
+        details = ' | '.join(row[-1] for row in plan)
+        if index_name not in details:
+            failures.append((sql, index_name, details))
+    return failures
+
+
+def main(argv):
+    from app import app
+    with app.app_context():
+        if '--check' in argv:
+            failures = check_query_plans()
+            for sql, index_name, details in failures:
+                print(f'НЕТ ИНДЕКСА {index_name}: {sql}\n    {details}')
+            print('Планы запросов в порядке' if not failures else f'Проблемных запросов: {len(failures)}')
+            upgrade_error = check_upgrade_from_baseline()
+            print('Обновление с исходной схемы проходит' if upgrade_error is None
+                  else f'ОБНОВЛЕНИЕ С ИСХОДНОЙ СХЕМЫ НЕ ПРОХОДИТ: {upgrade_error}')
+            return 1 if failures or upgrade_error else 0
+        if '--status' in argv:
+            applied = get_applied_versions()
+            for version, name, _ in MIGRATIONS:
+                print(f'{version:4}  {"+" if version in applied else "-"}  {name}')
+            return 0
+        done = upgrade()
+        print(f'Применены миграции: {", ".join(map(str, done))}' if done else 'База данных актуальна')
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
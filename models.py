@@ -1,5 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
+from security import hash_password
 from datetime import datetime
 
 db = SQLAlchemy()
@@ -13,18 +14,29 @@ class User(db.Model):
     full_name = db.Column(db.String(100), default='')
     class_name = db.Column(db.String(20), default='')
     is_approved = db.Column(db.Boolean, default=False)
+    notif_cursor = db.Column(db.Integer, default=0)
+    allergen_mask = db.Column(db.BigInteger, default=0)   # см. allergen_bit в db_functions
+    allergy_links = db.relationship('UserAllergy', lazy=True)
+    subscriptions = db.relationship('Subscription', lazy=True)
 
     def set_password(self, pwd):
-        self.password = generate_password_hash(pwd)
+        self.password = hash_password(pwd)
 
     def check_password(self, pwd):
         return check_password_hash(self.password, pwd)
 
+    def allergy_ids(self):
+        return [ua.allergy_id for ua in self.allergy_links]
+
+    def subscription(self, meal_type):
+        return next((s for s in self.subscriptions if s.meal_type == meal_type), None)
+
 class Allergy(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), nullable=False)
 
 class UserAllergy(db.Model):
+    __table_args__ = (db.Index('ix_user_allergy_user', 'user_id', 'allergy_id'),)
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     allergy_id = db.Column(db.Integer, db.ForeignKey('allergy.id'))
@@ -41,22 +53,28 @@ class MenuItem(db.Model):
     category_id = db.Column(db.Integer, db.ForeignKey('category.id'))
     day_of_week = db.Column(db.Integer, nullable=False)
     is_available = db.Column(db.Boolean, default=True)
+    allergen_mask = db.Column(db.BigInteger, default=0)
     category = db.relationship('Category', backref='items')
 
 class MenuItemAllergy(db.Model):
+    __table_args__ = (db.Index('ix_menu_item_allergy_item', 'menu_item_id'),)
     id = db.Column(db.Integer, primary_key=True)
     menu_item_id = db.Column(db.Integer, db.ForeignKey('menu_item.id'))
     allergy_id = db.Column(db.Integer, db.ForeignKey('allergy.id'))
     allergy = db.relationship('Allergy')
 
+# quantity — остаток на складе (сумма движений в StockMovement),
+# reserved — сколько уже обещано оформленным, но ещё не приготовленным заказам.
 class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     quantity = db.Column(db.Float, default=0)
+    reserved = db.Column(db.Float, default=0)
     unit = db.Column(db.String(20), default='шт')
     price = db.Column(db.Float, default=0)
 
 class MenuItemIngredient(db.Model):
+    __table_args__ = (db.Index('ix_menu_item_ingredient_item', 'menu_item_id'),)
     id = db.Column(db.Integer, primary_key=True)
     menu_item_id = db.Column(db.Integer, db.ForeignKey('menu_item.id'))
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'))
@@ -70,6 +88,10 @@ class Subscription(db.Model):
     meals_left = db.Column(db.Integer, default=0)
 
 class Order(db.Model):
+    __table_args__ = (
+        db.Index('ix_order_date_meal_type', 'date', 'meal_type'),
+        db.Index('ix_order_user_created', 'user_id', 'created_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     date = db.Column(db.Date, nullable=False)
@@ -82,6 +104,10 @@ class Order(db.Model):
     items = db.relationship('OrderItem', backref='order', lazy=True)
 
 class OrderItem(db.Model):
+    __table_args__ = (
+        db.Index('ix_order_item_order', 'order_id'),
+        db.Index('ix_order_item_menu_item', 'menu_item_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'))
     menu_item_id = db.Column(db.Integer, db.ForeignKey('menu_item.id'))
@@ -107,17 +133,30 @@ class Review(db.Model):
     menu_item = db.relationship('MenuItem')
 
 class PurchaseRequest(db.Model):
+    __table_args__ = (
+        db.Index('ix_purchase_request_status', 'status'),
+        db.Index('ix_purchase_request_created_by', 'created_by', 'date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'))
     quantity = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(20), default='pending')
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'))
     date = db.Column(db.DateTime, default=datetime.now)
+    approved_at = db.Column(db.DateTime)   # расход относится к дню одобрения
     product = db.relationship('Product')
 
+# Уведомление адресовано либо одному пользователю (user_id), либо всей роли (role).
+# Прочитанность рассылок по роли хранится в User.notif_cursor — id последней прочитанной.
 class Notification(db.Model):
+    __table_args__ = (
+        db.Index('ix_notification_user_read', 'user_id', 'is_read'),
+        db.Index('ix_notification_user', 'user_id', 'id'),
+        db.Index('ix_notification_role', 'role', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    role = db.Column(db.String(20))
     text = db.Column(db.Text, nullable=False)
     is_read = db.Column(db.Boolean, default=False)
     date = db.Column(db.DateTime, default=datetime.now)
@@ -125,3 +164,86 @@ class Favorite(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     menu_item_id = db.Column(db.Integer, db.ForeignKey('menu_item.id'))
+
+
+# Дневные итоги для панели администратора. Обновляются инкрементально
+# вместе с платежами, заказами и закупками (см. record_daily_stats).
+class DailyStats(db.Model):
+    date = db.Column(db.Date, primary_key=True)
+    deposits = db.Column(db.Float, default=0)
+    subscriptions = db.Column(db.Float, default=0)
+    purchases = db.Column(db.Float, default=0)
+    expenses = db.Column(db.Float, default=0)
+    breakfast_orders = db.Column(db.Integer, default=0)
+    lunch_orders = db.Column(db.Integer, default=0)
+    received_orders = db.Column(db.Integer, default=0)
+
+
+# Сколько порций каждого блюда заказано за день — история для прогноза
+# расхода продуктов (forecast.py). Обновляется вместе с заказами.
+class DishDailyOrders(db.Model):
+    date = db.Column(db.Date, primary_key=True)
+    menu_item_id = db.Column(db.Integer, primary_key=True)
+    orders = db.Column(db.Integer, default=0)
+
+
+# Сводка оценок блюда: число отзывов, сумма оценок и сколько раз
+# поставили 1…5. Обновляется в add_review вместе с самим отзывом.
+class DishRating(db.Model):
+    menu_item_id = db.Column(db.Integer, primary_key=True)
+    reviews = db.Column(db.Integer, default=0)
+    rating_sum = db.Column(db.Integer, default=0)
+    stars_1 = db.Column(db.Integer, default=0)
+    stars_2 = db.Column(db.Integer, default=0)
+    stars_3 = db.Column(db.Integer, default=0)
+    stars_4 = db.Column(db.Integer, default=0)
+    stars_5 = db.Column(db.Integer, default=0)
+
+
+# То же по неделям (week — понедельник) для «лучшее за неделю»
+class DishRatingWeek(db.Model):
+    week = db.Column(db.Date, primary_key=True)
+    menu_item_id = db.Column(db.Integer, primary_key=True)
+    reviews = db.Column(db.Integer, default=0)
+    rating_sum = db.Column(db.Integer, default=0)
+
+
+# Выданные заказы по дням, классам и приёмам пищи (см. analytics.py).
+# Пустой class_name — ученики без класса.
+class AttendanceRollup(db.Model):
+    date = db.Column(db.Date, primary_key=True)
+    class_name = db.Column(db.String(20), primary_key=True, default='')
+    meal_type = db.Column(db.String(20), primary_key=True)
+    received = db.Column(db.Integer, default=0)
+
+
+# Журнал движения продуктов: только добавление строк. kind — receipt
+# (поступление), consumption (списание на готовку), adjustment (ручная правка).
+class StockMovement(db.Model):
+    __table_args__ = (db.Index('ix_stock_movement_product', 'product_id', 'id'),)
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+    delta = db.Column(db.Float, nullable=False)
+    note = db.Column(db.String(200))
+    date = db.Column(db.DateTime, default=datetime.now)
+    product = db.relationship('Product')
+
+
+# Остаток продукта на момент движения movement_id (раз в день), чтобы
+# восстанавливать историю без суммирования журнала с самого начала.
+class StockSnapshot(db.Model):
+    __table_args__ = (db.Index('ix_stock_snapshot_product', 'product_id', 'movement_id'),
+                      db.Index('ux_stock_snapshot_day', 'date', 'product_id', unique=True))
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    movement_id = db.Column(db.Integer, nullable=False, default=0)
+    quantity = db.Column(db.Float, nullable=False)
+    date = db.Column(db.Date, nullable=False)
+
+
+# Применённые миграции схемы (см. migrations.py)
+class SchemaMigration(db.Model):
+    version = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.now)
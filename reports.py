@@ -0,0 +1,177 @@
+import tempfile
+from datetime import datetime
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+
+from models import db, User, Order, OrderItem, Product, MenuItem, MenuItemIngredient, PurchaseRequest
+from db_functions import get_payments_stats, get_orders_stats, get_expenses
+
+# Отчёт пишется потоково: листы в режиме write-only, заказы читаются пачками,
+# файл собирается во временном файле (в памяти — только до REPORT_SPOOL_SIZE).
+REPORT_CHUNK_SIZE = 500
+REPORT_SPOOL_SIZE = 8 * 1024 * 1024
+
+header_font = Font(name='Calibri', size=11, bold=True, color='FFFFFF')
+header_fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
+thin_border = Side(style='thin')
+border = Border(left=thin_border, right=thin_border, top=thin_border, bottom=thin_border)
+center_align = Alignment(horizontal='center', vertical='center')
+title_font = Font(name='Calibri', size=14, bold=True)
+bold_font = Font(name='Calibri', bold=True)
+
+ROLE_NAMES = {'student': 'Ученик', 'cook': 'Повар', 'admin': 'Администратор'}
+
+
+def _styled(ws, value, font):
+    cell = WriteOnlyCell(ws, value=value)
+    cell.font = font
+    return cell
+
+
+def _header(ws, headers):
+    row = []
+    for h in headers:
+        cell = WriteOnlyCell(ws, value=h)
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.border = border
+        cell.alignment = center_align
+        row.append(cell)
+    return row
+
+
+def _new_sheet(wb, title, widths):
+    ws = wb.create_sheet(title)
+    for col, width in widths.items():
+        ws.column_dimensions[col].width = width
+    return ws
+
+
+def _order_status(o):
+    return 'Получен' if o.is_received else ('Готов' if o.is_prepared else 'Готовится')
+
+
+def _iter_orders(meal_type=None):
+    query = Order.query.options(
+        db.selectinload(Order.user),
+        db.selectinload(Order.items).selectinload(OrderItem.menu_item),
+    ).order_by(Order.created_at.desc(), Order.id.desc())
+    if meal_type:
+        query = query.filter(Order.meal_type == meal_type)
+    return query.yield_per(REPORT_CHUNK_SIZE)
+
+
+def _write_meal_sheet(wb, title, total_label, total, meal_type):
+    ws = _new_sheet(wb, title, {'C': 25, 'E': 40})
+    ws.append([_styled(ws, title, title_font)])
+    ws.append([total_label, total])
+    ws.append([])
+    ws.append(_header(ws, ['№', 'Дата', 'Ученик', 'Класс', 'Блюда', 'Оплата', 'Статус']))
+    for o in _iter_orders(meal_type):
+        items_str = ", ".join([i.menu_item.name for i in o.items])
+        pay_type = 'Абонемент' if o.is_subscription else 'Разовая'
+        ws.append([o.id, o.date.strftime('%d.%m.%Y'), o.user.full_name or o.user.username,
+                   o.user.class_name, items_str, pay_type, _order_status(o)])
+
+
+def write_report(output):
+    stats = get_payments_stats()
+    order_stats = get_orders_stats()
+    expenses = get_expenses()
+    b_total = order_stats['breakfast']
+    l_total = order_stats['lunch']
+
+    wb = Workbook(write_only=True)
+
+    ws1 = _new_sheet(wb, "Сводка", {'A': 30, 'B': 20})
+    ws1.append([_styled(ws1, "Отчёт по школьной столовой", title_font)])
+    ws1.append(["Дата формирования", datetime.now().strftime('%d.%m.%Y %H:%M')])
+    ws1.append([])
+    ws1.append([_styled(ws1, "Финансовые показатели", bold_font)])
+    ws1.append(_header(ws1, ['Показатель', 'Сумма (руб.)']))
+    ws1.append(['Доход от абонементов', stats['subscriptions']])
+    ws1.append(['Доход от покупок', stats['purchases']])
+    ws1.append(['Общий доход', stats['total_income']])
+    ws1.append(['Расходы на закупки', expenses])
+    ws1.append(['Чистая прибыль', stats['total_income'] - expenses])
+    ws1.append([])
+    ws1.append([_styled(ws1, "Статистика заказов", bold_font)])
+    ws1.append(_header(ws1, ['Показатель', 'Значение']))
+    ws1.append(['Всего заказов', order_stats['total']])
+    ws1.append(['Заказов за сегодня', order_stats['today']])
+    ws1.append(['Получено', order_stats['received']])
+    ws1.append(['Всего завтраков', b_total])
+    ws1.append(['Всего обедов', l_total])
+
+    _write_meal_sheet(wb, "Учёт завтраков", "Всего завтраков:", b_total, 'breakfast')
+    _write_meal_sheet(wb, "Учёт обедов", "Всего обедов:", l_total, 'lunch')
+
+    ws4 = _new_sheet(wb, "Все заказы", {'C': 25, 'F': 40})
+    ws4.append([_styled(ws4, "Все заказы", title_font)])
+    ws4.append([])
+    ws4.append(_header(ws4, ['№', 'Дата', 'Ученик', 'Класс', 'Приём пищи', 'Блюда', 'Оплата', 'Статус']))
+    for o in _iter_orders():
+        meal = 'Завтрак' if o.meal_type == 'breakfast' else 'Обед'
+        items_str = ", ".join([i.menu_item.name for i in o.items])
+        pay_type = 'Абонемент' if o.is_subscription else 'Разовая'
+        ws4.append([o.id, o.date.strftime('%d.%m.%Y'), o.user.full_name or o.user.username,
+                    o.user.class_name, meal, items_str, pay_type, _order_status(o)])
+
+    ws5 = _new_sheet(wb, "Заявки на закупку", {'B': 25})
+    ws5.append([_styled(ws5, "Заявки на закупку", title_font)])
+    ws5.append([])
+    ws5.append(_header(ws5, ['Дата', 'Продукт', 'Количество', 'Ед.', 'Сумма (руб.)']))
+    requests = PurchaseRequest.query.options(db.selectinload(PurchaseRequest.product)) \
+        .order_by(PurchaseRequest.date.desc()).yield_per(REPORT_CHUNK_SIZE)
+    for r in requests:
+        summ = round(r.quantity * r.product.price, 2)
+        ws5.append([r.date.strftime('%d.%m.%Y'), r.product.name, r.quantity, r.product.unit, summ])
+
+    ws6 = _new_sheet(wb, "Пользователи", {'C': 30})
+    ws6.append([_styled(ws6, "Пользователи", title_font)])
+    ws6.append([])
+    ws6.append(_header(ws6, ['ID', 'Логин', 'ФИО', 'Класс', 'Роль']))
+    users = db.session.query(User.id, User.username, User.full_name, User.class_name, User.role) \
+        .order_by(User.id).yield_per(REPORT_CHUNK_SIZE)
+    for u in users:
+        ws6.append([u.id, u.username, u.full_name, u.class_name, ROLE_NAMES.get(u.role, u.role)])
+
+    ws7 = _new_sheet(wb, "Продукты", {'B': 25})
+    ws7.append([_styled(ws7, "Продукты", title_font)])
+    ws7.append([])
+    ws7.append(_header(ws7, ['ID продукта', 'Название', 'Остаток', 'Ед. измерения']))
+    for p in db.session.query(Product.id, Product.name, Product.quantity, Product.unit).order_by(Product.id):
+        ws7.append([p.id, p.name, p.quantity, p.unit])
+
+    ws8 = _new_sheet(wb, "Приготовленные блюда", {'D': 30})
+    ws8.append([_styled(ws8, "Приготовленные блюда", title_font)])
+    ws8.append([])
+    ws8.append(_header(ws8, ['ID позиции', 'ID заказа', 'ID блюда', 'Блюдо']))
+    order_items = db.session.query(OrderItem.id, OrderItem.order_id, OrderItem.menu_item_id, MenuItem.name) \
+        .join(MenuItem, MenuItem.id == OrderItem.menu_item_id) \
+        .order_by(OrderItem.id).yield_per(REPORT_CHUNK_SIZE)
+    for row in order_items:
+        ws8.append(list(row))
+
+    ws9 = _new_sheet(wb, "Связь блюд и продуктов", {'B': 25, 'D': 25})
+    ws9.append([_styled(ws9, "Связь блюд и продуктов", title_font)])
+    ws9.append([])
+    ws9.append(_header(ws9, ['ID блюда', 'Блюдо', 'ID продукта', 'Продукт']))
+    links = db.session.query(MenuItem.id, MenuItem.name, Product.id, Product.name) \
+        .join(MenuItemIngredient, MenuItemIngredient.menu_item_id == MenuItem.id) \
+        .join(Product, Product.id == MenuItemIngredient.product_id) \
+        .order_by(MenuItem.name, MenuItem.id, MenuItemIngredient.id)
+    for row in links:
+        ws9.append(list(row))
+
+    wb.save(output)
+    return output
+
+
+def build_report():
+    output = tempfile.SpooledTemporaryFile(max_size=REPORT_SPOOL_SIZE, suffix='.xlsx')
+    write_report(output)
+    output.seek(0)
+    return output
@@ -0,0 +1,168 @@
+import argparse
+import csv
+import io
+import multiprocessing
+import os
+import secrets
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from openpyxl import load_workbook
+
+from models import db, User
+from security import hash_password
+from db_functions import get_latest_broadcast_id, broadcast_notification
+
+# Импорт списка учеников из CSV или XLSX. Пароли хэшируются параллельно
+# на всех ядрах (хэш намеренно медленный), все аккаунты вставляются
+# одной транзакцией. Столбцы ищутся по заголовку первой строки.
+COLUMNS = {
+    'username': ('username', 'login', 'логин'),
+    'password': ('password', 'пароль'),
+    'full_name': ('full_name', 'name', 'фио', 'имя'),
+    'class_name': ('class_name', 'class', 'класс'),
+    'role': ('role', 'роль'),
+}
+ROLES = ('student', 'cook', 'admin')
+ROSTER_PARALLEL_MIN = 16     # меньше — хэшируем в текущем процессе
+ROSTER_BATCH_SIZE = 1000
+
+ImportResult = namedtuple('ImportResult', 'created skipped generated seconds')
+
+# Загрузка через сайт хэширует в отдельном пуле потоков: scrypt и pbkdf2
+# отпускают GIL, а процессы веб-сервер не порождает вовсе (spawn заново
+# импортировал бы в каждом из них app.py, fork унаследовал бы блокировки
+# других потоков). Пул процессов — только для консольного импорта: он
+# запускается через spawn, и рабочие процессы импортируют roster.py, но
+# не app.py (приложение создаётся внутри main()).
+_spawn = multiprocessing.get_context('spawn')
+_threads = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix='roster-hash')
+
+
+def _normalize_header(header):
+    names = {}
+    for i, title in enumerate(header):
+        title = str(title or '').strip().lower()
+        for column, aliases in COLUMNS.items():
+            if title in aliases and column not in names:
+                names[column] = i
+    if 'username' not in names:
+        raise ValueError('В файле нет столбца с логином (username / логин)')
+    return names
+
+
+def _rows_to_dicts(rows):
+    rows = iter(rows)
+    names = _normalize_header(next(rows, ()))
+    for row in rows:
+        record = {column: str(row[i]).strip() if i < len(row) and row[i] is not None else ''
+                  for column, i in names.items()}
+        if record['username']:
+            yield record
+
+
+def read_roster(stream, filename):
+    if filename.lower().endswith('.xlsx'):
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+        try:
+            return list(_rows_to_dicts(workbook.active.iter_rows(values_only=True)))
+        finally:
+            workbook.close()
+    data = stream.read()
+    text = data.decode('utf-8-sig') if isinstance(data, bytes) else data
+    dialect = csv.Sniffer().sniff(text[:4096], delimiters=',;\t')
+    return list(_rows_to_dicts(csv.reader(io.StringIO(text), dialect)))
+
+
+# processes=True — пул процессов (консольный импорт), иначе общий пул потоков
+def hash_passwords(passwords, workers=None, processes=False):
+    if len(passwords) < ROSTER_PARALLEL_MIN or workers == 1:
+        return [hash_password(p) for p in passwords]
+    if not processes:
+        return list(_threads.map(hash_password, passwords))
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(passwords) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_spawn) as pool:
+        return list(pool.map(hash_password, passwords, chunksize=chunksize))
+
+
+# Возвращает ImportResult; generated — пары (логин, пароль) для строк без
+# пароля, их нужно передать ученикам.
+def import_roster(records, approve=False, workers=None, processes=False):
+    started = time.perf_counter()
+    existing = set()
+    usernames = [r['username'] for r in records]
+    for i in range(0, len(usernames), ROSTER_BATCH_SIZE):
+        chunk = usernames[i:i + ROSTER_BATCH_SIZE]
+        existing.update(name for (name,) in db.session.query(User.username).filter(User.username.in_(chunk)))
+
+    new, generated, seen = [], [], set()
+    for record in records:
+        if record['username'] in existing or record['username'] in seen:
+            continue
+        seen.add(record['username'])
+        if not record.get('password'):
+            record['password'] = secrets.token_urlsafe(6)
+            generated.append((record['username'], record['password']))
+        new.append(record)
+
+    hashes = hash_passwords([r['password'] for r in new], workers, processes)
+    cursors = {}
+    rows = []
+    for record, password_hash in zip(new, hashes):
+        role = record.get('role') if record.get('role') in ROLES else 'student'
+        if role not in cursors:
+            cursors[role] = get_latest_broadcast_id(role)
+        rows.append({
+            'username': record['username'], 'password': password_hash, 'role': role,
+            'full_name': record.get('full_name', ''), 'class_name': record.get('class_name', ''),
+            'balance': 0, 'is_approved': approve or role != 'student', 'notif_cursor': cursors[role],
+        })
+    for i in range(0, len(rows), ROSTER_BATCH_SIZE):
+        db.session.execute(db.insert(User), rows[i:i + ROSTER_BATCH_SIZE])
+    if rows and not approve:
+        broadcast_notification('admin', f'Импортирован список учеников: {len(rows)} аккаунтов ожидают подтверждения',
+                               commit=False)
+    db.session.commit()
+    return ImportResult(len(rows), len(records) - len(rows), generated, time.perf_counter() - started)
+
+
+def format_result(result):
+    rate = result.created / result.seconds if result.seconds else 0
+    return (f'Создано аккаунтов: {result.created}, пропущено (уже есть): {result.skipped}, '
+            f'{result.seconds:.1f} с, {rate:.0f} акк/с')
+
+
+def credentials_csv(generated):
+    output = io.StringIO()
+    writer = csv.writer(output, delimiter=';')
+    writer.writerow(['логин', 'пароль'])
+    writer.writerows(generated)
+    return output.getvalue().encode('utf-8-sig')
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Импорт списка учеников из CSV/XLSX')
+    parser.add_argument('file')
+    parser.add_argument('--approve', action='store_true', help='сразу подтвердить аккаунты')
+    parser.add_argument('--workers', type=int, help='процессов для хэширования паролей')
+    parser.add_argument('--passwords', help='куда сохранить сгенерированные пароли (CSV)')
+    args = parser.parse_args(argv)
+
+    from app import app
+    with app.app_context(), open(args.file, 'rb') as f:
+        result = import_roster(read_roster(f, args.file), approve=args.approve, workers=args.workers,
+                               processes=True)
+    print(format_result(result))
+    if result.generated:
+        path = args.passwords or os.path.splitext(args.file)[0] + '_passwords.csv'
+        with open(path, 'wb') as f:
+            f.write(credentials_csv(result.generated))
+        print(f'Сгенерированные пароли: {path}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
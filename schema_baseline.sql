@@ -0,0 +1,144 @@
+CREATE TABLE user (
+	id INTEGER NOT NULL, 
+	username VARCHAR(80) NOT NULL, 
+	password VARCHAR(200) NOT NULL, 
+	role VARCHAR(20) NOT NULL, 
+	balance FLOAT, 
+	full_name VARCHAR(100), 
+	class_name VARCHAR(20), 
+	is_approved BOOLEAN, 
+	PRIMARY KEY (id), 
+	UNIQUE (username)
+);
+CREATE TABLE allergy (
+	id INTEGER NOT NULL, 
+	name VARCHAR(50) NOT NULL, 
+	PRIMARY KEY (id)
+);
+CREATE TABLE category (
+	id INTEGER NOT NULL, 
+	name VARCHAR(50) NOT NULL, 
+	meal_type VARCHAR(20) NOT NULL, 
+	PRIMARY KEY (id)
+);
+CREATE TABLE product (
+	id INTEGER NOT NULL, 
+	name VARCHAR(100) NOT NULL, 
+	quantity FLOAT, 
+	unit VARCHAR(20), 
+	price FLOAT, 
+	PRIMARY KEY (id)
+);
+CREATE TABLE user_allergy (
+	id INTEGER NOT NULL, 
+	user_id INTEGER, 
+	allergy_id INTEGER, 
+	PRIMARY KEY (id), 
+	FOREIGN KEY(user_id) REFERENCES user (id), 
+	FOREIGN KEY(allergy_id) REFERENCES allergy (id)
+);
+CREATE TABLE menu_item (
+	id INTEGER NOT NULL, 
+	name VARCHAR(100) NOT NULL, 
+	price FLOAT NOT NULL, 
+	category_id INTEGER, 
+	day_of_week INTEGER NOT NULL, 
+	is_available BOOLEAN, 
+	PRIMARY KEY (id), 
+	FOREIGN KEY(category_id) REFERENCES category (id)
+);
+CREATE TABLE subscription (
+	id INTEGER NOT NULL, 
+	user_id INTEGER, 
+	meal_type VARCHAR(20) NOT NULL, 
+	meals_left INTEGER, 
+	PRIMARY KEY (id), 
+	FOREIGN KEY(user_id) REFERENCES user (id)
+);
+CREATE TABLE "order" (
+	id INTEGER NOT NULL, 
+	user_id INTEGER, 
+	date DATE NOT NULL, 
+	meal_type VARCHAR(20) NOT NULL, 
+	is_subscription BOOLEAN, 
+	is_prepared BOOLEAN, 
+	is_received BOOLEAN, 
+	created_at DATETIME, 
+	PRIMARY KEY (id), 
+	FOREIGN KEY(user_id) REFERENCES user (id)
+);
+CREATE TABLE payment (
+	id INTEGER NOT NULL, 
+	user_id INTEGER, 
+	amount FLOAT NOT NULL, 
+	payment_type VARCHAR(30) NOT NULL, 
+	date DATETIME, 
+	PRIMARY KEY (id), 
+	FOREIGN KEY(user_id) REFERENCES user (id)
+);
+CREATE TABLE purchase_request (
+	id INTEGER NOT NULL, 
+	product_id INTEGER, 
+	quantity FLOAT NOT NULL, 
+	status VARCHAR(20), 
+	created_by INTEGER, 
+	date DATETIME, 
+	PRIMARY KEY (id), 
+	FOREIGN KEY(product_id) REFERENCES product (id), 
+	FOREIGN KEY(created_by) REFERENCES user (id)
+);
+CREATE TABLE notification (
+	id INTEGER NOT NULL, 
+	user_id INTEGER, 
+	text TEXT NOT NULL, 
+	is_read BOOLEAN, 
+	date DATETIME, 
+	PRIMARY KEY (id), 
+	FOREIGN KEY(user_id) REFERENCES user (id)
+);
+CREATE TABLE menu_item_allergy (
+	id INTEGER NOT NULL, 
+	menu_item_id INTEGER, 
+	allergy_id INTEGER, 
+	PRIMARY KEY (id), 
+	FOREIGN KEY(menu_item_id) REFERENCES menu_item (id), 
+	FOREIGN KEY(allergy_id) REFERENCES allergy (id)
+);
+CREATE TABLE menu_item_ingredient (
+	id INTEGER NOT NULL, 
+	menu_item_id INTEGER, 
+	product_id INTEGER, 
+	quantity FLOAT NOT NULL, 
+	PRIMARY KEY (id), 
+	FOREIGN KEY(menu_item_id) REFERENCES menu_item (id), 
+	FOREIGN KEY(product_id) REFERENCES product (id)
+);
+CREATE TABLE order_item (
+	id INTEGER NOT NULL, 
+	order_id INTEGER, 
+	menu_item_id INTEGER, 
+	price FLOAT NOT NULL, 
+	is_cooked BOOLEAN, 
+	PRIMARY KEY (id), 
+	FOREIGN KEY(order_id) REFERENCES "order" (id), 
+	FOREIGN KEY(menu_item_id) REFERENCES menu_item (id)
+);
+CREATE TABLE review (
+	id INTEGER NOT NULL, 
+	user_id INTEGER, 
+	menu_item_id INTEGER, 
+	text TEXT, 
+	rating INTEGER, 
+	date DATETIME, 
+	PRIMARY KEY (id), 
+	FOREIGN KEY(user_id) REFERENCES user (id), 
+	FOREIGN KEY(menu_item_id) REFERENCES menu_item (id)
+);
+CREATE TABLE favorite (
+	id INTEGER NOT NULL, 
+	user_id INTEGER, 
+	menu_item_id INTEGER, 
+	PRIMARY KEY (id), 
+	FOREIGN KEY(user_id) REFERENCES user (id), 
+	FOREIGN KEY(menu_item_id) REFERENCES menu_item (id)
+);
@@ -0,0 +1,163 @@
+import re
+from collections import namedtuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from models import db, MenuItem, Review
+
+# Полнотекстовый поиск по названиям блюд и текстам отзывов (SQLite FTS5).
+# Таблицу search_index заполняют триггеры на menu_item и review, поэтому она
+# согласована при любой вставке и удалении, в том числе пакетной.
+# rowid строки индекса: -id для блюда, id для отзыва, так что вид записи —
+# это диапазон rowid, который FTS5 фильтрует сам. У отзыва в title — название
+# блюда. «ё» приводится к «е»: токенизатор unicode61 считает их разными буквами.
+# Найденные блюда идут первыми (их немного), отзывы ранжируются среди
+# SEARCH_RANK_WINDOW самых свежих совпадений — время ответа не растёт с историей.
+# На других СУБД или без FTS5 поиск идёт через LIKE.
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_WORDS = 8
+SEARCH_RANK_WINDOW = 1000
+TITLE_WEIGHT = 10.0     # совпадение в названии блюда важнее, чем в тексте отзыва
+KINDS = ('dish', 'review')
+
+SearchHit = namedtuple('SearchHit', 'kind item')
+SearchResults = namedtuple('SearchResults', 'hits page has_next')
+
+
+def _folded(expr):
+    return f"replace(replace({expr}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+_DISH_ROW = f"-new.id, {_folded('new.name')}, ''"
+_DISH_NAME = "coalesce((SELECT name FROM menu_item WHERE id = new.menu_item_id), '')"
+_REVIEW_TEXT = "coalesce(new.text, '')"
+_REVIEW_ROW = f"new.id, {_folded(_DISH_NAME)}, {_folded(_REVIEW_TEXT)}"
+
+SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+    "title, body, tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    f"""CREATE TRIGGER IF NOT EXISTS search_menu_item_insert AFTER INSERT ON menu_item BEGIN
+        INSERT INTO search_index(rowid, title, body) VALUES ({_DISH_ROW});
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_menu_item_delete AFTER DELETE ON menu_item BEGIN
+        DELETE FROM search_index WHERE rowid = -old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS search_menu_item_rename AFTER UPDATE OF name ON menu_item BEGIN
+        UPDATE search_index SET title = {_folded('new.name')}
+        WHERE rowid = -new.id OR rowid IN (SELECT id FROM review WHERE menu_item_id = new.id);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS search_review_insert AFTER INSERT ON review BEGIN
+        INSERT INTO search_index(rowid, title, body) VALUES ({_REVIEW_ROW});
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_review_delete AFTER DELETE ON review BEGIN
+        DELETE FROM search_index WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS search_review_update AFTER UPDATE OF text, menu_item_id ON review BEGIN
+        DELETE FROM search_index WHERE rowid = old.id;
+        INSERT INTO search_index(rowid, title, body) VALUES ({_REVIEW_ROW});
+    END""",
+]
+
+
+# Создаёт индекс и триггеры (если их ещё нет) и заполняет индекс заново.
+# Возвращает False, если полнотекстовый поиск недоступен.
+def install_search_index():
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    try:
+        for statement in SCHEMA:
+            db.session.execute(text(statement))
+    except OperationalError:
+        db.session.rollback()
+        return False
+    db.session.execute(text('DELETE FROM search_index'))
+    db.session.execute(text(f"INSERT INTO search_index(rowid, title, body) "
+                            f"SELECT {_DISH_ROW.replace('new.', '')} FROM menu_item"))
+    db.session.execute(text(f"INSERT INTO search_index(rowid, title, body) "
+                            f"SELECT {_REVIEW_ROW.replace('new.', 'review.')} FROM review"))
+    db.session.commit()
+    return True
+
+
+def _fts_enabled():
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    return db.session.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'search_index'")).first() is not None
+
+
+# Слова запроса в синтаксисе FTS5: каждое в кавычках и с поиском по префиксу,
+# все слова обязательны
+def _match_query(query):
+    words = re.findall(r'\w+', (query or '').lower().replace('ё', 'е'))[:SEARCH_MAX_WORDS]
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _fts_ranked(match, condition, params, limit, offset):
+    sql = (f'SELECT rowid FROM search_index WHERE search_index MATCH :match AND {condition} '
+           f'ORDER BY bm25(search_index, {TITLE_WEIGHT}, 1.0) LIMIT :limit OFFSET :offset')
+    rows = db.session.execute(text(sql), dict(params, match=match, limit=limit, offset=offset))
+    return [rowid for (rowid,) in rows]
+
+
+def _fts_dishes(match, limit):
+    return [-rowid for rowid in _fts_ranked(match, 'rowid < 0', {}, limit, 0)]
+
+
+def _fts_reviews(match, limit, offset):
+    cutoff = db.session.execute(text('SELECT rowid FROM search_index WHERE search_index MATCH :match AND rowid > 0 '
+                                     'ORDER BY rowid DESC LIMIT 1 OFFSET :window'),
+                                {'match': match, 'window': SEARCH_RANK_WINDOW - 1}).scalar()
+    return _fts_ranked(match, 'rowid >= :cutoff', {'cutoff': cutoff or 1}, limit, offset)
+
+
+# Шаблон LIKE, в котором %, _ и \ из запроса — обычные символы
+def _like_pattern(query):
+    escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def _like_dishes(query, limit):
+    return [item_id for (item_id,) in db.session.query(MenuItem.id)
+            .filter(MenuItem.name.ilike(_like_pattern(query), escape='\\'))
+            .order_by(MenuItem.name).limit(limit)]
+
+
+def _like_reviews(query, limit, offset):
+    return [review_id for (review_id,) in db.session.query(Review.id)
+            .filter(Review.text.ilike(_like_pattern(query), escape='\\'))
+            .order_by(Review.id.desc()).limit(limit).offset(offset)]
+
+
+def search(query, kind=None, page=1, limit=SEARCH_PAGE_SIZE):
+    kind = kind if kind in KINDS else None
+    page = max(1, page or 1)
+    match = _match_query(query)
+    if not match:
+        return SearchResults([], page, False)
+    fts = _fts_enabled()
+    offset = (page - 1) * limit
+    wanted = limit + 1      # на одну больше — чтобы узнать, есть ли следующая страница
+
+    found, skip = [], offset
+    if kind in (None, 'dish'):
+        dish_ids = _fts_dishes(match, offset + wanted) if fts else _like_dishes(query.strip(), offset + wanted)
+        found = [('dish', item_id) for item_id in dish_ids[offset:]]
+        skip = max(0, offset - len(dish_ids))
+    if kind in (None, 'review') and len(found) < wanted:
+        rest = wanted - len(found)
+        review_ids = _fts_reviews(match, rest, skip) if fts else _like_reviews(query.strip(), rest, skip)
+        found += [('review', review_id) for review_id in review_ids]
+
+    objects = {}
+    dish_ids = [ref_id for found_kind, ref_id in found if found_kind == 'dish']
+    review_ids = [ref_id for found_kind, ref_id in found if found_kind == 'review']
+    if dish_ids:
+        objects.update((('dish', i.id), i) for i in MenuItem.query.options(db.joinedload(MenuItem.category))
+                       .filter(MenuItem.id.in_(dish_ids)))
+    if review_ids:
+        objects.update((('review', r.id), r) for r in Review.query
+                       .options(db.joinedload(Review.user), db.joinedload(Review.menu_item))
+                       .filter(Review.id.in_(review_ids)))
+    hits = [SearchHit(key[0], objects[key]) for key in found[:limit] if key in objects]
+    return SearchResults(hits, page, len(found) > limit)
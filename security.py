@@ -0,0 +1,132 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from functools import lru_cache
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Хэширование паролей. Параметры задаются переменными окружения:
+#   PASSWORD_HASH_METHOD — метод Werkzeug, например scrypt:32768:8:1 (по умолчанию)
+#                          или pbkdf2:sha256:600000
+#   LOGIN_HASH_WORKERS   — сколько проверок пароля идёт одновременно
+#   LOGIN_QUEUE_LIMIT    — сколько входов может ждать (по умолчанию не меньше
+#                          LOGIN_BURST — класс, входящий на урок одновременно)
+#   LOGIN_QUEUE_WAIT     — сколько секунд вход ждёт места в очереди, прежде
+#                          чем получить 503 с Retry-After
+# Проверка выполняется в отдельном пуле потоков (scrypt и pbkdf2 отпускают
+# GIL), поэтому утренний наплыв входов не занимает все потоки сервера и
+# не расходует память scrypt без ограничения.
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+LOGIN_HASH_WORKERS = int(os.environ.get('LOGIN_HASH_WORKERS', os.cpu_count() or 1))
+LOGIN_BURST = 64
+LOGIN_QUEUE_LIMIT = int(os.environ.get('LOGIN_QUEUE_LIMIT', max(LOGIN_BURST, LOGIN_HASH_WORKERS * 8)))
+LOGIN_QUEUE_WAIT = float(os.environ.get('LOGIN_QUEUE_WAIT', 10))
+LOGIN_TIMEOUT = 30
+LOGIN_RETRY_AFTER = 5   # секунд, для заголовка Retry-After
+STATS_WINDOW_SECONDS = 60
+
+_pool = ThreadPoolExecutor(max_workers=LOGIN_HASH_WORKERS, thread_name_prefix='password-hash')
+_slots = threading.BoundedSemaphore(LOGIN_QUEUE_LIMIT)
+_stats_lock = threading.Lock()
+_stats = {'verified': 0, 'rejected': 0, 'rehashed': 0, 'seconds': 0.0, 'in_flight': 0}
+_recent = deque()
+
+
+class LoginBusy(Exception):
+    pass
+
+
+def hash_password(password):
+    return generate_password_hash(password, PASSWORD_HASH_METHOD)
+
+
+# Полная строка параметров, которую Werkzeug записывает перед солью
+@lru_cache(maxsize=None)
+def hash_prefix():
+    return hash_password('').split('$', 1)[0]
+
+
+def needs_rehash(password_hash):
+    return password_hash.split('$', 1)[0] != hash_prefix()
+
+
+# Вызывать под _stats_lock
+def _prune_recent(now):
+    while _recent and now - _recent[0] > STATS_WINDOW_SECONDS:
+        _recent.popleft()
+
+
+def _timed_check(password_hash, password):
+    started = time.perf_counter()
+    ok = check_password_hash(password_hash, password)
+    finished = time.perf_counter()
+    with _stats_lock:
+        _stats['verified'] += 1
+        _stats['seconds'] += finished - started
+        _recent.append(finished)
+        _prune_recent(finished)
+    return ok
+
+
+def _job_done(future):
+    with _stats_lock:
+        _stats['in_flight'] -= 1
+    _slots.release()
+
+
+# Место в очереди освобождается, когда задача действительно завершилась,
+# а не когда запрос перестал её ждать. Не дождались — тоже LoginBusy.
+def _submit(fn, *args):
+    if not _slots.acquire(timeout=LOGIN_QUEUE_WAIT):
+        with _stats_lock:
+            _stats['rejected'] += 1
+        raise LoginBusy()
+    with _stats_lock:
+        _stats['in_flight'] += 1
+    try:
+        future = _pool.submit(fn, *args)
+    except BaseException:
+        _job_done(None)
+        raise
+    future.add_done_callback(_job_done)
+    try:
+        return future.result(timeout=LOGIN_TIMEOUT)
+    except FutureTimeout:
+        with _stats_lock:
+            _stats['rejected'] += 1
+        raise LoginBusy()
+
+
+# Проверка пароля через пул; при переполнении очереди или слишком долгом
+# ожидании — LoginBusy
+def verify_password(password_hash, password):
+    return _submit(_timed_check, password_hash, password)
+
+
+# Пересчитать хэш с текущими параметрами (после успешного входа)
+def rehash_password(password):
+    password_hash = _submit(hash_password, password)
+    with _stats_lock:
+        _stats['rehashed'] += 1
+    return password_hash
+
+
+def get_login_stats():
+    method = hash_prefix()
+    now = time.perf_counter()
+    with _stats_lock:
+        _prune_recent(now)
+        verified = _stats['verified']
+        return {
+            'method': method,
+            'workers': LOGIN_HASH_WORKERS,
+            'queue_limit': LOGIN_QUEUE_LIMIT,
+            'in_flight': _stats['in_flight'],
+            'verified': verified,
+            'rejected': _stats['rejected'],
+            'rehashed': _stats['rehashed'],
+            'avg_ms': round(_stats['seconds'] / verified * 1000, 1) if verified else 0,
+            'per_second': round(len(_recent) / STATS_WINDOW_SECONDS, 2),
+        }